@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""Apply db_optimizations.sql (indexes, views and auxiliary tables) to the configured database."""
+import sys
+import logging
+from pathlib import Path
+from db import Database
+
+SQL_FILE = Path(__file__).with_name('db_optimizations.sql')
+
+def apply_optimizations():
+    db = Database()
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            try:
+                cur.execute(SQL_FILE.read_text(encoding='utf-8'))
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logging.error(f"Erro ao aplicar otimizações: {e}")
+                raise
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    try:
+        apply_optimizations()
+    except Exception:
+        sys.exit(1)
+    logging.info(f"{SQL_FILE.name} aplicado com sucesso")
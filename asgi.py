@@ -0,0 +1,22 @@
+"""
+ASGI entry point: the Flask app with /video and /scan served on the event loop.
+
+    gunicorn -c gunicorn.conf.py               # SERVER_MODE=asgi
+    uvicorn asgi:app --workers 2 --port 5000   # development
+
+See async_streaming.StreamingApp.
+"""
+from a2wsgi import WSGIMiddleware
+from config import Config
+from main import app as flask_app
+from blueprints.video import view_recorder, video_views_counter
+from utils import get_media_files
+from async_streaming import StreamingApp
+
+app = StreamingApp(
+    WSGIMiddleware(flask_app, workers=Config.ASGI_WSGI_THREADS),
+    flask_app,
+    view_recorder=view_recorder,
+    views_counter=video_views_counter,
+    scan_source=get_media_files
+)
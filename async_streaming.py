@@ -0,0 +1,292 @@
+import os
+import json
+import stat
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from contextlib import suppress
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import AsyncIterator, Callable, Dict, Iterator, Optional
+import redis.asyncio as aioredis
+from itsdangerous import BadSignature
+from werkzeug.http import parse_cookie
+from prometheus_flask_exporter import Counter, Gauge
+from config import Config
+from streaming import plan_range_response, aiter_plan_body
+from auth import load_user
+
+asgi_streams_open = Gauge('asgi_streams_open', 'Streaming responses in progress on the asyncio server', ['route'])
+asgi_stream_requests = Counter('asgi_stream_requests', 'Requests answered by the asyncio streaming routes', ['route', 'status'])
+
+MAX_BODY_BYTES = 64 * 1024  # Corpo do POST /scan (só o JSON com a pasta)
+
+_DONE = object()
+
+
+class StreamingApp:
+    """ASGI application serving /video and /scan on the event loop, everything else through Flask.
+
+    An open range response or SSE feed only holds a coroutine while it waits
+    on the client, so one process keeps hundreds of them open instead of one
+    per gunicorn sync worker. File open/seek/read run on a small thread pool
+    (ASGI_IO_THREADS); a scan runs the existing get_media_files generator on
+    its own pool (ASGI_SCAN_THREADS) and forwards each event with
+    backpressure. View deduplication uses redis.asyncio.
+
+    Requests are authenticated with the Flask session cookie. Anything not
+    logged in, and every other route, goes to `fallback` (the Flask app
+    wrapped as ASGI), so login redirects and the rest of the API behave
+    exactly as under gunicorn.
+    """
+
+    def __init__(self, fallback, flask_app, view_recorder=None, views_counter=None,
+                 scan_source: Optional[Callable[..., Iterator[str]]] = None):
+        self.fallback = fallback
+        self.flask_app = flask_app
+        self.view_recorder = view_recorder
+        self.views_counter = views_counter
+        self.scan_source = scan_source
+        self._io = ThreadPoolExecutor(Config.ASGI_IO_THREADS, thread_name_prefix='asgi-io')
+        self._scan_pool = ThreadPoolExecutor(Config.ASGI_SCAN_THREADS, thread_name_prefix='asgi-scan')
+        self._redis = None
+
+    @property
+    def redis(self) -> aioredis.Redis:
+        # Criado no event loop do worker (conecta na primeira operação)
+        if self._redis is None:
+            self._redis = aioredis.Redis(
+                host=Config.REDIS_HOST,
+                port=Config.REDIS_PORT,
+                db=Config.REDIS_DB,
+                socket_timeout=Config.CONNECTION_TIMEOUT
+            )
+        return self._redis
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] == 'http':
+            handler = self._route(scope)
+            if handler is not None:
+                user_id = await self._user_id(scope)
+                if user_id is not None:
+                    return await handler(scope, receive, send, user_id)
+        await self.fallback(scope, receive, send)
+
+    def _route(self, scope):
+        path, method = scope['path'], scope['method']
+        if path.startswith('/video/') and method in ('GET', 'HEAD'):
+            return self._serve_video
+        if path == '/scan' and method in ('GET', 'POST') and self.scan_source is not None:
+            return self._scan
+        return None
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+        self._io.shutdown(wait=False)
+        self._scan_pool.shutdown(wait=False)
+
+    async def _user_id(self, scope) -> Optional[str]:
+        """User id from the Flask session cookie, as flask_login would load it; None if not logged in."""
+        cookie = _headers(scope).get('cookie')
+        if not cookie:
+            return None
+        value = parse_cookie(cookie).get(self.flask_app.config['SESSION_COOKIE_NAME'])
+        serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+        if not value or serializer is None:
+            return None
+        try:
+            data = serializer.loads(value, max_age=int(self.flask_app.permanent_session_lifetime.total_seconds()))
+        except BadSignature:
+            return None
+        user_id = data.get('_user_id')
+        if user_id is None:
+            return None
+        # O user_loader pode consultar o banco: fora do event loop
+        if await asyncio.get_running_loop().run_in_executor(self._io, load_user, user_id) is None:
+            return None
+        return str(user_id)
+
+    async def _serve_video(self, scope, receive, send, user_id: str):
+        loop = asyncio.get_running_loop()
+        # Mesmo caminho que a rota Flask recebe em <path:filename>
+        path = str(Path(scope['path'][len('/video/'):]))
+        try:
+            stats = await loop.run_in_executor(self._io, os.stat, path)
+        except OSError:
+            stats = None
+        if stats is None or not stat.S_ISREG(stats.st_mode):
+            return await self._send_json(send, 'video', 404, {'error': 'Arquivo não encontrado'})
+
+        headers = _headers(scope)
+        plan = plan_range_response(path, lambda name: headers.get(name.lower()), 'video/mp4', stats)
+        # 304/416 não reproduzem nada: não contam como visualização
+        if plan.status in (200, 206) and self.view_recorder is not None and await self.view_recorder.record_async(
+                path, self._playback_id(scope, headers, user_id), self.redis):
+            if self.views_counter is not None:
+                self.views_counter.inc()
+
+        response_headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in plan.headers.items()]
+        if plan.status in (200, 206):
+            response_headers.append((b'content-type', plan.content_type.encode('latin-1')))
+        asgi_stream_requests.labels('video', plan.status).inc()
+        await send({'type': 'http.response.start', 'status': plan.status, 'headers': response_headers})
+        if scope['method'] == 'HEAD' or not plan.ranges:
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        await self._stream(receive, send, 'video', aiter_plan_body(path, plan, self._io))
+
+    @staticmethod
+    def _playback_id(scope, headers: Dict[str, str], user_id: str) -> str:
+        # Mesma identificação de blueprints.video.playback_id
+        session_id = headers.get('x-playback-session') or _query(scope).get('session')
+        if session_id:
+            return session_id
+        client = scope.get('client') or (None,)
+        return f"{user_id}:{client[0]}:{headers.get('user-agent', '')}"
+
+    async def _scan(self, scope, receive, send, user_id: str):
+        loop = asyncio.get_running_loop()
+        if scope['method'] == 'POST':
+            try:
+                data = json.loads(await _read_body(receive) or b'{}')
+            except ValueError:
+                data = None
+            folder = data.get('folder') if isinstance(data, dict) else None
+            if not folder or not await loop.run_in_executor(self._io, os.path.isdir, folder):
+                return await self._send_json(send, 'scan', 400, {'error': 'Pasta inválida ou não encontrada'})
+            # full=true força a releitura de todos os arquivos, ignorando o manifesto
+            incremental = not data.get('full', False)
+        else:
+            query = _query(scope)
+            folder = query.get('folder')
+            if not folder:
+                return await self._send_json(send, 'scan', 400, {'error': 'Parâmetro folder é obrigatório'})
+            incremental = query.get('full', '').lower() not in ('1', 'true')
+
+        asgi_stream_requests.labels('scan', 200).inc()
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+        ]})
+        await self._stream(receive, send, 'scan', self._iter_scan(folder, incremental))
+
+    async def _iter_scan(self, folder: str, incremental: bool) -> AsyncIterator[bytes]:
+        """Run the blocking scan generator on the scan pool and yield its events on the loop."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=Config.ASGI_SCAN_QUEUE)
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            # Espera espaço na fila: um cliente lento segura a varredura em vez de acumular eventos.
+            # Desiste só quando o cliente já saiu (ninguém mais consome a fila).
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while True:
+                try:
+                    future.result(timeout=1)
+                    return True
+                except FutureTimeout:
+                    if stop.is_set():
+                        future.cancel()
+                        return False
+
+        def pump():
+            events = self.scan_source(folder, incremental=incremental)
+            try:
+                for event in events:
+                    if not put(event) or stop.is_set():
+                        break
+            except Exception as e:
+                logging.error(f"Erro na varredura de {folder}: {e}")
+            finally:
+                close = getattr(events, 'close', None)
+                if close:
+                    close()
+                # Com a fila cheia o fim espera o cliente, mas nunca é descartado
+                if not stop.is_set():
+                    put(_DONE)
+
+        loop.run_in_executor(self._scan_pool, pump)
+        try:
+            while True:
+                event = await queue.get()
+                if event is _DONE:
+                    break
+                yield event.encode() if isinstance(event, str) else event
+        finally:
+            # Cliente desconectou: sinaliza a thread e libera espaço caso ela esteja esperando
+            stop.set()
+            while not queue.empty():
+                queue.get_nowait()
+
+    async def _stream(self, receive, send, route: str, body: AsyncIterator[bytes]):
+        """Send body chunks until it ends or the client disconnects, whichever comes first."""
+        async def send_body():
+            async for chunk in body:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        async def wait_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        asgi_streams_open.labels(route).inc()
+        sender = asyncio.ensure_future(send_body())
+        watcher = asyncio.ensure_future(wait_disconnect())
+        try:
+            await asyncio.wait({sender, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (sender, watcher):
+                task.cancel()
+            for task in (sender, watcher):
+                with suppress(asyncio.CancelledError):
+                    try:
+                        await task
+                    except OSError as e:
+                        logging.debug(f"Conexão encerrada durante o streaming de {route}: {e}")
+            await body.aclose()
+            asgi_streams_open.labels(route).dec()
+
+    async def _send_json(self, send, route: str, status: int, payload):
+        body = json.dumps(payload).encode()
+        asgi_stream_requests.labels(route, status).inc()
+        await send({'type': 'http.response.start', 'status': status, 'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ]})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def _headers(scope) -> Dict[str, str]:
+    return {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+
+
+def _query(scope) -> Dict[str, str]:
+    return {k: v[0] for k, v in parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+
+
+async def _read_body(receive) -> bytes:
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return body
+        body += message.get('body', b'')
+        if len(body) > MAX_BODY_BYTES:
+            raise ValueError('Request body too large')
+        if not message.get('more_body'):
+            return body
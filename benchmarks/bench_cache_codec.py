@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the Redis cache value codec.
+
+Encodes and decodes playlist-shaped payloads (the structure cached under
+playlist:<name> by PlaylistService) with the pre-codec path - json.dumps +
+zlib level 6 on write, zlib + json.loads on read - and with each
+CacheCodec configuration available in this environment. Reports encoded
+size and microseconds per encode and per decode. No Redis needed.
+
+msgpack and zstandard are optional; rows for missing packages fall back
+to JSON and zlib, as RedisCache itself does.
+
+Usage: python benchmarks/bench_cache_codec.py [--sizes 1,10,100,1000] [--repeat 2000]
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_codec import CacheCodec, HAS_MSGPACK, HAS_ZSTD
+
+
+def make_playlist(n_files):
+    return {
+        "name": f"playlist_{n_files}",
+        "play_count": 42,
+        "source_folder": "/media/videos",
+        "files": [
+            {
+                "path": f"/media/videos/season_{i // 20:02d}/episode_{i:04d}.mp4",
+                "size": 734003200 + i * 4096,
+                "modified": "2024-05-01T12:00:00",
+                "extension": "mp4",
+            }
+            for i in range(n_files)
+        ],
+    }
+
+
+def legacy_encode(value):
+    return zlib.compress(json.dumps(value).encode(), level=6)
+
+
+def legacy_decode(data):
+    return json.loads(zlib.decompress(data).decode())
+
+
+def timed(fn, arg, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(arg)
+    return result, (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1,10,100,1000', help='Files per playlist, comma separated')
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    codecs = [('legacy json+zlib6', legacy_encode, legacy_decode)]
+    for compression in ('none', 'zlib', 'zstd'):
+        codec = CacheCodec(compression, level=6 if compression == 'zlib' else 3)
+        codecs.append((f"codec {compression}", codec.encode, codec.decode))
+
+    print(f"msgpack: {'yes' if HAS_MSGPACK else 'no (JSON)'}  zstandard: {'yes' if HAS_ZSTD else 'no (zlib)'}")
+    print(f"{'files':>6}  {'codec':<18} {'bytes':>9} {'encode us':>10} {'decode us':>10}")
+    for n_files in (int(s) for s in args.sizes.split(',')):
+        playlist = make_playlist(n_files)
+        repeat = max(10, args.repeat // max(1, n_files // 10))
+        for label, encode, decode in codecs:
+            encoded, encode_us = timed(encode, playlist, repeat)
+            decoded, decode_us = timed(decode, encoded, repeat)
+            assert decoded == playlist
+            print(f"{n_files:>6}  {label:<18} {len(encoded):>9} {encode_us:>10.1f} {decode_us:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark for scan fingerprinting.
+
+Writes synthetic large files and times each fingerprint strategy in
+fingerprint.py against the two hashing paths it replaces: the 4 KB-read
+head+middle SHA-256 of utils.calculate_hash and the full-file mmap SHA-256
+of FileProcessor.calculate_hash. Reports time per file, MB/s of logical file
+size and bytes actually read.
+
+The page cache is not dropped between runs (that needs root); pass
+--cold to evict it with posix_fadvise(DONTNEED) before every hash, which
+approximates a first scan of a network or spinning disk.
+
+Usage: python benchmarks/bench_fingerprint.py [--size-mb 1024] [--files 4] [--cold]
+"""
+
+import os
+import sys
+import mmap
+import time
+import hashlib
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fingerprint import STRATEGIES, fingerprint_file, get_strategy
+
+MB = 1024 * 1024
+
+
+def legacy_chunked_sha256(path):
+    """Pre-fingerprint utils.calculate_hash: 4 KB reads of the first 2 MB and 2 MB from the middle."""
+    sha256 = hashlib.sha256()
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        for _ in range(0, min(size, 2 * MB), 4096):
+            sha256.update(f.read(4096))
+        if size > 4 * MB:
+            f.seek(size // 2)
+            for _ in range(0, 2 * MB, 4096):
+                sha256.update(f.read(4096))
+    return sha256.hexdigest()
+
+
+def full_mmap_sha256(path):
+    """Pre-fingerprint FileProcessor.calculate_hash: SHA-256 of the whole file."""
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return hashlib.sha256(mm).hexdigest()
+
+
+def make_files(directory, count, size_mb):
+    paths = []
+    block = os.urandom(MB)
+    for i in range(count):
+        path = os.path.join(directory, f'synthetic_{i}.bin')
+        with open(path, 'wb') as f:
+            for n in range(size_mb):
+                # Vary every block so no two files share samples
+                f.write(block[:-8] + (i * size_mb + n).to_bytes(8, 'little'))
+        paths.append(path)
+    return paths
+
+
+def evict(path):
+    if hasattr(os, 'posix_fadvise'):
+        with open(path, 'rb') as f:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def run(name, fn, paths, bytes_read, cold):
+    elapsed = 0.0
+    for path in paths:
+        if cold:
+            evict(path)
+        start = time.perf_counter()
+        fn(path)
+        elapsed += time.perf_counter() - start
+    total = sum(os.path.getsize(p) for p in paths)
+    per_file = elapsed / len(paths)
+    print(f"{name:<22} {per_file * 1000:>10.2f} ms/file {total / MB / elapsed:>12.0f} MB/s "
+          f"{bytes_read / MB:>10.1f} MB read/file")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=1024)
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--cold', action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Gerando {args.files} arquivos de {args.size_mb} MB...")
+        paths = make_files(directory, args.files, args.size_mb)
+        size = os.path.getsize(paths[0])
+        print(f"{'algoritmo':<22} {'tempo':>18} {'throughput':>17} {'lido':>18}")
+        run('legacy-sha256-4k', legacy_chunked_sha256, paths, min(size, 2 * MB) + (2 * MB if size > 4 * MB else 0), args.cold)
+        run('full-mmap-sha256', full_mmap_sha256, paths, size, args.cold)
+        for name in STRATEGIES:
+            read = sum(length for _, length in get_strategy(name).sampler(size))
+            run(name, lambda p, n=name: fingerprint_file(p, n), paths, read, args.cold)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Load test for the streaming endpoints: gunicorn sync workers vs the ASGI mode.
+
+Opens --streams concurrent players, each one requesting --chunk byte ranges
+of --video in a loop and reading them at --rate bytes/s (a player keeping
+its buffer full), plus --scans /scan SSE feeds of --scan-folder. Meanwhile
+a probe requests /version every 0.5s: once every sync worker is pinned by
+a stream, the probe times out, which is what saturation looks like to
+every other page of the app.
+
+Run the same command against both modes and compare:
+
+    SERVER_MODE=wsgi gunicorn -c gunicorn.conf.py
+    SERVER_MODE=asgi gunicorn -c gunicorn.conf.py
+
+Standard library only.
+
+Usage: python benchmarks/bench_streaming_concurrency.py http://localhost:5000 --video /videos/a.mp4
+           [--streams 200] [--scans 5 --scan-folder /videos] [--duration 30]
+"""
+
+import time
+import asyncio
+import argparse
+import statistics
+from urllib.parse import urlsplit, urlencode, quote
+
+
+class Stats:
+    def __init__(self):
+        self.ttfb = []
+        self.ok = 0
+        self.errors = 0
+        self.bytes = 0
+        self.events = 0
+
+    def report(self, name, elapsed):
+        ttfb = sorted(self.ttfb)
+        if ttfb:
+            p50 = statistics.median(ttfb) * 1e3
+            p95 = ttfb[min(len(ttfb) - 1, int(len(ttfb) * 0.95))] * 1e3
+            latency = f"ttfb p50 {p50:8.1f} ms  p95 {p95:8.1f} ms  max {ttfb[-1] * 1e3:8.1f} ms"
+        else:
+            latency = "ttfb -"
+        extra = f"  {self.bytes / elapsed / 2**20:7.1f} MiB/s" if self.bytes else ''
+        extra += f"  {self.events} events" if self.events else ''
+        print(f"{name:<8} ok {self.ok:>6}  errors {self.errors:>5}  {latency}{extra}")
+
+
+async def request(host, port, method, target, headers, body=b'', timeout=10.0):
+    """Send one HTTP/1.1 request (Connection: close); returns (reader, writer, status, headers, ttfb)."""
+    start = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    lines = [f"{method} {target} HTTP/1.1", f"Host: {host}:{port}", "Connection: close"]
+    lines += [f"{k}: {v}" for k, v in headers.items()]
+    if body:
+        lines.append(f"Content-Length: {len(body)}")
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+    ttfb = time.perf_counter() - start
+    status_line, *header_lines = head.decode('latin-1').split('\r\n')
+    response_headers = {}
+    for line in header_lines:
+        if ':' in line:
+            k, v = line.split(':', 1)
+            response_headers.setdefault(k.strip().lower(), v.strip())
+    return reader, writer, int(status_line.split()[1]), response_headers, ttfb
+
+
+async def login(host, port, username, password):
+    body = urlencode({'username': username, 'password': password}).encode()
+    reader, writer, status, headers, _ = await request(
+        host, port, 'POST', '/login', {'Content-Type': 'application/x-www-form-urlencoded'}, body)
+    writer.close()
+    cookie = headers.get('set-cookie', '').split(';', 1)[0]
+    if status not in (200, 302) or not cookie:
+        raise SystemExit(f"Login failed (HTTP {status})")
+    return cookie
+
+
+async def player(host, port, cookie, target, chunk, rate, deadline, stats):
+    offset, size = 0, None
+    while time.monotonic() < deadline:
+        end = offset + chunk - 1 if size is None else min(offset + chunk, size) - 1
+        try:
+            reader, writer, status, headers, ttfb = await request(
+                host, port, 'GET', target, {'Cookie': cookie, 'Range': f'bytes={offset}-{end}'})
+            try:
+                if status != 206:
+                    stats.errors += 1
+                    await asyncio.sleep(1)
+                    continue
+                size = int(headers['content-range'].rsplit('/', 1)[1])
+                remaining = int(headers['content-length'])
+                started = time.monotonic()
+                received = 0
+                while remaining > 0:
+                    data = await asyncio.wait_for(reader.read(min(65536, remaining)), 30)
+                    if not data:
+                        raise ConnectionError('short body')
+                    remaining -= len(data)
+                    received += len(data)
+                    # Lê no ritmo de reprodução, como o buffer do player
+                    ahead = received / rate - (time.monotonic() - started)
+                    if ahead > 0:
+                        await asyncio.sleep(ahead)
+                stats.ok += 1
+                stats.ttfb.append(ttfb)
+                stats.bytes += received
+                offset = (end + 1) % size
+            finally:
+                writer.close()
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, KeyError):
+            stats.errors += 1
+
+
+async def scan_feed(host, port, cookie, folder, deadline, stats):
+    while time.monotonic() < deadline:
+        try:
+            reader, writer, status, _, ttfb = await request(
+                host, port, 'GET', f'/scan?{urlencode({"folder": folder})}', {'Cookie': cookie})
+            try:
+                if status != 200:
+                    stats.errors += 1
+                    await asyncio.sleep(1)
+                    continue
+                stats.ttfb.append(ttfb)
+                tail = b''
+                while time.monotonic() < deadline:
+                    data = await asyncio.wait_for(reader.read(65536), max(0.1, deadline - time.monotonic()))
+                    if not data:
+                        break
+                    buffer = tail + data
+                    stats.events += buffer.count(b'data:') - tail.count(b'data:')
+                    tail = buffer[-8:]
+                stats.ok += 1
+            finally:
+                writer.close()
+        except asyncio.TimeoutError:
+            stats.ok += 1  # Feed ainda aberto no fim do teste
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            stats.errors += 1
+
+
+async def probe(host, port, cookie, deadline, stats):
+    while time.monotonic() < deadline:
+        try:
+            reader, writer, status, _, ttfb = await request(host, port, 'GET', '/version', {'Cookie': cookie}, timeout=5)
+            writer.close()
+            if status == 200:
+                stats.ok += 1
+                stats.ttfb.append(ttfb)
+            else:
+                stats.errors += 1
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            stats.errors += 1
+        await asyncio.sleep(0.5)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('url')
+    parser.add_argument('--video', required=True, help='video file path, as the player puts it in /video/<path>')
+    parser.add_argument('--streams', type=int, default=200)
+    parser.add_argument('--chunk', type=int, default=2 * 2**20, help='bytes per range request')
+    parser.add_argument('--rate', type=int, default=1 * 2**20, help='bytes/s read by each player')
+    parser.add_argument('--scans', type=int, default=0)
+    parser.add_argument('--scan-folder')
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    args = parser.parse_args()
+    if args.scans and not args.scan_folder:
+        parser.error('--scans needs --scan-folder')
+
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    cookie = await login(host, port, args.username, args.password)
+    # Como o player: encodeURIComponent do caminho inteiro
+    target = '/video/' + quote(args.video, safe='')
+
+    streams, scans, probes = Stats(), Stats(), Stats()
+    start = time.monotonic()
+    deadline = start + args.duration
+    tasks = [player(host, port, cookie, target, args.chunk, args.rate, deadline, streams) for _ in range(args.streams)]
+    tasks += [scan_feed(host, port, cookie, args.scan_folder, deadline, scans) for _ in range(args.scans)]
+    tasks.append(probe(host, port, cookie, deadline, probes))
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - start
+
+    print(f"{args.streams} players, {args.scans} scan feeds, {elapsed:.0f}s against {args.url}")
+    streams.report('video', elapsed)
+    if args.scans:
+        scans.report('scan', elapsed)
+    probes.report('/version', elapsed)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark thumbnail extraction: accurate path vs fast seek.
+
+For each video given on the command line, runs the thumbnail ffmpeg
+command as ThumbnailProcessor builds it - accurate seek, full decode up to
+the 10% point - and with THUMB_FAST_SEEK (nearest keyframe only, -lowres
+for MPEG-family codecs, fast_bilinear scaling), and reports the best wall
+time of --repeat runs per mode, grouped by video codec. The probe the
+accurate path used to run first is timed separately. No database needed;
+ffmpeg and ffprobe must be on PATH or given with --ffmpeg/--ffprobe.
+
+Usage: python benchmarks/bench_thumbnail_seek.py VIDEO [VIDEO ...] [--repeat 3] [--size 50]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from media_commands import thumbnail_command, lowres_factor
+
+
+def probe(ffprobe, path):
+    out = subprocess.run(
+        [ffprobe, '-v', 'quiet', '-print_format', 'json', '-show_entries',
+         'format=duration:stream=codec_type,codec_name,width', path],
+        capture_output=True, check=True
+    ).stdout
+    data = json.loads(out)
+    video = next((s for s in data.get('streams', []) if s.get('codec_type') == 'video'), {})
+    return float(data['format']['duration']), video.get('codec_name'), int(video.get('width') or 0)
+
+
+def best_of(cmd, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(cmd, capture_output=True)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            return None
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('videos', nargs='+')
+    parser.add_argument('--ffmpeg', default='ffmpeg')
+    parser.add_argument('--ffprobe', default='ffprobe')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--size', type=int, default=50)
+    parser.add_argument('--point', type=float, default=0.1)
+    args = parser.parse_args()
+
+    by_codec = defaultdict(lambda: {'probe': [], 'accurate': [], 'fast': []})
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'thumb.webp')
+        print(f"{'codec':<11} {'lowres':>6} {'probe ms':>9} {'accurate ms':>12} {'fast ms':>9} {'speedup':>8}  file")
+        for path in args.videos:
+            start = time.perf_counter()
+            try:
+                duration, codec, width = probe(args.ffprobe, path)
+            except (subprocess.CalledProcessError, KeyError, ValueError):
+                print(f"{'?':<11} {'':>6} {'':>9} {'':>12} {'':>9} {'':>8}  {path} (probe failed)")
+                continue
+            probe_s = time.perf_counter() - start
+            timestamp = duration * args.point
+            accurate = best_of(thumbnail_command(args.ffmpeg, path, output, timestamp, args.size, 80), args.repeat)
+            fast = best_of(thumbnail_command(args.ffmpeg, path, output, timestamp, args.size, 80,
+                                             fast_seek=True, codec=codec, width=width), args.repeat)
+            if accurate is None or fast is None:
+                print(f"{codec:<11} {'':>6} {'':>9} {'':>12} {'':>9} {'':>8}  {path} (ffmpeg failed)")
+                continue
+            stats = by_codec[codec]
+            stats['probe'].append(probe_s)
+            stats['accurate'].append(accurate)
+            stats['fast'].append(fast)
+            print(f"{codec:<11} {lowres_factor(codec, width, args.size):>6} {probe_s * 1e3:>9.1f} {accurate * 1e3:>12.1f} "
+                  f"{fast * 1e3:>9.1f} {(accurate + probe_s) / fast:>7.1f}x  {path}")
+
+    if by_codec:
+        print()
+        print("Per codec (mean; speedup counts the probe the fast path skips by reusing the stored duration)")
+        for codec, stats in sorted(by_codec.items()):
+            n = len(stats['fast'])
+            probe_ms, accurate_ms, fast_ms = (sum(stats[k]) / n * 1e3 for k in ('probe', 'accurate', 'fast'))
+            print(f"{codec:<11} n={n:<3} probe {probe_ms:8.1f} ms  accurate {accurate_ms:8.1f} ms  "
+                  f"fast {fast_ms:8.1f} ms  {(accurate_ms + probe_ms) / fast_ms:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
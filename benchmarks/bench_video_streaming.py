@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the /video range server.
+
+Simulates four players reading the same large file with open-ended
+`Range: bytes=N-` requests (what browsers send) and reports throughput and
+peak RSS of the server process for the legacy read-whole-range handler and
+the streaming engine in streaming.py.
+
+Usage: python benchmarks/bench_video_streaming.py [--size-mb 2048] [--seconds 10]
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import threading
+import http.client
+from flask import Flask, Response, request
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming import send_file_range
+
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    import resource
+    HAS_PSUTIL = False
+
+PLAYERS = 4
+
+
+def legacy_handler(path):
+    """Reproduces the pre-streaming handler: reads the whole range into memory."""
+    size = os.path.getsize(path)
+    start, end = 0, size - 1
+    range_header = request.headers.get('Range')
+    if range_header:
+        range_match = range_header.replace('bytes=', '').split('-')
+        start = int(range_match[0]) if range_match[0] else 0
+        end = int(range_match[1]) if range_match[1] else size - 1
+        end = min(end, size - 1)
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start + 1)
+    return Response(data, status=206, mimetype='video/mp4', headers={
+        'Content-Range': f'bytes {start}-{end}/{size}',
+        'Accept-Ranges': 'bytes',
+        'Content-Length': str(end - start + 1)
+    })
+
+
+def build_app(path):
+    app = Flask(__name__)
+
+    @app.route('/legacy')
+    def legacy():
+        return legacy_handler(path)
+
+    @app.route('/streaming')
+    def streaming():
+        return send_file_range(path)
+
+    return app
+
+
+def rss_bytes():
+    if HAS_PSUTIL:
+        return psutil.Process().memory_info().rss
+    # ru_maxrss está em KB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def player(port, endpoint, size, deadline, totals, index):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    offset = (size // PLAYERS) * index
+    received = 0
+    while time.time() < deadline:
+        conn.request('GET', endpoint, headers={'Range': f'bytes={offset}-'})
+        response = conn.getresponse()
+        while True:
+            chunk = response.read(1024 * 1024)
+            if not chunk:
+                break
+            received += len(chunk)
+            offset += len(chunk)
+            if time.time() >= deadline:
+                break
+        response.close()
+        if offset >= size:
+            offset = 0
+        if time.time() >= deadline:
+            break
+    conn.close()
+    totals[index] = received
+
+
+def run(endpoint, path, size, seconds):
+    server = make_server('127.0.0.1', 0, build_app(path), threaded=True)
+    port = server.server_port
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+
+    baseline = rss_bytes()
+    peak = baseline
+    totals = [0] * PLAYERS
+    deadline = time.time() + seconds
+    threads = [threading.Thread(target=player, args=(port, endpoint, size, deadline, totals, i)) for i in range(PLAYERS)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    while any(t.is_alive() for t in threads):
+        peak = max(peak, rss_bytes())
+        time.sleep(0.05)
+    elapsed = time.time() - start
+    server.shutdown()
+
+    total = sum(totals)
+    print(f"{endpoint:<12} players={PLAYERS} throughput={total / elapsed / 1024**2:8.1f} MB/s "
+          f"rss_baseline={baseline / 1024**2:7.1f} MB rss_peak={peak / 1024**2:7.1f} MB "
+          f"rss_growth={(peak - baseline) / 1024**2:7.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=2048, help='Size of the synthetic media file')
+    parser.add_argument('--seconds', type=float, default=10, help='Duration of each run')
+    parser.add_argument('--mode', choices=['legacy', 'streaming', 'both'], default='both')
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    if not HAS_PSUTIL:
+        print("psutil not available, reporting ru_maxrss (peak only)")
+
+    with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as f:
+        path = f.name
+        # Arquivo esparso: o tamanho importa para o handler legado, não o conteúdo
+        f.truncate(args.size_mb * 1024 * 1024)
+    try:
+        size = os.path.getsize(path)
+        # O modo streaming roda primeiro para que o pico do legado não contamine a medição
+        if args.mode in ('streaming', 'both'):
+            run('/streaming', path, size, args.seconds)
+        if args.mode in ('legacy', 'both'):
+            run('/legacy', path, size, args.seconds)
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,84 +1,48 @@
-from flask import Blueprint, jsonify
-from collections import Counter
-from datetime import datetime
+from flask import Blueprint, request, jsonify
 import logging
 from flask_login import login_required
 from db import Database
+from config import Config
+from services.analytics_service import AnalyticsService
 
 DB_POOL = Database()  # Create database instance
+ANALYTICS = AnalyticsService(DB_POOL)
 
 analytics_bp = Blueprint('analytics', __name__)
 
 @analytics_bp.route('/stats', methods=['GET'])
 @login_required
 def stats():
-    with DB_POOL.get_connection() as conn:
-        with conn.cursor() as cur:
-            try:
-                # Direct queries for stats
-                cur.execute("SELECT COUNT(*) FROM endoflix_files")
-                video_count = cur.fetchone()[0]
-                cur.execute("SELECT COUNT(*) FROM endoflix_playlist WHERE is_temp = FALSE")
-                playlist_count = cur.fetchone()[0]
-                cur.execute("SELECT COUNT(*) FROM endoflix_session")
-                session_count = cur.fetchone()[0]
-                return jsonify({'videos': video_count, 'playlists': playlist_count, 'sessions': session_count})
-            except Exception as e:
-                logging.error(f"Erro ao obter estatísticas: {e}")
-                return jsonify({'error': str(e)}), 500
+    ANALYTICS.ensure_refresher()
+    try:
+        totals = ANALYTICS.totals(ANALYTICS.rollup())
+        return jsonify({'videos': totals['videos'], 'playlists': totals['saved_playlists'], 'sessions': totals['sessions']})
+    except Exception as e:
+        logging.error(f"Erro ao obter estatísticas: {e}")
+        return jsonify({'error': str(e)}), 500
 
 @analytics_bp.route('/analytics', methods=['GET'])
 @login_required
 def analytics():
-    with DB_POOL.get_connection() as conn:
-        with conn.cursor() as cur:
-            try:
-                cur.execute("SELECT COUNT(*) FROM endoflix_files")
-                video_count = cur.fetchone()[0] or 0
-                cur.execute("SELECT COUNT(*) FROM endoflix_playlist")
-                playlist_count = cur.fetchone()[0] or 0
-                cur.execute("SELECT COUNT(*) FROM endoflix_session")
-                session_count = cur.fetchone()[0] or 0
-
-                cur.execute("SELECT name, files, play_count FROM endoflix_playlist")
-                playlists = [{"name": row[0], "files": row[1], "play_count": row[2]} for row in cur.fetchall()]
-
-                # Direct query for top videos
-                cur.execute("SELECT file_path, view_count, is_favorite FROM endoflix_files ORDER BY view_count DESC LIMIT 10")
-                top_videos = [{"path": row[0], "play_count": row[1], "favorited": row[2]} for row in cur.fetchall()]
-
-                # Direct query for file types
-                cur.execute("SELECT file_path FROM endoflix_files")
-                file_types = Counter()
-                for row in cur.fetchall():
-                    from pathlib import Path
-                    ext = Path(row[0]).suffix.lower()
-                    file_types[ext] += 1
-
-                cur.execute("SELECT name, videos FROM endoflix_session")
-                sessions = []
-                for row in cur.fetchall():
-                    name_parts = row[0].split('_')[0].split('-')
-                    try:
-                        timestamp = datetime.strptime('-'.join(name_parts[:5]), '%Y-%m-%dT%H-%M-%S') if len(name_parts) >= 5 else datetime.now()
-                    except ValueError:
-                        timestamp = datetime.now()
-                    sessions.append({"name": row[0], "videos": row[1], "timestamp": timestamp})
-
-                player_usage = [0, 0, 0, 0]
-                for session in sessions:
-                    for i, video in enumerate(session["videos"][:4]):
-                        if video:
-                            player_usage[i] += 1
-
-                return jsonify({
-                    'stats': {'videos': video_count, 'playlists': playlist_count, 'sessions': session_count},
-                    'playlists': playlists,
-                    'top_videos': top_videos,
-                    'file_types': dict(file_types),
-                    'sessions': [{'name': s["name"], 'videos': s["videos"], 'timestamp': s["timestamp"].isoformat()} for s in sessions],
-                    'player_usage': player_usage
-                })
-            except Exception as e:
-                logging.error(f"Erro ao obter análises: {e}")
-                return jsonify({'error': str(e)}), 500
\ No newline at end of file
+    ANALYTICS.ensure_refresher()
+    try:
+        return jsonify(ANALYTICS.dashboard())
+    except Exception as e:
+        logging.error(f"Erro ao obter análises: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/analytics/views', methods=['GET'])
+@login_required
+def views():
+    """Most watched files: ?hours=N (hourly rollup) or ?days=N (daily rollup, default 7); ?limit=."""
+    try:
+        hours = request.args.get('hours', type=int)
+        days = request.args.get('days', default=7, type=int)
+        limit = request.args.get('limit', default=10, type=int)
+        if (hours is not None and not 1 <= hours <= Config.VIEW_HOURLY_RETENTION_DAYS * 24) \
+                or not 1 <= days <= Config.VIEW_DAILY_RETENTION_DAYS or not 1 <= limit <= 100:
+            return jsonify({'error': 'Período ou limite inválido'}), 400
+        return jsonify(ANALYTICS.views(days=days, hours=hours, limit=limit))
+    except Exception as e:
+        logging.error(f"Erro ao obter visualizações: {e}")
+        return jsonify({'error': str(e)}), 500
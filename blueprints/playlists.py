@@ -1,32 +1,103 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from pathlib import Path
 import json
 import logging
-import threading
+import time
 import csv
+import base64
+import binascii
 from io import StringIO
 from flask_login import login_required
+from config import Config
 from db import Database
 from cache import RedisCache
 from utils import get_media_files
-from thumbnail_processor import ThumbnailProcessor
-from models import PlaylistCreate, SaveTempPlaylist, RemovePlaylist, UpdatePlaylist, RemoveFromPlaylist
+from services.thumbnail_jobs import ThumbnailJobQueue, TERMINAL_STATUSES
+from models import PlaylistCreate, SaveTempPlaylist, RemovePlaylist, UpdatePlaylist, RemoveFromPlaylist, ReorderPlaylist
 from pydantic import ValidationError
 from services.playlist_service import PlaylistService
 
 DB_POOL = Database()  # Create database instance
 CACHE = RedisCache()
 playlist_service = PlaylistService(DB_POOL, CACHE)
+thumbnail_jobs = ThumbnailJobQueue(DB_POOL)
 
 playlists_bp = Blueprint('playlists', __name__)
 
+PLAYLIST_FIELDS = {'name', 'files', 'play_count', 'source_folder', 'file_count', 'total_size'}
+FILE_FIELDS = {'path', 'size', 'modified', 'extension'}
+
+def parse_fields(value):
+    """Parse ?fields=name,files.path into {'name': None, 'files': {'path'}}; None selects everything."""
+    if not value:
+        return None
+    fields = {}
+    for field in (f.strip() for f in value.split(',') if f.strip()):
+        top, _, sub = field.partition('.')
+        if top not in PLAYLIST_FIELDS or (sub and (top != 'files' or sub not in FILE_FIELDS)):
+            raise ValueError(f"Campo inválido: {field}")
+        if sub:
+            if fields.get(top, set()) is not None:
+                fields.setdefault(top, set()).add(sub)
+        else:
+            fields[top] = None
+    return fields
+
+def select_fields(data, fields):
+    if fields is None:
+        return data
+    selected = {key: data[key] for key in fields if key in data}
+    if fields.get('files') and 'files' in selected:
+        selected['files'] = [{key: f[key] for key in fields['files'] if key in f} for f in selected['files']]
+    return selected
+
+def page_limit(value):
+    if value is None:
+        return Config.PLAYLIST_PAGE_SIZE
+    limit = int(value)
+    if not 1 <= limit <= Config.PLAYLIST_PAGE_MAX:
+        raise ValueError(f"limit deve estar entre 1 e {Config.PLAYLIST_PAGE_MAX}")
+    return limit
+
+def encode_cursor(name):
+    return base64.urlsafe_b64encode(name.encode()).decode()
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        return base64.urlsafe_b64decode(cursor.encode()).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError("Cursor inválido")
+
 @playlists_bp.route('/playlists', methods=['GET', 'POST'])
 @login_required
 def playlists():
     try:
         if request.method == 'GET':
-            playlists = playlist_service.get_all_playlists()
-            return jsonify(playlists)
+            try:
+                summary = request.args.get('view') == 'summary'
+                fields = parse_fields(request.args.get('fields'))
+                paginated = 'limit' in request.args or 'cursor' in request.args
+                limit = page_limit(request.args.get('limit')) if paginated else None
+                after = decode_cursor(request.args.get('cursor'))
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+
+            # Busca um item a mais para saber se existe próxima página
+            fetch = limit + 1 if limit else None
+            if summary:
+                items = playlist_service.get_playlist_summaries(fetch, after)
+                names = [item['name'] for item in items]
+                playlists = {item['name']: item for item in items}
+            else:
+                names = playlist_service.list_playlist_names(fetch, after)
+                playlists = playlist_service.get_playlists(names[:limit] if limit else names)
+            next_cursor = encode_cursor(names[limit - 1]) if limit and len(names) > limit else None
+            playlists = {name: select_fields(data, fields) for name, data in list(playlists.items())[:limit]}
+            if not paginated:
+                return jsonify(playlists)
+            return jsonify({'playlists': playlists, 'next_cursor': next_cursor})
         else:
             try:
                 data = PlaylistCreate(**request.get_json())
@@ -90,10 +161,14 @@ def update_playlist():
 @login_required
 def export_playlist(name):
     try:
+        try:
+            fields = parse_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         playlist_data = playlist_service.get_playlist(name)
         if not playlist_data:
             return jsonify({'error': 'Playlist not found'}), 404
-        return jsonify(playlist_data)
+        return jsonify(select_fields(playlist_data, fields))
     except Exception as e:
         logging.error(f"Erro ao exportar playlist: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -114,6 +189,22 @@ def remove_from_playlist():
         logging.error(f"Erro ao remover arquivos da playlist: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@playlists_bp.route('/reorder_playlist', methods=['POST'])
+@login_required
+def reorder_playlist():
+    try:
+        try:
+            data = ReorderPlaylist(**request.get_json())
+        except ValidationError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        result = playlist_service.reorder_playlist(data.name, data.file, data.before)
+        return jsonify({'success': True, 'files': result['files']})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except Exception as e:
+        logging.error(f"Erro ao reordenar playlist: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @playlists_bp.route('/import_playlist', methods=['POST'])
 @login_required
 def import_playlist():
@@ -157,14 +248,47 @@ def import_playlist():
 @playlists_bp.route('/generate_thumbnails/<playlist_name>', methods=['POST'])
 @login_required
 def generate_thumbnails(playlist_name):
+    """Queue thumbnail generation (run by thumbnail_worker.py). A playlist has at most one active job."""
     try:
-        def run_in_background():
-            processor = ThumbnailProcessor()
-            processor.process_playlist_thumbnails(playlist_name)
-
-        thread = threading.Thread(target=run_in_background, daemon=True)
-        thread.start()
-        return jsonify({"status": "started", "message": "Thumbnail generation started in background"})
+        job, created = thumbnail_jobs.enqueue(playlist_name)
+        message = "Thumbnail generation queued" if created else "Thumbnail generation already in progress"
+        return jsonify({"status": job['status'], "job_id": job['id'], "job": job, "message": message}), 202
     except Exception as e:
-        logging.error(f"Erro ao iniciar geração de thumbnails para playlist {playlist_name}: {str(e)}")
-        return jsonify({'success': False, 'error': str(e)}), 500
\ No newline at end of file
+        logging.error(f"Erro ao enfileirar geração de thumbnails para playlist {playlist_name}: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@playlists_bp.route('/thumbnail_jobs/<int:job_id>', methods=['GET'])
+@login_required
+def thumbnail_job(job_id):
+    job = thumbnail_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@playlists_bp.route('/thumbnail_jobs/<int:job_id>/events', methods=['GET'])
+@login_required
+def thumbnail_job_events(job_id):
+    """SSE: one event per change of the job row, until it finishes."""
+    if thumbnail_jobs.get(job_id) is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+
+    def events():
+        last = None
+        while True:
+            job = thumbnail_jobs.get(job_id)
+            if job != last:
+                yield f"data: {json.dumps(job)}\n\n"
+                last = job
+            if job is None or job['status'] in TERMINAL_STATUSES:
+                return
+            time.sleep(1)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream')
+
+@playlists_bp.route('/thumbnail_jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_thumbnail_job(job_id):
+    job = thumbnail_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job})
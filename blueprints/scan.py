@@ -15,9 +15,12 @@ def scan():
         folder_path = Path(folder)
         if not folder_path.exists() or not folder_path.is_dir():
             return jsonify({'error': 'Pasta inválida ou não encontrada'}), 400
-        return Response(get_media_files(folder), mimetype='text/event-stream')
+        # full=true força a releitura de todos os arquivos, ignorando o manifesto
+        incremental = not request.json.get('full', False)
+        return Response(get_media_files(folder, incremental=incremental), mimetype='text/event-stream')
     elif request.method == 'GET':
         folder = request.args.get('folder')
         if not folder:
             return jsonify({'error': 'Parâmetro folder é obrigatório'}), 400
-        return Response(get_media_files(folder), mimetype='text/event-stream')
\ No newline at end of file
+        incremental = request.args.get('full', '').lower() not in ('1', 'true')
+        return Response(get_media_files(folder, incremental=incremental), mimetype='text/event-stream')
\ No newline at end of file
@@ -1,17 +1,26 @@
-from flask import Blueprint, request, Response, jsonify
+from flask import Blueprint, request, Response, jsonify, redirect, url_for
 from pathlib import Path
 import os
 import base64
 import json
-import logging
-from datetime import datetime
-from flask_login import login_required
+from flask_login import login_required, current_user
 from db import Database
+from cache import RedisCache
 from config import Config
-from utils import process_file, index_file
+from streaming import send_file_range, plan_range_response
+from view_recorder import ViewRecorder
+from thumbnail_processor import sprite_vtt
+from snapshot_processor import SnapshotProcessor, SnapshotQueueFull, SNAPSHOT_EXTENSIONS
+from services.thumbnail_store import ThumbnailStore, HASH_ID_PATTERN
+from models import PlaybackProgress, SnapshotBurst
+from pydantic import ValidationError
 from prometheus_flask_exporter import Counter
 
 DB_POOL = Database()  # Create database instance
+CACHE = RedisCache()
+view_recorder = ViewRecorder(DB_POOL, CACHE)
+thumbnail_store = ThumbnailStore(DB_POOL)
+snapshot_processor = SnapshotProcessor(CACHE)
 TRANSCODE_DIR = Config.TRANSCODE_DIR
 
 video_bp = Blueprint('video', __name__)
@@ -24,100 +33,159 @@ video_views_counter = Counter('video_views', 'Number of video views')
 def serve_video(filename):
     return serve_video_range(Path(filename))
 
+def playback_id():
+    """Identify the playback a range request belongs to.
+
+    The player may send an explicit X-Playback-Session header (or ?session=);
+    otherwise the user, client address and user agent are used.
+    """
+    session_id = request.headers.get('X-Playback-Session') or request.args.get('session')
+    if session_id:
+        return session_id
+    user_id = current_user.get_id() if current_user else None
+    return f"{user_id}:{request.remote_addr}:{request.user_agent.string}"
+
 def serve_video_range(input_path):
     input_path_str = str(input_path)
     if not os.path.exists(input_path_str):
         return jsonify({'error': 'Arquivo não encontrado'}), 404
 
-    size = os.path.getsize(input_path_str)
-    start, end = 0, size - 1
-    range_header = request.headers.get('Range')
-    if range_header:
-        range_match = range_header.replace('bytes=', '').split('-')
-        start = int(range_match[0]) if range_match[0] else 0
-        end = int(range_match[1]) if range_match[1] else size - 1
-        end = min(end, size - 1)
-
-    content_length = end - start + 1
-    with open(input_path_str, 'rb') as f:
-        f.seek(start)
-        data = f.read(content_length)
-
-    with DB_POOL.get_connection() as conn:
-        with conn.cursor() as cur:
-            try:
-                cur.execute("SELECT 1 FROM endoflix_files WHERE file_path = %s", (input_path_str,))
-                if not cur.fetchone():
-                    file_data = process_file(input_path_str)
-                    index_file(conn, file_data)
-                cur.execute("UPDATE endoflix_files SET view_count = view_count + 1, last_viewed_at = CURRENT_TIMESTAMP WHERE file_path = %s", (input_path_str,))
-                conn.commit()
-            except Exception as e:
-                conn.rollback()
-                logging.error(f"Erro ao atualizar visualizações para {input_path_str}: {e}")
-
-    # Increment Prometheus counter
-    video_views_counter.inc()
-
-    return Response(
-        data,
-        status=206 if range_header else 200,
-        mimetype='video/mp4',
-        headers={
-            'Content-Range': f'bytes {start}-{end}/{size}',
-            'Accept-Ranges': 'bytes',
-            'Content-Length': str(content_length)
-        }
-    )
-
-def ensure_snapshots_dir(video_path):
-    video_dir = os.path.dirname(video_path)
-    snapshots_dir = os.path.join(video_dir, 'snapshots')
-    if not os.path.exists(snapshots_dir):
-        os.makedirs(snapshots_dir)
-    return snapshots_dir
+    plan = plan_range_response(input_path_str, request.headers.get)
+    # Uma visualização por playback, só quando há conteúdo (304/416 não reproduzem nada);
+    # a gravação no banco é feita em lote fora da requisição
+    if plan.status in (200, 206) and view_recorder.record(input_path_str, playback_id()):
+        video_views_counter.inc()
+
+    # Resposta em streaming: memória constante por conexão, independente do tamanho do intervalo
+    return send_file_range(input_path_str, plan=plan)
+
+@video_bp.route('/playback_progress', methods=['POST'])
+@login_required
+def playback_progress():
+    """Seconds watched by one player since its previous report (sent periodically and on pause)."""
+    try:
+        data = PlaybackProgress(**(request.get_json(force=True, silent=True) or {}))
+    except ValidationError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    # Mesmo caminho registrado por serve_video para a requisição do arquivo
+    view_recorder.progress(str(Path(data.path)), data.session, data.player_slot, data.seconds)
+    return '', 204
+
+@video_bp.route('/sprites')
+@login_required
+def sprite_for_video():
+    """Redirect ?path=<video>[&format=vtt] to the content-addressed sprite index of that video."""
+    video_path = request.args.get('path')
+    if not video_path:
+        return jsonify({'success': False, 'error': 'path é obrigatório'}), 400
+    ext = 'vtt' if request.args.get('format') == 'vtt' else 'json'
+    hash_id = thumbnail_store.hash_for(str(Path(video_path)))
+    if hash_id is None:
+        return jsonify({'success': False, 'error': 'Sprite not found'}), 404
+    return redirect(url_for('video.serve_sprite', hash_id=hash_id, ext=ext))
+
+@video_bp.route('/sprites/<hash_id>.<ext>')
+@login_required
+def serve_sprite(hash_id, ext):
+    """Scrub-preview sprite sheet (.webp), its JSON index (.json) or a WebVTT thumbnail track (.vtt).
+
+    The image URL is addressed by content, so it is served as immutable."""
+    if not HASH_ID_PATTERN.match(hash_id) or ext not in ('webp', 'json', 'vtt'):
+        return jsonify({'success': False, 'error': 'Sprite not found'}), 404
+    sprite_path, index_path = thumbnail_store.sprite_paths(hash_id)
+    if ext == 'webp':
+        if not sprite_path.exists():
+            return jsonify({'success': False, 'error': 'Sprite not found'}), 404
+        response = send_file_range(str(sprite_path), mimetype='image/webp')
+        response.headers['Cache-Control'] = f"private, max-age={Config.SPRITE_CACHE_MAX_AGE}, immutable"
+        return response
+
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+        version = f"{index_path.stat().st_mtime_ns:x}"
+    except (OSError, ValueError):
+        return jsonify({'success': False, 'error': 'Sprite not found'}), 404
+    sprite_url = url_for('video.serve_sprite', hash_id=hash_id, ext='webp')
+    if ext == 'vtt':
+        response = Response(sprite_vtt(index, sprite_url), mimetype='text/vtt')
+    else:
+        response = jsonify({**index, 'sprite': sprite_url})
+    # O índice é pequeno: revalida sempre (304 enquanto não for regenerado)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.set_etag(version)
+    return response.make_conditional(request)
+
+def snapshot_video_path(value: str) -> str:
+    # Remove o prefixo da URL do vídeo
+    return os.path.normpath(value.replace('/video/', ''))
+
+def snapshot_frames():
+    """(video_path, [(bytes, extension)], is_burst) from a multipart upload or a legacy JSON body."""
+    if request.mimetype == 'multipart/form-data':
+        # O werkzeug faz o parse em streaming (partes grandes vão para arquivo temporário)
+        frames = [(f.read(), SNAPSHOT_EXTENSIONS.get(f.mimetype, 'webp')) for f in request.files.getlist('frame')]
+        return request.form.get('video_path'), frames, request.form.get('is_burst') == 'true' or len(frames) > 1
+    # Compatibilidade: data URLs em base64 (image_data ou frames)
+    data = request.get_json(silent=True) or {}
+    encoded = data.get('frames') or ([data['image_data']] if data.get('image_data') else [])
+    frames = [(base64.b64decode(frame.split(',')[1]), 'webp') for frame in encoded]
+    return data.get('video_path'), frames, bool(data.get('frames'))
 
 @video_bp.route('/save_snapshot', methods=['POST'])
 @login_required
 def save_snapshot():
+    """Queue snapshot frames to be written next to the video; 202 with a job id, 429 when the queue is full.
+
+    Send multipart/form-data with video_path, is_burst and one `frame` file
+    part per image. JSON with base64 data URLs is still accepted."""
+    if request.content_length and request.content_length > Config.SNAPSHOT_MAX_UPLOAD_BYTES:
+        return jsonify({'success': False, 'error': 'Upload muito grande'}), 413
+    try:
+        video_path, frames, is_burst = snapshot_frames()
+    except (ValueError, IndexError) as e:
+        return jsonify({'success': False, 'error': f'Imagem inválida: {e}'}), 400
+    if not video_path or not frames:
+        return jsonify({'success': False, 'error': 'Dados inválidos'}), 400
+
+    video_path = snapshot_video_path(video_path)
+    if not os.path.isfile(video_path):
+        return jsonify({'success': False, 'error': 'Arquivo não encontrado'}), 404
     try:
-        data = request.get_json()
-        video_path = data.get('video_path')
-        frames = data.get('frames', [])
-        image_data = data.get('image_data')
-        is_burst = data.get('is_burst', False)
-
-        if not video_path or (not frames and not image_data):
-            return jsonify({'success': False, 'error': 'Dados inválidos'}), 400
-
-        # Remove o prefixo da URL do vídeo
-        video_path = video_path.replace('/video/', '')
-        video_path = os.path.normpath(video_path)
-
-        # Cria a pasta snapshots se não existir
-        snapshots_dir = ensure_snapshots_dir(video_path)
-
-        # Gera o timestamp base
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-
-        if frames:  # Processamento em lote para burst
-            for i, frame_data in enumerate(frames, 1):
-                filename = f'burst_{timestamp}_{i}.webp'
-                file_path = os.path.join(snapshots_dir, filename)
-                image_data = base64.b64decode(frame_data.split(',')[1])
-                with open(file_path, 'wb') as f:
-                    f.write(image_data)
-        else:  # Processamento de snapshot único
-            filename = f'snapshot_{timestamp}.webp'
-            file_path = os.path.join(snapshots_dir, filename)
-            image_data = base64.b64decode(image_data.split(',')[1])
-            with open(file_path, 'wb') as f:
-                f.write(image_data)
-
-        return jsonify({
-            'success': True,
-            'message': 'Snapshot(s) salvo(s) com sucesso'
-        })
-    except Exception as e:
-        logging.error(f"Erro ao processar snapshot: {str(e)}")
-        return jsonify({'success': False, 'error': str(e)}), 500
\ No newline at end of file
+        job = snapshot_processor.submit(video_path, frames, is_burst)
+    except SnapshotQueueFull:
+        response = jsonify({'success': False, 'error': 'Fila de snapshots cheia, tente novamente'})
+        response.headers['Retry-After'] = str(Config.SNAPSHOT_RETRY_AFTER)
+        return response, 429
+    return jsonify({'success': True, 'job_id': job['id'], 'job': job}), 202
+
+@video_bp.route('/snapshot_burst', methods=['POST'])
+@login_required
+def snapshot_burst():
+    """Queue a server-side burst: count frames, one every interval seconds from start, extracted by one ffmpeg run.
+
+    Expects JSON with video_path, start, count and interval (seconds).
+    Answers 202 with a job id; progress is at /snapshot_jobs/<job_id>."""
+    try:
+        burst = SnapshotBurst(**(request.get_json(silent=True) or {}))
+    except (ValidationError, TypeError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    video_path = snapshot_video_path(burst.video_path)
+    if not os.path.isfile(video_path):
+        return jsonify({'success': False, 'error': 'Arquivo não encontrado'}), 404
+    try:
+        job = snapshot_processor.submit_burst(video_path, burst.start, burst.count, burst.interval)
+    except SnapshotQueueFull:
+        response = jsonify({'success': False, 'error': 'Fila de snapshots cheia, tente novamente'})
+        response.headers['Retry-After'] = str(Config.SNAPSHOT_RETRY_AFTER)
+        return response, 429
+    return jsonify({'success': True, 'job_id': job['id'], 'job': job}), 202
+
+@video_bp.route('/snapshot_jobs/<job_id>', methods=['GET'])
+@login_required
+def snapshot_job(job_id):
+    job = snapshot_processor.status(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify(job)
@@ -1,12 +1,73 @@
 import redis
 from config import Config
+import os
 import json
-from functools import lru_cache
-from cachetools import TTLCache
-import zlib
+import uuid
+import time
+import threading
+from cachetools import Cache, TTLCache
+from prometheus_flask_exporter import Counter
+from cache_codec import CacheCodec, CodecError
 import logging
 
+# Prometheus metrics per cache tier ('local' = per-process TTLCache, 'redis')
+cache_requests_counter = Counter('cache_requests', 'Cache lookups by tier and result', ['tier', 'result'])
+cache_evictions_counter = Counter('cache_evictions', 'Local cache evictions by reason', ['reason'])
+cache_recomputes_counter = Counter('cache_recomputes', 'Cache misses by how they were resolved', ['outcome'])
+
+LOCK_PREFIX = 'lock:'
+STALE_PREFIX = 'stale:'
+
+# Deletes the lease only if it still holds our token (it may have expired and
+# been taken by another process meanwhile)
+RELEASE_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class _LocalTier(TTLCache):
+    """TTLCache that reports capacity and TTL evictions."""
+
+    def popitem(self):
+        item = super().popitem()
+        cache_evictions_counter.labels(reason='capacity').inc()
+        return item
+
+    def expire(self, time=None):
+        before = Cache.__len__(self)
+        super().expire(time)
+        expired = before - Cache.__len__(self)
+        if expired:
+            cache_evictions_counter.labels(reason='expired').inc(expired)
+
 class RedisCache:
+    """Redis with a per-process near cache kept coherent across workers.
+
+    Every delete publishes the key on CACHE_INVALIDATION_CHANNEL and bumps a
+    global invalidation epoch. A subscriber thread in each process evicts the
+    key from its local tier. Writes publish nothing: set/batch_set fill keys
+    that are new (a recomputed miss) or versioned (probe keys carry size and
+    mtime), so no other process holds an older value. A key overwritten in
+    place, such as a job status, is read and written with local=False and
+    never enters a local tier. Messages carry the epoch, so a gap
+    (lost message, reconnect) is detected and the whole local tier is dropped;
+    the epoch is also polled every CACHE_EPOCH_POLL_INTERVAL seconds as a
+    fallback. While the subscriber is not connected the local tier is bypassed.
+    A value read from Redis only fills the local tier if no eviction happened
+    in this process since the read started, so a late fill can't resurrect an
+    invalidated value.
+
+    get_or_compute/get_or_compute_many add single-flight recomputation: on a
+    miss only the process holding a short SET NX lease on the key rebuilds
+    it; the others serve the key's stale copy, if there is one, or poll until
+    the lease holder fills it.
+
+    Values are str or msgpack-serializable objects and come back with the
+    same type (see cache_codec). Local-tier values are shared between
+    callers and must be treated as read-only.
+    """
     _instance = None
     _client = None
     _local_cache = None
@@ -25,93 +86,368 @@ class RedisCache:
                 decode_responses=False,
                 socket_timeout=Config.CONNECTION_TIMEOUT
             )
-            self._local_cache = TTLCache(
+            self._local_cache = _LocalTier(
                 maxsize=Config.CACHE_MAX_SIZE,
                 ttl=Config.CACHE_TTL
             )
+            self._local_lock = threading.RLock()
+            self._codec = CacheCodec(Config.CACHE_COMPRESSION, Config.COMPRESSION_LEVEL, Config.CACHE_COMPRESS_MIN_BYTES)
+            self._origin = uuid.uuid4().hex
+            self._epoch = None  # Última época de invalidação aplicada ao cache local
+            self._invalidations = 0  # Evicções locais; leituras do Redis anteriores a uma evicção não preenchem o cache local
+            self._lagging_epoch = None
+            self._subscribed = threading.Event()
+            self._subscriber = None
+            self._subscriber_pid = None
+
+    def _encode(self, value) -> bytes:
+        return self._codec.encode(value)
+
+    def _decode(self, key: str, data: bytes):
+        try:
+            return self._codec.decode(data)
+        except CodecError as e:
+            logging.error(f"Valor inválido no cache para {key}: {e}")
+            return None
 
-    def _compress(self, data: str) -> bytes:
-        return zlib.compress(data.encode(), level=Config.COMPRESSION_LEVEL)
+    # Local tier
 
-    def _decompress(self, data: bytes) -> str:
-        return zlib.decompress(data).decode()
+    def _local_get(self, key: str):
+        self._ensure_subscriber()
+        if not self._subscribed.is_set():
+            return None  # Sem canal de invalidação o cache local pode estar desatualizado
+        with self._local_lock:
+            value = self._local_cache.get(key)
+        cache_requests_counter.labels(tier='local', result='hit' if value is not None else 'miss').inc()
+        return value
 
-    def get(self, key: str) -> str:
+    def _local_get_many(self, keys: list) -> dict:
+        self._ensure_subscriber()
+        if not self._subscribed.is_set():
+            return {}
+        with self._local_lock:
+            found = {key: value for key in keys if (value := self._local_cache.get(key)) is not None}
+        if found:
+            cache_requests_counter.labels(tier='local', result='hit').inc(len(found))
+        if len(found) < len(keys):
+            cache_requests_counter.labels(tier='local', result='miss').inc(len(keys) - len(found))
+        return found
+
+    def _local_set(self, key: str, value, since: int):
+        """Fill the local tier with a value read or written when _invalidations was `since`."""
+        if self._subscribed.is_set():
+            with self._local_lock:
+                if since == self._invalidations:
+                    self._local_cache[key] = value
+
+    def _local_set_many(self, data: dict, since: int):
+        if self._subscribed.is_set():
+            with self._local_lock:
+                if since == self._invalidations:
+                    for key, value in data.items():
+                        self._local_cache[key] = value
+
+    def _local_evict(self, *keys):
+        with self._local_lock:
+            self._invalidations += 1
+            for key in keys:
+                if self._local_cache.pop(key, None) is not None:
+                    cache_evictions_counter.labels(reason='invalidation').inc()
+
+    def _publish_invalidation(self, *keys):
+        """Bump the invalidation epoch and tell the other processes which keys changed."""
+        epoch = self._client.incr(Config.CACHE_EPOCH_KEY)
+        self._client.publish(Config.CACHE_INVALIDATION_CHANNEL, json.dumps({'origin': self._origin, 'epoch': epoch, 'keys': list(keys)}))
+
+    def get(self, key: str, local: bool = True):
         # Tenta primeiro no cache local
-        if key in self._local_cache:
-            return self._local_cache[key]
+        if local:
+            value = self._local_get(key)
+            if value is not None:
+                return value
 
         # Se não encontrou, busca no Redis
+        since = self._invalidations
         try:
             value = self._client.get(key)
+            cache_requests_counter.labels(tier='redis', result='hit' if value else 'miss').inc()
             if value:
-                # Descomprime o valor
-                decompressed = self._decompress(value)
-                # Atualiza cache local
-                self._local_cache[key] = decompressed
-                return decompressed
+                decoded = self._decode(key, value)
+                if decoded is not None and local:
+                    # Atualiza cache local
+                    self._local_set(key, decoded, since)
+                return decoded
             return None
         except redis.RedisError as e:
             logging.error(f"Erro ao acessar Redis: {e}")
             return None
 
-    def set(self, key: str, value: str, ttl: int = None) -> bool:
+    def set(self, key: str, value, ttl: int = None, local: bool = True) -> bool:
+        """Write key without invalidating other processes (see the class docstring);
+        local=False keeps it out of this process's local tier too."""
+        since = self._invalidations
         try:
-            # Comprime o valor antes de salvar
-            compressed_value = self._compress(value)
-            self._client.setex(key, ttl or Config.REDIS_TTL, compressed_value)
+            self._client.setex(key, ttl or Config.REDIS_TTL, self._encode(value))
             # Atualiza cache local
-            self._local_cache[key] = value
+            if local:
+                self._local_set(key, value, since)
             return True
         except redis.RedisError as e:
             logging.error(f"Erro ao salvar no Redis: {e}")
             return False
 
+    def add(self, key: str, value: str, ttl: int = None) -> bool:
+        """Set key only if absent (SET NX). Returns True if this call created it."""
+        try:
+            return bool(self._client.set(key, value, nx=True, ex=ttl or Config.REDIS_TTL))
+        except redis.RedisError as e:
+            logging.error(f"Erro ao salvar no Redis: {e}")
+            raise
+
     def delete(self, key: str) -> bool:
+        # Remove do cache local mesmo se o Redis falhar
+        self._local_evict(key)
         try:
-            self._client.delete(key)
-            # Remove do cache local
-            self._local_cache.pop(key, None)
+            # A cópia antiga só vale para expiração; após uma invalidação explícita não é servida
+            self._client.delete(key, STALE_PREFIX + key)
+            self._publish_invalidation(key)
             return True
         except redis.RedisError as e:
             logging.error(f"Erro ao deletar do Redis: {e}")
             return False
 
     def clear_local_cache(self):
-        self._local_cache.clear()
+        with self._local_lock:
+            self._invalidations += 1
+            self._local_cache.clear()
+
+    # Invalidation subscriber
+
+    def _ensure_subscriber(self):
+        # Uma thread por processo; reiniciada após fork (workers do gunicorn)
+        if self._subscriber is not None and self._subscriber_pid == os.getpid() and self._subscriber.is_alive():
+            return
+        with self._local_lock:
+            if self._subscriber is not None and self._subscriber_pid == os.getpid() and self._subscriber.is_alive():
+                return
+            if self._subscriber_pid != os.getpid():
+                self._subscribed.clear()
+                self._local_cache.clear()  # Herdado do processo pai, sem garantia de coerência
+            self._subscriber_pid = os.getpid()
+            self._subscriber = threading.Thread(target=self._subscribe_loop, name='cache-invalidation', daemon=True)
+            self._subscriber.start()
 
-    @lru_cache(maxsize=1000)
-    def get_metadata(self, file_path: str) -> dict:
-        key = f"metadata:{file_path}"
-        data = self.get(key)
-        if data:
+    def _subscribe_loop(self):
+        backoff = 1
+        while True:
+            pubsub = None
             try:
-                return json.loads(data)
-            except json.JSONDecodeError as e:
-                logging.error(f"Erro ao decodificar JSON: {e}")
-                return None
-        return None
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(Config.CACHE_INVALIDATION_CHANNEL)
+                # Entradas anteriores à inscrição podem ter perdido invalidações
+                self.clear_local_cache()
+                self._epoch = int(self._client.get(Config.CACHE_EPOCH_KEY) or 0)
+                self._subscribed.set()
+                backoff = 1
+                last_poll = time.monotonic()
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get('type') == 'message':
+                        self._handle_invalidation(message['data'])
+                    if time.monotonic() - last_poll >= Config.CACHE_EPOCH_POLL_INTERVAL:
+                        self._check_epoch(int(self._client.get(Config.CACHE_EPOCH_KEY) or 0))
+                        last_poll = time.monotonic()
+            except Exception as e:
+                self._subscribed.clear()
+                self.clear_local_cache()
+                logging.warning(f"Canal de invalidação do cache indisponível, tentando novamente em {backoff}s: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
 
-    def set_metadata(self, file_path: str, metadata: dict) -> bool:
-        key = f"metadata:{file_path}"
-        return self.set(key, json.dumps(metadata))
+    def _handle_invalidation(self, data):
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        epoch = message.get('epoch', 0)
+        if self._epoch is not None and epoch > self._epoch + 1:
+            # Mensagens perdidas: não dá para saber quais chaves mudaram
+            logging.warning("Invalidações de cache perdidas; limpando o cache local")
+            self.clear_local_cache()
+        self._epoch = max(self._epoch or 0, epoch)
+        if message.get('origin') != self._origin:
+            self._local_evict(*message.get('keys', []))
+
+    def _check_epoch(self, remote_epoch: int):
+        # A leitura pode chegar antes das mensagens em trânsito: só descarta o cache
+        # local se ainda estivermos atrás da época vista na verificação anterior
+        if self._lagging_epoch is not None and (self._epoch or 0) < self._lagging_epoch:
+            logging.warning("Invalidações de cache não recebidas; limpando o cache local")
+            self.clear_local_cache()
+            self._epoch = remote_epoch
+        self._lagging_epoch = remote_epoch if remote_epoch > (self._epoch or 0) else None
+
+    def _redis_get_many(self, keys: list) -> dict:
+        values = self._client.mget(keys)
+        fetched = {}
+        for key, value in zip(keys, values):
+            if value is not None:
+                decoded = self._decode(key, value)
+                if decoded is not None:
+                    fetched[key] = decoded
+        return fetched
 
     def batch_get(self, keys: list) -> dict:
+        """Local tier first; only the misses go to Redis, in one MGET, and fill the local tier."""
+        found = self._local_get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if not missing:
+            return found
+        since = self._invalidations
         try:
-            values = self._client.mget(keys)
-            return {k: self._decompress(v) for k, v in zip(keys, values) if v is not None}
+            fetched = self._redis_get_many(missing)
         except redis.RedisError as e:
             logging.error(f"Erro no batch get do Redis: {e}")
-            return {}
+            return found
+        cache_requests_counter.labels(tier='redis', result='hit').inc(len(fetched))
+        cache_requests_counter.labels(tier='redis', result='miss').inc(len(missing) - len(fetched))
+        self._local_set_many(fetched, since)
+        found.update(fetched)
+        return found
 
-    def batch_set(self, data: dict, ttl: int = None) -> bool:
+    def batch_set(self, data: dict, ttl: int = None, stale_ttl: int = None) -> bool:
+        """Write several keys in one pipeline. With stale_ttl, a stale copy of each
+        value outlives it by stale_ttl seconds (see get_or_compute)."""
+        if not data:
+            return True
+        ttl = ttl or Config.REDIS_TTL
+        since = self._invalidations
         try:
-            pipe = self._client.pipeline()
+            pipe = self._client.pipeline(transaction=False)
             for key, value in data.items():
-                compressed_value = self._compress(value)
-                pipe.setex(key, ttl or Config.REDIS_TTL, compressed_value)
+                encoded = self._encode(value)
+                pipe.setex(key, ttl, encoded)
+                if stale_ttl:
+                    pipe.setex(STALE_PREFIX + key, ttl + stale_ttl, encoded)
             pipe.execute()
+            self._local_set_many(data, since)
             return True
         except redis.RedisError as e:
             logging.error(f"Erro no batch set do Redis: {e}")
-            return False 
\ No newline at end of file
+            return False
+
+    # Single-flight recomputation
+
+    def get_or_compute(self, key: str, compute, ttl: int = None, stale_ttl: int = None):
+        """Cached value of key, or compute() run by a single process at a time.
+
+        compute returns the value, or None for "nothing to cache"."""
+        return self.get_or_compute_many([key], lambda keys: {key: compute()}, ttl, stale_ttl).get(key)
+
+    def get_or_compute_many(self, keys: list, compute, ttl: int = None, stale_ttl: int = None) -> dict:
+        """Cached values of keys; compute(missing_keys) -> {key: value} rebuilds misses.
+
+        Misses whose lease this process gets are computed (in one call) and
+        written; the rest are served from their stale copy when stale_ttl is
+        set, otherwise awaited for up to CACHE_LOCK_LEASE seconds and computed
+        here if the lease holder never fills them. Redis errors fail open.
+        """
+        found = self.batch_get(keys)
+        missing = [key for key in keys if key not in found]
+        if not missing:
+            return found
+
+        token = uuid.uuid4().hex
+        try:
+            owned, waiting = self._acquire_leases(missing, token)
+        except redis.RedisError as e:
+            logging.error(f"Erro ao obter lock de recomputação no Redis: {e}")
+            found.update(self._compute(missing, compute, ttl, stale_ttl))
+            return found
+
+        if owned:
+            try:
+                # Pode ter sido preenchida entre o MGET e o lock
+                try:
+                    refreshed = self._redis_get_many(owned)
+                except redis.RedisError:
+                    refreshed = {}
+                found.update(refreshed)
+                to_compute = [key for key in owned if key not in refreshed]
+                if to_compute:
+                    cache_recomputes_counter.labels(outcome='computed').inc(len(to_compute))
+                    found.update(self._compute(to_compute, compute, ttl, stale_ttl))
+            finally:
+                self._release_leases(owned, token)
+        if waiting:
+            found.update(self._await_fill(waiting, compute, ttl, stale_ttl))
+        return found
+
+    def _compute(self, keys: list, compute, ttl: int = None, stale_ttl: int = None) -> dict:
+        values = {key: value for key, value in (compute(keys) or {}).items() if value is not None}
+        self.batch_set(values, ttl, stale_ttl)
+        return values
+
+    def _acquire_leases(self, keys: list, token: str):
+        pipe = self._client.pipeline(transaction=False)
+        for key in keys:
+            pipe.set(LOCK_PREFIX + key, token, nx=True, ex=Config.CACHE_LOCK_LEASE)
+        acquired = pipe.execute()
+        owned = [key for key, ok in zip(keys, acquired) if ok]
+        waiting = [key for key, ok in zip(keys, acquired) if not ok]
+        return owned, waiting
+
+    def _release_leases(self, keys: list, token: str):
+        if not keys:
+            return
+        try:
+            pipe = self._client.pipeline(transaction=False)
+            for key in keys:
+                pipe.eval(RELEASE_LEASE_SCRIPT, 1, LOCK_PREFIX + key, token)
+            pipe.execute()
+        except redis.RedisError as e:
+            # O lease expira sozinho em CACHE_LOCK_LEASE segundos
+            logging.error(f"Erro ao liberar lock de recomputação no Redis: {e}")
+
+    def _await_fill(self, keys: list, compute, ttl: int = None, stale_ttl: int = None) -> dict:
+        found = {}
+        try:
+            if stale_ttl:
+                stale = self._redis_get_many([STALE_PREFIX + key for key in keys])
+                found = {key: stale[STALE_PREFIX + key] for key in keys if STALE_PREFIX + key in stale}
+                cache_recomputes_counter.labels(outcome='stale').inc(len(found))
+            pending = [key for key in keys if key not in found]
+            deadline = time.monotonic() + Config.CACHE_LOCK_LEASE
+            while pending and time.monotonic() < deadline:
+                time.sleep(Config.CACHE_LOCK_POLL_INTERVAL)
+                since = self._invalidations
+                # Valores e locks na mesma leitura: lock liberado sem valor = nada a esperar
+                values = self._client.mget(pending + [LOCK_PREFIX + key for key in pending])
+                filled, released = {}, []
+                for key, value, lock in zip(pending, values, values[len(pending):]):
+                    decoded = self._decode(key, value) if value is not None else None
+                    if decoded is not None:
+                        filled[key] = decoded
+                    elif lock is None:
+                        released.append(key)
+                if filled:
+                    cache_recomputes_counter.labels(outcome='awaited').inc(len(filled))
+                    self._local_set_many(filled, since)
+                    found.update(filled)
+                pending = [key for key in pending if key not in filled]
+                if released and len(released) == len(pending):
+                    break
+        except redis.RedisError as e:
+            logging.error(f"Erro ao aguardar recomputação no Redis: {e}")
+            pending = [key for key in keys if key not in found]
+        if pending:
+            # Quem tinha o lease não preencheu (falhou, expirou ou o valor é None): calcula aqui
+            cache_recomputes_counter.labels(outcome='uncached').inc(len(pending))
+            found.update(self._compute(pending, compute, ttl, stale_ttl))
+        return found
@@ -0,0 +1,104 @@
+import json
+import zlib
+import logging
+from typing import Any
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+# Every value written to Redis starts with one header byte:
+#   high nibble = serializer, low nibble = compression.
+# Values written before the header existed are bare zlib streams, whose first
+# byte (CMF) is always 0x78; header bytes stay below 0x30 so the two can't be
+# confused and old entries keep decoding until they expire.
+TEXT, MSGPACK, JSON = 0x0, 0x1, 0x2
+NONE, ZLIB, ZSTD = 0x0, 0x1, 0x2
+LEGACY_ZLIB_MARKER = 0x78
+
+COMPRESSORS = {'none': NONE, 'zlib': ZLIB, 'zstd': ZSTD}
+
+class CodecError(ValueError):
+    pass
+
+class CacheCodec:
+    """Encodes cache values (str, or any msgpack/JSON-serializable object).
+
+    Strings are stored as UTF-8 text and come back as strings; other objects
+    are serialized with msgpack (JSON if msgpack is not installed) and come
+    back as objects, so callers no longer need a json.dumps/json.loads round
+    trip. Payloads smaller than min_size are stored uncompressed.
+    """
+
+    def __init__(self, compression: str = 'zstd', level: int = 3, min_size: int = 512):
+        if compression not in COMPRESSORS:
+            raise ValueError(f"Compressão de cache desconhecida: {compression}")
+        # Criado uma vez por processo (RedisCache): avisa em vez de degradar em silêncio
+        if compression == 'zstd' and not HAS_ZSTD:
+            logging.warning("CACHE_COMPRESSION='zstd', mas zstandard não está instalado; usando zlib")
+            compression = 'zlib'
+        if not HAS_MSGPACK:
+            logging.warning("msgpack não está instalado; valores do cache serializados como JSON")
+        self.compression = COMPRESSORS[compression]
+        self.level = level
+        self.min_size = min_size
+        if HAS_ZSTD:
+            self._zstd_c = zstandard.ZstdCompressor(level=level)
+            self._zstd_d = zstandard.ZstdDecompressor()
+
+    def encode(self, value: Any) -> bytes:
+        if isinstance(value, str):
+            serializer, payload = TEXT, value.encode()
+        elif HAS_MSGPACK:
+            serializer, payload = MSGPACK, msgpack.packb(value, use_bin_type=True)
+        else:
+            serializer, payload = JSON, json.dumps(value, separators=(',', ':')).encode()
+
+        compression = self.compression if len(payload) >= self.min_size else NONE
+        if compression == ZSTD:
+            payload = self._zstd_c.compress(payload)
+        elif compression == ZLIB:
+            payload = zlib.compress(payload, level=self.level)
+        return bytes(((serializer << 4) | compression,)) + payload
+
+    def decode(self, data: bytes) -> Any:
+        if not data:
+            raise CodecError("Valor de cache vazio")
+        header = data[0]
+        if header == LEGACY_ZLIB_MARKER:
+            try:
+                return zlib.decompress(data).decode()
+            except (zlib.error, UnicodeDecodeError) as e:
+                raise CodecError(f"Valor legado inválido: {e}") from e
+
+        serializer, compression = header >> 4, header & 0x0F
+        payload = memoryview(data)[1:]
+        try:
+            if compression == ZSTD:
+                if not HAS_ZSTD:
+                    raise CodecError("Valor comprimido com zstd, mas zstandard não está instalado")
+                payload = self._zstd_d.decompress(payload)
+            elif compression == ZLIB:
+                payload = zlib.decompress(payload)
+            elif compression != NONE:
+                raise CodecError(f"Compressão desconhecida no cabeçalho: {header:#04x}")
+
+            if serializer == TEXT:
+                return bytes(payload).decode()
+            if serializer == MSGPACK:
+                if not HAS_MSGPACK:
+                    raise CodecError("Valor serializado com msgpack, mas msgpack não está instalado")
+                return msgpack.unpackb(payload, raw=False)
+            if serializer == JSON:
+                return json.loads(bytes(payload))
+        except CodecError:
+            raise
+        except Exception as e:
+            raise CodecError(f"Valor de cache inválido: {e}") from e
+        raise CodecError(f"Serialização desconhecida no cabeçalho: {header:#04x}")
@@ -28,6 +28,14 @@ class Config:
     CACHE_MAX_SIZE: int = 1000
     CACHE_TTL: int = 3600
     COMPRESSION_LEVEL: int = 6
+    CACHE_COMPRESSION: str = os.getenv('CACHE_COMPRESSION', 'zstd')  # 'zstd', 'zlib' ou 'none' (zstd cai para zlib se não instalado)
+    CACHE_COMPRESS_MIN_BYTES: int = 512  # Valores menores são gravados sem compressão
+    CACHE_INVALIDATION_CHANNEL: str = 'endoflix:cache:invalidate'  # Pub/sub usado para invalidar o cache local dos workers
+    CACHE_EPOCH_KEY: str = 'endoflix:cache:epoch'  # Contador global de invalidações (detecta mensagens perdidas)
+    CACHE_EPOCH_POLL_INTERVAL: int = 5  # Intervalo (s) de verificação da época quando o pub/sub está silencioso
+    CACHE_LOCK_LEASE: int = 10  # Duração (s) do lock de recomputação de uma chave (single-flight)
+    CACHE_LOCK_POLL_INTERVAL: float = 0.05  # Intervalo (s) com que quem espera o lock verifica se a chave foi preenchida
+    CACHE_STALE_TTL: int = 300  # Por quanto tempo (s) após expirar uma cópia antiga pode ser servida enquanto outro processo recalcula
 
     # Paths
     FFPROBE_PATH: str = r"C:\Program Files\FFMPEG\bin\ffprobe.exe"
@@ -38,15 +46,95 @@ class Config:
     # Processing
     MAX_WORKERS: int = 8
     SNAPSHOT_WORKERS: int = 6
+    SNAPSHOT_QUEUE_MAX_JOBS: int = 32  # Uploads aguardando gravação; acima disso /save_snapshot responde 429
+    SNAPSHOT_QUEUE_MAX_BYTES: int = 256 * 1024 * 1024  # Bytes de imagens aguardando gravação
+    SNAPSHOT_MAX_UPLOAD_BYTES: int = 128 * 1024 * 1024  # Tamanho máximo de um upload de snapshots
+    SNAPSHOT_WRITE_BUFFER: int = 1024 * 1024  # Buffer de escrita por arquivo
+    SNAPSHOT_JOB_TTL: int = 3600  # Tempo (s) que o status de um job fica disponível
+    SNAPSHOT_JOB_HISTORY: int = 256  # Jobs mantidos em memória quando o Redis não tem o status
+    SNAPSHOT_RETRY_AFTER: int = 2  # Retry-After (s) das respostas 429
+    SNAPSHOT_BURST_MAX_FRAMES: int = 300  # Limite de quadros de um burst extraído no servidor
+    SNAPSHOT_BURST_QUALITY: int = 90  # For WebP
+    SNAPSHOT_BURST_TIMEOUT: int = 300  # Timeout (s) do ffmpeg de um burst
     CHUNK_SIZE: int = 4096  # Para leitura de arquivos
+    HASH_ALGORITHM: str = os.getenv('HASH_ALGORITHM', 'blake2b-sampled:1')  # Ver fingerprint.STRATEGIES
     BATCH_SIZE: int = 100   # Para processamento em lote
     QUEUE_MAX_SIZE: int = 1000  # Para backpressure
+    QUEUE_DEPTH: int = 16  # Tarefas em voo por pool de workers (mantém os workers ocupados sem enfileirar tudo)
 
     # Thumbnails
     THUMB_SIZE: int = 50
     THUMB_FORMAT: str = 'webp'
     THUMB_QUALITY: int = 80  # For WebP
     THUMB_EXTRACTION_POINT: float = 0.1  # 10% into video
-    THUMB_WORKERS: int = 4
+    THUMB_FAST_SEEK: bool = True  # Só o keyframe mais próximo, decodificado em resolução reduzida quando o codec permite (media_commands.py)
+    THUMB_WORKERS: int = 4  # Máximo de ffmpeg simultâneos; o controlador adaptativo reduz sob carga
+    THUMB_WORKERS_MIN: int = 1
+    THUMB_WORKER_METRICS_PORT: int = int(os.getenv('THUMB_WORKER_METRICS_PORT', '9101'))  # /metrics do thumbnail_worker.py (0 desativa)
     FFMPEG_TIMEOUT: int = 60  # Timeout for FFmpeg commands in seconds
-    THUMB_BATCH_SIZE: int = 100  # Process videos in batches of 100
\ No newline at end of file
+    THUMB_BATCH_SIZE: int = 100  # Process videos in batches of 100
+    THUMB_STORE_DIR: Path = Path(os.getenv('THUMB_STORE_DIR', 'thumbs'))  # Previews endereçados pelo hash do vídeo
+    THUMB_ORPHAN_GRACE_DAYS: int = 7  # Previews sem arquivo indexado só são removidos após esse prazo
+    THUMB_JOB_POLL_INTERVAL: float = 2  # Intervalo (s) com que o worker procura jobs na fila
+    THUMB_JOB_HEARTBEAT_TIMEOUT: int = 120  # Job 'running' sem heartbeat por esse tempo (s) é retomado por outro worker
+    THUMB_JOB_MAX_ATTEMPTS: int = 3  # Retomadas após falha do worker antes de o job ser marcado como 'failed'
+    SPRITE_FRAMES: int = 20  # Quadros por sprite de pré-visualização (scrub); 0 desativa os sprites
+    SPRITE_COLUMNS: int = 5  # Quadros por linha do sprite
+    SPRITE_TILE_WIDTH: int = 160  # Largura (px) de cada quadro; a altura segue 16:9
+    SPRITE_QUALITY: int = 70  # For WebP
+    SPRITE_KEYFRAMES_ONLY: bool = True  # Decodifica só keyframes: bem mais rápido, quadros vizinhos podem se repetir
+    SPRITE_TIMEOUT: int = 300  # O sprite decodifica o vídeo inteiro; timeout maior que o do thumbnail
+    SPRITE_CACHE_MAX_AGE: int = 365 * 24 * 3600  # Cache-Control dos sprites (URL endereçada pelo conteúdo)
+
+    # Controle adaptativo de concorrência dos jobs de mídia (load_controller.py)
+    LOAD_SAMPLE_INTERVAL: float = 1.0  # Intervalo mínimo (s) entre amostras de carga
+    LOAD_CPU_HIGH: float = 85.0  # % de CPU acima da qual a concorrência cai
+    LOAD_CPU_LOW: float = 60.0  # Abaixo disso (e dos demais limites baixos) a concorrência sobe
+    LOAD_IOWAIT_HIGH: float = 20.0
+    LOAD_IOWAIT_LOW: float = 10.0
+    LOAD_PER_CPU_HIGH: float = 1.5  # Load average de 1 minuto por núcleo
+    LOAD_PER_CPU_LOW: float = 1.0
+    LOAD_MEMORY_HIGH: float = 85.0
+    MEDIA_NICE: int = 10  # Incremento de nice do ffmpeg de thumbnails/sprites
+    MEDIA_IONICE_IDLE: bool = True  # ffmpeg em classe de IO idle (Linux, requer psutil)
+
+    # Playlists API
+    PLAYLIST_PAGE_SIZE: int = 50  # Itens por página quando há paginação por cursor em /playlists
+    PLAYLIST_PAGE_MAX: int = 500  # Limite máximo aceito em ?limit=
+
+    # Streaming
+    STREAM_CHUNK_SIZE: int = 256 * 1024  # Bytes por leitura/escrita ao servir vídeo
+    STREAM_MAX_RANGE_BYTES: int = 8 * 1024 * 1024  # Limite para ranges abertos (bytes=N-)
+    STREAM_MAX_RANGES: int = 8  # Máximo de intervalos em multipart/byteranges
+    STREAM_USE_SENDFILE: bool = True  # Usa wsgi.file_wrapper (sendfile no gunicorn) quando disponível
+
+    # Async serving (asgi.py): /video e /scan no event loop, o resto no Flask
+    SERVER_MODE: str = os.getenv('SERVER_MODE', 'wsgi')  # 'wsgi' (gunicorn sync, main:app) ou 'asgi' (uvicorn, asgi:app)
+    ASGI_WORKERS: int = int(os.getenv('ASGI_WORKERS', '2'))  # Processos uvicorn no modo asgi
+    ASGI_IO_THREADS: int = 32  # Threads de leitura de arquivo por processo (open/seek/read fora do event loop)
+    ASGI_WSGI_THREADS: int = 16  # Threads que executam as rotas Flask no modo asgi
+    ASGI_SCAN_THREADS: int = 4  # Varreduras /scan simultâneas por processo
+    ASGI_SCAN_QUEUE: int = 64  # Eventos SSE da varredura aguardando envio ao cliente
+
+    # View accounting
+    VIEW_DEDUP_WINDOW: int = 1800  # Janela (s) em que requisições do mesmo playback contam como uma visualização
+    VIEW_DEDUP_MAX_SIZE: int = 10000  # Entradas no cache local de deduplicação
+    VIEW_FLUSH_INTERVAL: int = 10  # Intervalo (s) entre gravações em lote no banco
+    VIEW_EVENT_BUFFER_MAX: int = 50000  # Eventos de reprodução mantidos em memória enquanto o banco não responde
+    VIEW_EVENT_RETENTION_DAYS: int = 30  # Partições diárias de endoflix_view_events mais antigas são removidas
+    VIEW_HOURLY_RETENTION_DAYS: int = 14  # Retenção do rollup por hora
+    VIEW_DAILY_RETENTION_DAYS: int = 730  # Retenção do rollup por dia
+    VIEW_PARTITIONS_AHEAD_DAYS: int = 7  # Partições criadas com antecedência
+    VIEW_PARTITION_MAINTENANCE_INTERVAL: int = 3600  # Intervalo (s) da manutenção de partições pela thread de gravação de views
+
+    # Analytics
+    ANALYTICS_REFRESH_INTERVAL: int = 600  # Intervalo (s) entre atualizações de mv_analytics_stats e verificação dos rollups
+    ANALYTICS_LIST_LIMIT: int = 50  # Playlists e sessões recentes listadas em /analytics
+
+    # Scanning
+    SCAN_INCREMENTAL: bool = True  # Reaproveita o manifesto (path, size, mtime_ns, inode) para pular arquivos inalterados
+    INGEST_BATCH_SIZE: int = 500  # Linhas por lote gravado no banco durante a varredura
+    SCAN_HASH_WORKERS: int = 4  # Threads do estágio de hash
+    SCAN_PROBE_WORKERS: int = 8  # Processos do estágio de ffprobe
+    FFPROBE_TIMEOUT: int = 30  # Timeout (s) de cada execução do ffprobe
+    SCAN_QUEUE_DEPTH: int = 32  # Arquivos em voo por estágio do pipeline de varredura
@@ -1,4 +1,5 @@
 
+import threading
 import psycopg2.pool
 from contextlib import contextmanager
 from config import Config
@@ -6,6 +7,7 @@ from config import Config
 class Database:
     _instance = None
     _pool = None
+    _lock = threading.Lock()
 
     def __new__(cls):
         if cls._instance is None:
@@ -13,13 +15,16 @@ class Database:
         return cls._instance
 
     def __init__(self):
-        if self._pool is None:
-            config = Config()
-            self._pool = psycopg2.pool.SimpleConnectionPool(
-                config.DB_POOL_MIN,
-                config.DB_POOL_MAX,
-                **config.DB_PARAMS
-            )
+        with self._lock:
+            if self._pool is None:
+                config = Config()
+                # Compartilhado entre threads: rotas Flask no modo asgi, flusher de views,
+                # refresher de analytics e heartbeat de jobs
+                self._pool = psycopg2.pool.ThreadedConnectionPool(
+                    config.DB_POOL_MIN,
+                    config.DB_POOL_MAX,
+                    **config.DB_PARAMS
+                )
 
     @contextmanager
     def get_connection(self):
@@ -1,5 +1,9 @@
 -- PostgreSQL Query Optimizations for EndoFlix
 -- Run these commands to improve query performance
+-- (python apply_db_optimizations.py applies this file)
+
+-- Required by the trigram index below
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- Indexes for endoflix_files table
 CREATE INDEX IF NOT EXISTS idx_endoflix_files_file_path ON endoflix_files(file_path);
@@ -9,6 +13,17 @@ CREATE INDEX IF NOT EXISTS idx_endoflix_files_view_count ON endoflix_files(view_
 CREATE INDEX IF NOT EXISTS idx_endoflix_files_size_bytes ON endoflix_files(size_bytes);
 CREATE INDEX IF NOT EXISTS idx_endoflix_files_file_path_size ON endoflix_files(file_path, size_bytes);
 
+-- Unique file_path, required by the batched upserts (ON CONFLICT (file_path)).
+-- Older scans could insert the same path twice; keep the most recent row.
+DELETE FROM endoflix_files a USING endoflix_files b
+WHERE a.file_path = b.file_path AND a.id < b.id;
+CREATE UNIQUE INDEX IF NOT EXISTS ux_endoflix_files_file_path ON endoflix_files(file_path);
+
+-- Fingerprint algorithm/version stored next to hash_id (see fingerprint.py).
+-- Rows hashed before this column existed used the original SHA-256 head+middle scheme.
+ALTER TABLE endoflix_files ADD COLUMN IF NOT EXISTS hash_algo TEXT NOT NULL DEFAULT 'sha256-headmid:1';
+CREATE INDEX IF NOT EXISTS idx_endoflix_files_hash_algo_hash_id ON endoflix_files(hash_algo, hash_id);
+
 -- Composite index for LIKE queries on file_path
 CREATE INDEX IF NOT EXISTS idx_endoflix_files_file_path_gin ON endoflix_files USING gin (file_path gin_trgm_ops);
 
@@ -66,4 +81,281 @@ $$ LANGUAGE plpgsql;
 -- Use: SELECT * FROM v_top_videos;
 
 -- For file type stats, use the view instead of processing in Python
--- SELECT * FROM v_file_types;
\ No newline at end of file
+-- SELECT * FROM v_file_types;
+
+-- Scan manifest: (path, size, mtime_ns, inode) seen by the last scan.
+-- Incremental scans resolve unchanged files from here without reading them.
+CREATE TABLE IF NOT EXISTS endoflix_scan_manifest (
+    file_path TEXT PRIMARY KEY,
+    size_bytes BIGINT NOT NULL,
+    mtime_ns BIGINT NOT NULL,
+    inode BIGINT NOT NULL,
+    hash_id TEXT,
+    scanned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_endoflix_scan_manifest_prefix ON endoflix_scan_manifest(file_path text_pattern_ops);
+
+-- ffprobe results keyed by (path, size, mtime). A record is reused only while
+-- the file keeps the same size and mtime; see services/metadata_service.py.
+CREATE TABLE IF NOT EXISTS endoflix_media_probe (
+    file_path TEXT PRIMARY KEY,
+    size_bytes BIGINT NOT NULL,
+    mtime DOUBLE PRECISION NOT NULL,
+    probe JSONB NOT NULL,
+    probed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Ordered playlist items (replaces the endoflix_playlist.files array).
+-- Positions are gapped (multiples of 1024) so a reorder rewrites one row.
+CREATE TABLE IF NOT EXISTS endoflix_playlist_item (
+    playlist_id INTEGER NOT NULL REFERENCES endoflix_playlist(id) ON DELETE CASCADE,
+    file_path TEXT NOT NULL,
+    position BIGINT NOT NULL,
+    PRIMARY KEY (playlist_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_endoflix_playlist_item_file ON endoflix_playlist_item(playlist_id, file_path);
+
+-- One-shot migration of existing arrays. Playlists written by older code
+-- after this runs are migrated lazily the next time they are touched
+-- (playlist_items.migrate_legacy_files), so the array is left empty, not dropped.
+WITH legacy AS (
+    SELECT id, files FROM endoflix_playlist WHERE cardinality(files) > 0 FOR UPDATE
+), moved AS (
+    UPDATE endoflix_playlist p SET files = '{}'
+    FROM legacy WHERE p.id = legacy.id
+    RETURNING legacy.id, legacy.files
+)
+INSERT INTO endoflix_playlist_item (playlist_id, file_path, position)
+SELECT m.id, u.file_path, COALESCE(b.last, 0) + u.ord * 1024
+FROM moved m
+CROSS JOIN LATERAL unnest(m.files) WITH ORDINALITY AS u(file_path, ord)
+LEFT JOIN LATERAL (
+    SELECT MAX(position) AS last FROM endoflix_playlist_item WHERE playlist_id = m.id
+) b ON TRUE;
+
+-- Analytics rollups: item counts per (dimension, value), maintained by
+-- statement-level triggers so /analytics and /stats never scan the library.
+--   endoflix_files    -> videos, extension, video_codec, resolution, orientation
+--   endoflix_playlist -> playlists ('saved' / 'temp')
+--   endoflix_session  -> sessions, player_slot (sessions using player 1..4)
+-- TRUNCATE bypasses the triggers; the periodic refresh (services/analytics_service.py)
+-- compares the rollup with mv_analytics_stats and rebuilds it on drift.
+CREATE TABLE IF NOT EXISTS endoflix_analytics_rollup (
+    dimension TEXT NOT NULL,
+    value TEXT NOT NULL,
+    item_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (dimension, value)
+);
+
+-- Extension with the leading dot, as pathlib's Path.suffix ('' when there is none)
+CREATE OR REPLACE FUNCTION endoflix_file_dimensions(f endoflix_files)
+RETURNS TABLE(dimension TEXT, value TEXT) AS $$
+    VALUES
+        ('videos', ''),
+        ('extension', COALESCE(lower(substring(f.file_path from '(\.[^./\\]+)$')), '')),
+        ('video_codec', COALESCE(f.video_codec, 'unknown')),
+        ('resolution', COALESCE(f.resolution, 'unknown')),
+        ('orientation', COALESCE(f.orientation, 'unknown'))
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION endoflix_playlist_dimensions(p endoflix_playlist)
+RETURNS TABLE(dimension TEXT, value TEXT) AS $$
+    VALUES ('playlists', CASE WHEN p.is_temp THEN 'temp' ELSE 'saved' END)
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION endoflix_session_dimensions(s endoflix_session)
+RETURNS TABLE(dimension TEXT, value TEXT) AS $$
+    SELECT 'sessions', ''
+    UNION ALL
+    SELECT 'player_slot', slot::text FROM generate_series(1, 4) AS slot WHERE COALESCE(s.videos[slot], '') <> ''
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Trigger function shared by the three tables; TG_ARGV[0] is the dimensions function.
+-- An UPDATE that leaves every dimension unchanged nets to zero and writes nothing.
+CREATE OR REPLACE FUNCTION endoflix_rollup_apply()
+RETURNS trigger AS $$
+DECLARE
+    source TEXT;
+BEGIN
+    source := CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT r, 1 FROM new_rows r'
+        WHEN 'DELETE' THEN 'SELECT r, -1 FROM old_rows r'
+        ELSE 'SELECT r, -1 FROM old_rows r UNION ALL SELECT r, 1 FROM new_rows r'
+    END;
+    EXECUTE format($sql$
+        INSERT INTO endoflix_analytics_rollup (dimension, value, item_count)
+        SELECT d.dimension, d.value, SUM(c.n)
+        FROM (%s) AS c(r, n)
+        CROSS JOIN LATERAL %I(c.r) AS d
+        GROUP BY d.dimension, d.value
+        HAVING SUM(c.n) <> 0
+        ORDER BY d.dimension, d.value
+        ON CONFLICT (dimension, value) DO UPDATE
+            SET item_count = endoflix_analytics_rollup.item_count + EXCLUDED.item_count
+    $sql$, source, TG_ARGV[0]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables allow a single event per trigger, hence three per table
+DROP TRIGGER IF EXISTS trg_endoflix_files_rollup_ins ON endoflix_files;
+DROP TRIGGER IF EXISTS trg_endoflix_files_rollup_upd ON endoflix_files;
+DROP TRIGGER IF EXISTS trg_endoflix_files_rollup_del ON endoflix_files;
+CREATE TRIGGER trg_endoflix_files_rollup_ins AFTER INSERT ON endoflix_files
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION endoflix_rollup_apply('endoflix_file_dimensions');
+CREATE TRIGGER trg_endoflix_files_rollup_upd AFTER UPDATE ON endoflix_files
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION endoflix_rollup_apply('endoflix_file_dimensions');
+CREATE TRIGGER trg_endoflix_files_rollup_del AFTER DELETE ON endoflix_files
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION endoflix_rollup_apply('endoflix_file_dimensions');
+
+DROP TRIGGER IF EXISTS trg_endoflix_playlist_rollup_ins ON endoflix_playlist;
+DROP TRIGGER IF EXISTS trg_endoflix_playlist_rollup_upd ON endoflix_playlist;
+DROP TRIGGER IF EXISTS trg_endoflix_playlist_rollup_del ON endoflix_playlist;
+CREATE TRIGGER trg_endoflix_playlist_rollup_ins AFTER INSERT ON endoflix_playlist
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION endoflix_rollup_apply('endoflix_playlist_dimensions');
+CREATE TRIGGER trg_endoflix_playlist_rollup_upd AFTER UPDATE ON endoflix_playlist
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION endoflix_rollup_apply('endoflix_playlist_dimensions');
+CREATE TRIGGER trg_endoflix_playlist_rollup_del AFTER DELETE ON endoflix_playlist
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION endoflix_rollup_apply('endoflix_playlist_dimensions');
+
+DROP TRIGGER IF EXISTS trg_endoflix_session_rollup_ins ON endoflix_session;
+DROP TRIGGER IF EXISTS trg_endoflix_session_rollup_upd ON endoflix_session;
+DROP TRIGGER IF EXISTS trg_endoflix_session_rollup_del ON endoflix_session;
+CREATE TRIGGER trg_endoflix_session_rollup_ins AFTER INSERT ON endoflix_session
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION endoflix_rollup_apply('endoflix_session_dimensions');
+CREATE TRIGGER trg_endoflix_session_rollup_upd AFTER UPDATE ON endoflix_session
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION endoflix_rollup_apply('endoflix_session_dimensions');
+CREATE TRIGGER trg_endoflix_session_rollup_del AFTER DELETE ON endoflix_session
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION endoflix_rollup_apply('endoflix_session_dimensions');
+
+-- Full recount. Blocks writers to the three tables while it runs.
+CREATE OR REPLACE FUNCTION rebuild_analytics_rollup()
+RETURNS void AS $$
+BEGIN
+    LOCK TABLE endoflix_files, endoflix_playlist, endoflix_session IN SHARE MODE;
+    DELETE FROM endoflix_analytics_rollup;
+    INSERT INTO endoflix_analytics_rollup (dimension, value, item_count)
+    SELECT d.dimension, d.value, COUNT(*) FROM endoflix_files f CROSS JOIN LATERAL endoflix_file_dimensions(f) d GROUP BY 1, 2
+    UNION ALL
+    SELECT d.dimension, d.value, COUNT(*) FROM endoflix_playlist p CROSS JOIN LATERAL endoflix_playlist_dimensions(p) d GROUP BY 1, 2
+    UNION ALL
+    SELECT d.dimension, d.value, COUNT(*) FROM endoflix_session s CROSS JOIN LATERAL endoflix_session_dimensions(s) d GROUP BY 1, 2;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT rebuild_analytics_rollup();
+
+-- Playback events: append-only, one partition per day (partitions are created
+-- ahead and dropped after VIEW_EVENT_RETENTION_DAYS by maintain_view_events,
+-- which the ViewRecorder flusher runs every VIEW_PARTITION_MAINTENANCE_INTERVAL).
+-- views = 1 for the event that starts a playback, 0 for progress reports.
+CREATE TABLE IF NOT EXISTS endoflix_view_events (
+    file_id INTEGER NOT NULL,
+    session_id TEXT,
+    player_slot SMALLINT,
+    started_at TIMESTAMP NOT NULL,
+    views SMALLINT NOT NULL DEFAULT 0,
+    watched_seconds REAL NOT NULL DEFAULT 0
+) PARTITION BY RANGE (started_at);
+CREATE INDEX IF NOT EXISTS idx_endoflix_view_events_file ON endoflix_view_events (file_id, started_at);
+-- Safety net: events outside every daily partition (maintenance late) land here
+-- instead of failing the insert; maintain_view_events moves them out.
+CREATE TABLE IF NOT EXISTS endoflix_view_events_default PARTITION OF endoflix_view_events DEFAULT;
+
+-- Downsampled rollups, written in the same statement as the events.
+-- Hourly buckets answer "last N hours"; daily ones (per player slot, 0 = unknown)
+-- answer "this week"/"this month" and outlive the raw events.
+CREATE TABLE IF NOT EXISTS endoflix_view_hourly (
+    bucket TIMESTAMP NOT NULL,
+    file_id INTEGER NOT NULL,
+    views INTEGER NOT NULL DEFAULT 0,
+    watched_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, file_id)
+);
+CREATE TABLE IF NOT EXISTS endoflix_view_daily (
+    day DATE NOT NULL,
+    file_id INTEGER NOT NULL,
+    player_slot SMALLINT NOT NULL DEFAULT 0,
+    views INTEGER NOT NULL DEFAULT 0,
+    watched_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, file_id, player_slot)
+);
+
+-- Creates the partitions from yesterday to ahead_days from now (plus the days
+-- that have rows waiting in the default partition), drops event partitions
+-- older than retention_days and prunes expired rollup rows. A day's rows are
+-- moved out of the default partition before its partition is attached.
+CREATE OR REPLACE FUNCTION maintain_view_events(retention_days INTEGER, hourly_days INTEGER, daily_days INTEGER, ahead_days INTEGER)
+RETURNS void AS $$
+DECLARE
+    d DATE;
+    part_name TEXT;
+    part RECORD;
+BEGIN
+    DELETE FROM endoflix_view_events_default WHERE started_at < CURRENT_DATE - retention_days;
+    FOR d IN
+        SELECT generate_series(CURRENT_DATE - 1, CURRENT_DATE + ahead_days, interval '1 day')::date
+        UNION
+        SELECT DISTINCT started_at::date FROM endoflix_view_events_default
+    LOOP
+        part_name := 'endoflix_view_events_' || to_char(d, 'YYYYMMDD');
+        CONTINUE WHEN to_regclass(part_name) IS NOT NULL;
+        EXECUTE format('CREATE TABLE %I (LIKE endoflix_view_events INCLUDING DEFAULTS)', part_name);
+        EXECUTE format(
+            'WITH moved AS (DELETE FROM endoflix_view_events_default WHERE started_at >= %L AND started_at < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+            d, d + 1, part_name
+        );
+        EXECUTE format('ALTER TABLE endoflix_view_events ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', part_name, d, d + 1);
+    END LOOP;
+    FOR part IN
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'endoflix_view_events'::regclass
+          AND c.relname ~ '^endoflix_view_events_[0-9]{8}$'
+          AND to_date(right(c.relname, 8), 'YYYYMMDD') < CURRENT_DATE - retention_days
+    LOOP
+        EXECUTE format('DROP TABLE %I', part.relname);
+    END LOOP;
+    DELETE FROM endoflix_view_hourly WHERE bucket < CURRENT_DATE - hourly_days;
+    DELETE FROM endoflix_view_daily WHERE day < CURRENT_DATE - daily_days;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Same values as Config.VIEW_EVENT_RETENTION_DAYS, VIEW_HOURLY_RETENTION_DAYS,
+-- VIEW_DAILY_RETENTION_DAYS and VIEW_PARTITIONS_AHEAD_DAYS
+SELECT maintain_view_events(30, 14, 730, 7);
+
+-- Thumbnail generation jobs (services/thumbnail_jobs.py, run by thumbnail_worker.py).
+-- At most one queued or running job per playlist. A running job whose
+-- heartbeat stops (worker crashed or was recycled) is claimed again and
+-- resumes from the videos that still have no thumbnail.
+CREATE TABLE IF NOT EXISTS endoflix_thumbnail_job (
+    id BIGSERIAL PRIMARY KEY,
+    playlist_name TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed', 'cancelled')),
+    total INTEGER NOT NULL DEFAULT 0,
+    generated INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+    worker TEXT,
+    message TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    heartbeat_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_endoflix_thumbnail_job_active
+    ON endoflix_thumbnail_job (playlist_name) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_endoflix_thumbnail_job_pending
+    ON endoflix_thumbnail_job (created_at) WHERE status IN ('queued', 'running');
+
+-- Content-addressed previews (see services/thumbnail_store.py). Files live at
+-- THUMB_STORE_DIR/<kind>/<ab>/<cd>/<hash_id>.webp; a row exists only once the
+-- file is complete. Videos sharing a fingerprint share their previews.
+CREATE TABLE IF NOT EXISTS endoflix_thumbnail (
+    hash_id TEXT NOT NULL,
+    kind TEXT NOT NULL CHECK (kind IN ('thumb', 'sprite')),
+    size_bytes BIGINT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (hash_id, kind)
+);
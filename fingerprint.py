@@ -0,0 +1,80 @@
+import os
+import hashlib
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+try:
+    import xxhash
+    HAS_XXHASH = True
+except ImportError:
+    HAS_XXHASH = False
+try:
+    import blake3
+    HAS_BLAKE3 = True
+except ImportError:
+    HAS_BLAKE3 = False
+
+MB = 1024 * 1024
+
+@dataclass(frozen=True)
+class FingerprintStrategy:
+    """A versioned (hash function, sampling scheme) pair.
+
+    The name stored in endoflix_files.hash_algo identifies the strategy, so
+    its parameters must never change; add a new version instead.
+    """
+    name: str
+    hasher: Callable[[], object]
+    sampler: Callable[[int], List[Tuple[int, int]]]
+    include_size: bool = True
+
+def legacy_samples(size: int) -> List[Tuple[int, int]]:
+    """Original scheme: first 2 MB plus 2 MB from the middle when the file exceeds 4 MB."""
+    samples = [(0, min(size, 2 * MB))]
+    if size > 4 * MB:
+        samples.append((size // 2, 2 * MB))
+    return samples
+
+def head_mid_tail_samples(block: int) -> Callable[[int], List[Tuple[int, int]]]:
+    """Head, middle and tail blocks; small files are read whole."""
+    def sampler(size: int) -> List[Tuple[int, int]]:
+        if size <= 3 * block:
+            return [(0, size)]
+        return [(0, block), (size // 2 - block // 2, block), (size - block, block)]
+    return sampler
+
+STRATEGIES: Dict[str, FingerprintStrategy] = {
+    'sha256-headmid:1': FingerprintStrategy('sha256-headmid:1', hashlib.sha256, legacy_samples, include_size=False),
+    'blake2b-sampled:1': FingerprintStrategy('blake2b-sampled:1', lambda: hashlib.blake2b(digest_size=32), head_mid_tail_samples(1 * MB)),
+}
+if HAS_XXHASH:
+    STRATEGIES['xxh3-sampled:1'] = FingerprintStrategy('xxh3-sampled:1', xxhash.xxh3_128, head_mid_tail_samples(1 * MB))
+if HAS_BLAKE3:
+    STRATEGIES['blake3-sampled:1'] = FingerprintStrategy('blake3-sampled:1', blake3.blake3, head_mid_tail_samples(1 * MB))
+
+def get_strategy(name: str) -> FingerprintStrategy:
+    try:
+        return STRATEGIES[name]
+    except KeyError:
+        raise ValueError(f"Algoritmo de fingerprint desconhecido ou indisponível: {name}")
+
+def fingerprint_file(file_path, algorithm: str) -> str:
+    """Hash the sampled regions of file_path with one large read per region."""
+    strategy = get_strategy(algorithm)
+    hasher = strategy.hasher()
+    with open(file_path, 'rb', buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if strategy.include_size:
+            hasher.update(size.to_bytes(8, 'little'))
+        samples = strategy.sampler(size)
+        buffer = bytearray(max((length for _, length in samples), default=0))
+        view = memoryview(buffer)
+        for offset, length in samples:
+            f.seek(offset)
+            read = 0
+            while read < length:
+                n = f.readinto(view[read:length])
+                if not n:
+                    break
+                read += n
+            hasher.update(view[:read])
+    return hasher.hexdigest()
@@ -0,0 +1,25 @@
+# Configuração do gunicorn (Dockerfile). SERVER_MODE escolhe o servidor:
+#   wsgi - workers sync com o app Flask (main:app); cada vídeo/SSE aberto ocupa um worker
+#   asgi - workers uvicorn com asgi:app; /video e /scan no event loop, demais rotas no Flask
+from config import Config
+
+bind = '0.0.0.0:5000'
+keepalive = 5
+loglevel = 'info'
+accesslog = '-'
+errorlog = '-'
+
+if Config.SERVER_MODE == 'asgi':
+    wsgi_app = 'asgi:app'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    workers = Config.ASGI_WORKERS
+    # Reciclar o worker derrubaria todas as transmissões abertas nele
+    max_requests = 0
+    graceful_timeout = 30
+else:
+    wsgi_app = 'main:app'
+    worker_class = 'sync'
+    workers = 4
+    worker_connections = 1000
+    max_requests = 1000
+    max_requests_jitter = 50
@@ -0,0 +1,182 @@
+import time
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from psycopg2.extras import execute_values
+from prometheus_flask_exporter import Counter, Gauge, Histogram
+from config import Config
+from playlist_items import append_items_by_name, insert_items_at_by_name
+
+# Prometheus metrics for scan ingestion
+ingest_rows_counter = Counter('ingest_rows', 'Rows written by the scan ingestion stage', ['table'])
+ingest_rows_per_second = Gauge('ingest_rows_per_second', 'Throughput of the last ingestion flush')
+ingest_flush_seconds = Histogram('ingest_flush_seconds', 'Duration of ingestion flushes')
+
+FILE_COLUMNS = (
+    "hash_id", "hash_algo", "file_path", "size_bytes", "created_at", "modified_at", "video_codec",
+    "resolution", "orientation", "duration_seconds", "view_count", "last_viewed_at", "is_favorite"
+)
+
+UPSERT_FILES_SQL = f"""
+    INSERT INTO endoflix_files ({', '.join(FILE_COLUMNS)})
+    VALUES %s
+    ON CONFLICT (file_path) DO UPDATE SET
+        hash_id = EXCLUDED.hash_id,
+        hash_algo = EXCLUDED.hash_algo,
+        size_bytes = EXCLUDED.size_bytes,
+        modified_at = EXCLUDED.modified_at,
+        video_codec = EXCLUDED.video_codec,
+        resolution = EXCLUDED.resolution,
+        orientation = EXCLUDED.orientation,
+        duration_seconds = EXCLUDED.duration_seconds,
+        view_count = endoflix_files.view_count + EXCLUDED.view_count,
+        last_viewed_at = GREATEST(endoflix_files.last_viewed_at, EXCLUDED.last_viewed_at)
+"""
+
+UPSERT_MANIFEST_SQL = """
+    INSERT INTO endoflix_scan_manifest (file_path, size_bytes, mtime_ns, inode, hash_id)
+    VALUES %s
+    ON CONFLICT (file_path) DO UPDATE SET
+        size_bytes = EXCLUDED.size_bytes,
+        mtime_ns = EXCLUDED.mtime_ns,
+        inode = EXCLUDED.inode,
+        hash_id = EXCLUDED.hash_id,
+        scanned_at = CURRENT_TIMESTAMP
+"""
+
+def file_row(file_data: Dict[str, Any]) -> Tuple:
+    # Linhas montadas antes da coluna hash_algo usam o algoritmo configurado
+    return tuple(file_data.get(column, Config.HASH_ALGORITHM) if column == "hash_algo" else file_data[column]
+                 for column in FILE_COLUMNS)
+
+def upsert_files(cur, rows: List[Dict[str, Any]]) -> int:
+    """Upsert endoflix_files rows keyed by file_path (last row wins within a batch)."""
+    unique = {file_data["file_path"]: file_row(file_data) for file_data in rows}
+    if unique:
+        execute_values(cur, UPSERT_FILES_SQL, list(unique.values()), page_size=Config.INGEST_BATCH_SIZE)
+    return len(unique)
+
+def save_scan_manifest(conn, rows: Iterable[Tuple], commit: bool = True) -> int:
+    """Upsert (file_path, size_bytes, mtime_ns, inode, hash_id) rows."""
+    unique = {row[0]: row for row in rows}
+    if not unique:
+        return 0
+    with conn.cursor() as cur:
+        execute_values(cur, UPSERT_MANIFEST_SQL, list(unique.values()), page_size=Config.INGEST_BATCH_SIZE)
+    if commit:
+        conn.commit()
+    return len(unique)
+
+class BatchIngestor:
+    """Buffers scan results and writes them with one round-trip per table per batch.
+
+    File rows are upserted with execute_values, the temp playlist's items are
+    appended once per batch and manifest rows are written alongside, all in a
+    single transaction. Items added with an `order` (the walk index) are
+    placed by it, so the playlist keeps folder order whatever order the
+    pipeline finishes files in. A batch the database rejects is retried one path per
+    transaction, so only the offending rows are dropped; they are reported by
+    pop_errors() as (file_path, message).
+    """
+
+    def __init__(self, conn, temp_playlist_name: Optional[str] = None, batch_size: Optional[int] = None):
+        self.conn = conn
+        self.temp_playlist_name = temp_playlist_name
+        self.batch_size = batch_size or Config.INGEST_BATCH_SIZE
+        self._files: List[Dict[str, Any]] = []
+        self._playlist_paths: List[Tuple[Optional[int], str]] = []
+        self._manifest_rows: List[Tuple] = []
+        self._errors: List[Tuple[str, str]] = []
+        self.total_rows = 0
+        self.total_seconds = 0.0
+
+    def add_file(self, file_data: Dict[str, Any], manifest_row: Optional[Tuple] = None, order: Optional[int] = None):
+        self._files.append(file_data)
+        self._playlist_paths.append((order, file_data["file_path"]))
+        if manifest_row:
+            self._manifest_rows.append(manifest_row)
+        self._maybe_flush()
+
+    def add_existing(self, file_path: str, manifest_row: Optional[Tuple] = None, order: Optional[int] = None):
+        """Register an already indexed file (only playlist/manifest need writing)."""
+        self._playlist_paths.append((order, file_path))
+        if manifest_row:
+            self._manifest_rows.append(manifest_row)
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if max(len(self._files), len(self._playlist_paths), len(self._manifest_rows)) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> int:
+        if not (self._files or self._playlist_paths or self._manifest_rows):
+            return 0
+        files, paths, manifest = self._files, self._playlist_paths, self._manifest_rows
+        self._files, self._playlist_paths, self._manifest_rows = [], [], []
+
+        start = time.perf_counter()
+        try:
+            written = self._write(files, paths, manifest)
+        except Exception as e:
+            self.conn.rollback()
+            logging.error(f"Erro ao gravar lote de {len(files)} arquivos, gravando um a um: {e}")
+            written = self._write_each(files, paths, manifest)
+
+        elapsed = time.perf_counter() - start
+        self.total_rows += written
+        self.total_seconds += elapsed
+        ingest_rows_counter.labels(table='endoflix_files').inc(written)
+        ingest_rows_counter.labels(table='endoflix_scan_manifest').inc(len(manifest))
+        ingest_flush_seconds.observe(elapsed)
+        if elapsed > 0 and written:
+            ingest_rows_per_second.set(written / elapsed)
+        logging.info(f"Lote gravado: {written} arquivos, {len(paths)} entradas de playlist em {elapsed:.3f}s")
+        return written
+
+    def _write(self, files: List[Dict[str, Any]], paths: List[Tuple[Optional[int], str]], manifest: List[Tuple]) -> int:
+        with self.conn.cursor() as cur:
+            written = upsert_files(cur, files)
+            if paths and self.temp_playlist_name:
+                insert_items_at_by_name(cur, self.temp_playlist_name, [(order, path) for order, path in paths if order is not None])
+                append_items_by_name(cur, self.temp_playlist_name, [path for order, path in paths if order is None])
+            if manifest:
+                # Manifesto é opcional (tabela pode não existir ainda); não descarta os arquivos
+                cur.execute("SAVEPOINT scan_manifest")
+                try:
+                    save_scan_manifest(self.conn, manifest, commit=False)
+                except Exception as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT scan_manifest")
+                    logging.warning(f"Não foi possível atualizar o manifesto de varredura: {e}")
+        self.conn.commit()
+        return written
+
+    def _write_each(self, files: List[Dict[str, Any]], paths: List[Tuple[Optional[int], str]], manifest: List[Tuple]) -> int:
+        # Uma transação por caminho: a linha inválida é descartada, as demais gravadas
+        files_by_path = {file_data["file_path"]: file_data for file_data in files}
+        manifest_by_path = {row[0]: row for row in manifest}
+        written = 0
+        for order, path in dict.fromkeys(paths):
+            file_data = files_by_path.get(path)
+            row = manifest_by_path.get(path)
+            try:
+                written += self._write([file_data] if file_data else [], [(order, path)], [row] if row else [])
+            except Exception as e:
+                self.conn.rollback()
+                logging.error(f"Erro ao gravar {path}: {e}")
+                self._errors.append((path, str(e)))
+        return written
+
+    def pop_errors(self) -> List[Tuple[str, str]]:
+        """(file_path, message) of rows dropped since the last call."""
+        errors, self._errors = self._errors, []
+        return errors
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.total_rows / self.total_seconds if self.total_seconds else 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
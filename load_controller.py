@@ -0,0 +1,111 @@
+import os
+import time
+import subprocess
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+from prometheus_flask_exporter import Gauge
+from config import Config
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+media_job_concurrency = Gauge('media_job_concurrency', 'Concurrent ffmpeg jobs allowed by the adaptive controller', ['pool'])
+
+@dataclass
+class LoadSample:
+    cpu: float  # % de CPU ocupada desde a amostra anterior
+    iowait: float  # % de tempo em IO wait desde a amostra anterior
+    load_per_cpu: float  # load average de 1 minuto / núcleos
+    memory: float  # % de memória em uso
+
+def sample_load() -> Optional[LoadSample]:
+    """Non-blocking sample; CPU and IO wait are averaged since the previous call."""
+    load_per_cpu = os.getloadavg()[0] / (os.cpu_count() or 1) if hasattr(os, 'getloadavg') else 0.0
+    if not HAS_PSUTIL:
+        return LoadSample(0.0, 0.0, load_per_cpu, 0.0) if hasattr(os, 'getloadavg') else None
+    times = psutil.cpu_times_percent(interval=None)
+    return LoadSample(
+        cpu=100.0 - times.idle - getattr(times, 'iowait', 0.0),
+        iowait=getattr(times, 'iowait', 0.0),
+        load_per_cpu=load_per_cpu,
+        memory=psutil.virtual_memory().percent
+    )
+
+class AdaptiveConcurrency:
+    """Concurrency limit for a pool of media jobs that follows host load.
+
+    Every call to limit() (at most once per LOAD_SAMPLE_INTERVAL) samples CPU,
+    IO wait, load average and memory. Any signal above its high mark drops
+    the limit by one; all of them below their low marks raise it by one, up
+    to max_workers. Between the marks the limit holds. Pass the bound
+    method to imap_unordered so it takes effect on the next submission.
+    """
+
+    def __init__(self, name: str, min_workers: int, max_workers: int):
+        self.name = name
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.current = self.max_workers
+        self._lock = threading.Lock()
+        self._last_sample = 0.0
+        media_job_concurrency.labels(pool=name).set(self.current)
+        sample_load()  # Referência para a primeira média de CPU
+
+    def limit(self) -> int:
+        now = time.monotonic()
+        if now - self._last_sample < Config.LOAD_SAMPLE_INTERVAL:
+            return self.current
+        with self._lock:
+            if now - self._last_sample < Config.LOAD_SAMPLE_INTERVAL:
+                return self.current
+            self._last_sample = now
+            sample = sample_load()
+            if sample is not None:
+                self._adjust(sample)
+        return self.current
+
+    def _adjust(self, sample: LoadSample):
+        overloaded = (sample.cpu > Config.LOAD_CPU_HIGH or sample.iowait > Config.LOAD_IOWAIT_HIGH
+                      or sample.load_per_cpu > Config.LOAD_PER_CPU_HIGH or sample.memory > Config.LOAD_MEMORY_HIGH)
+        idle = (sample.cpu < Config.LOAD_CPU_LOW and sample.iowait < Config.LOAD_IOWAIT_LOW
+                and sample.load_per_cpu < Config.LOAD_PER_CPU_LOW and sample.memory < Config.LOAD_MEMORY_HIGH)
+        previous = self.current
+        if overloaded:
+            self.current = max(self.min_workers, self.current - 1)
+        elif idle:
+            self.current = min(self.max_workers, self.current + 1)
+        if self.current != previous:
+            logging.info(
+                f"Concorrência de '{self.name}': {previous} -> {self.current} "
+                f"(CPU {sample.cpu:.0f}%, IO wait {sample.iowait:.0f}%, load/núcleo {sample.load_per_cpu:.2f}, memória {sample.memory:.0f}%)"
+            )
+            media_job_concurrency.labels(pool=self.name).set(self.current)
+
+_controllers: Dict[str, AdaptiveConcurrency] = {}
+_controllers_lock = threading.Lock()
+
+def get_controller(name: str, min_workers: int, max_workers: int) -> AdaptiveConcurrency:
+    """One controller (and load history) per pool name and process."""
+    with _controllers_lock:
+        controller = _controllers.get(name)
+        if controller is None:
+            controller = _controllers[name] = AdaptiveConcurrency(name, min_workers, max_workers)
+        return controller
+
+def _lower_priority():
+    try:
+        os.nice(Config.MEDIA_NICE)
+        if HAS_PSUTIL and Config.MEDIA_IONICE_IDLE and hasattr(psutil, 'IOPRIO_CLASS_IDLE'):
+            psutil.Process().ionice(psutil.IOPRIO_CLASS_IDLE)
+    except OSError:
+        pass
+
+def low_priority_kwargs() -> dict:
+    """subprocess arguments that start ffmpeg at low CPU (nice) and IO (idle class) priority, so playback wins."""
+    if os.name == 'nt':
+        return {'creationflags': subprocess.BELOW_NORMAL_PRIORITY_CLASS}
+    return {'preexec_fn': _lower_priority}
@@ -67,6 +67,7 @@ import threading
 from queue import Queue
 from flask_login import login_user, login_required, logout_user, current_user
 from limiter import limiter
+from worker_pool import shutdown_pools
 from prometheus_flask_exporter import PrometheusMetrics
 
 # Import auth module
@@ -80,7 +81,7 @@ metrics = PrometheusMetrics(app)
 from blueprints.main import main_bp
 from blueprints.auth import auth_bp
 from blueprints.scan import scan_bp
-from blueprints.playlists import playlists_bp
+from blueprints.playlists import playlists_bp, playlist_service
 from blueprints.sessions import sessions_bp
 from blueprints.favorites import favorites_bp
 from blueprints.analytics import analytics_bp
@@ -108,6 +109,12 @@ app.register_blueprint(favorites_bp)
 app.register_blueprint(analytics_bp)
 app.register_blueprint(video_bp)
 
+# Playlists gravadas no array legado após a migração do db_optimizations.sql: uma vez por processo, fora das leituras
+try:
+    playlist_service.migrate_legacy_playlists()
+except Exception as e:
+    logging.error(f"Erro ao migrar playlists legadas: {e}")
+
 @app.errorhandler(APIError)
 def handle_api_error(error):
     response = {
@@ -237,6 +244,7 @@ def shutdown_redis():
 def signal_handler(sig, frame):
     logging.info("Encerrando o EndoFlix...")
     shutdown_redis()
+    shutdown_pools(wait=False)
     DB_POOL.closeall()
     sys.exit(0)
 
@@ -253,4 +261,5 @@ if __name__ == '__main__':
         app.run(port=5000)
     finally:
         shutdown_redis()
+        shutdown_pools()
         DB_POOL.closeall()
\ No newline at end of file
@@ -0,0 +1,75 @@
+from typing import List, Optional
+
+# Decoders that implement -lowres (decode at 1/2, 1/4 or 1/8 of the size).
+# H.264/HEVC/VP9/AV1 don't, for those only keyframe skipping applies.
+LOWRES_CODECS = {'mpeg1video', 'mpeg2video', 'mpeg4', 'h263', 'msmpeg4v2', 'msmpeg4v3', 'wmv1', 'wmv2', 'mjpeg'}
+
+def parse_width(resolution: Optional[str]) -> int:
+    """Width from a 'WxH' resolution as stored in endoflix_files; 0 if unknown."""
+    try:
+        return int(str(resolution).split('x')[0])
+    except (TypeError, ValueError):
+        return 0
+
+def lowres_factor(codec: Optional[str], width: int, thumb_size: int) -> int:
+    """Largest -lowres (0-3) that still decodes at least twice the thumbnail size."""
+    if codec not in LOWRES_CODECS or width <= 0:
+        return 0
+    factor = 0
+    while factor < 3 and (width >> (factor + 1)) >= thumb_size * 2:
+        factor += 1
+    return factor
+
+def thumbnail_command(ffmpeg_path: str, video_path: str, output_path: str, timestamp: float, thumb_size: int,
+                      thumb_quality: int, fast_seek: bool = False, codec: Optional[str] = None, width: int = 0) -> List[str]:
+    """ffmpeg arguments for a square WebP thumbnail of the frame at `timestamp`.
+
+    Fast seek decodes only the keyframe at or before the timestamp (no
+    decoding of the frames between it and the exact position), at reduced
+    resolution when the codec supports -lowres, and scales with
+    fast_bilinear. The frame may be a few seconds off the exact point.
+    """
+    scale_flags = ''
+    cmd = [ffmpeg_path]
+    if fast_seek:
+        cmd += ['-skip_frame', 'nokey', '-noaccurate_seek']
+        lowres = lowres_factor(codec, width, thumb_size)
+        if lowres:
+            cmd += ['-lowres', str(lowres)]
+        scale_flags = ':flags=fast_bilinear'
+    cmd += [
+        '-ss', str(timestamp),  # Seek to timestamp
+        '-i', video_path,       # Input file
+        '-an', '-sn', '-dn',
+        '-vframes', '1',        # Extract one frame
+        '-vf', f'scale={thumb_size}:{thumb_size}:force_original_aspect_ratio=decrease{scale_flags},pad={thumb_size}:{thumb_size}:(ow-iw)/2:(oh-ih)/2',  # Scale and pad to square
+        '-pix_fmt', 'yuv420p',  # Pixel format
+        '-c:v', 'libwebp',      # Use libwebp encoder
+        '-q:v', str(thumb_quality),  # Quality for WebP
+        '-f', 'webp',           # Output format
+        '-y',                   # Overwrite output
+        output_path
+    ]
+    return cmd
+
+def burst_command(ffmpeg_path: str, video_path: str, output_pattern: str, start: float, count: int,
+                  interval: float, quality: int) -> List[str]:
+    """ffmpeg arguments that extract `count` frames, one every `interval` seconds from `start`, in a single decode pass.
+
+    output_pattern is numbered by ffmpeg (e.g. burst_..._%d.webp, from 1).
+    Progress goes to stdout as key=value lines (frame=N).
+    """
+    return [
+        ffmpeg_path,
+        '-ss', str(start),      # Seek to start
+        '-i', video_path,       # Input file
+        '-an', '-sn', '-dn',
+        '-vf', f'fps=1/{interval}:start_time=0',  # One frame per interval
+        '-frames:v', str(count),
+        '-c:v', 'libwebp',
+        '-q:v', str(quality),
+        '-start_number', '1',
+        '-nostats', '-progress', 'pipe:1',
+        '-y',
+        output_pattern
+    ]
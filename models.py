@@ -2,6 +2,7 @@ from pydantic import BaseModel, field_validator, ValidationError
 from pathlib import Path
 from typing import List, Optional
 import os
+from config import Config
 
 def validate_path_safe(path: str) -> str:
     """Validate that path does not contain traversal sequences and is not absolute."""
@@ -11,6 +12,14 @@ def validate_path_safe(path: str) -> str:
         raise ValueError("Absolute paths are not allowed")
     return path
 
+def validate_stored_path(path: str) -> str:
+    """Validate a path as stored by scans (absolute): no traversal components or NUL bytes."""
+    if '\x00' in path:
+        raise ValueError("Path contains NUL byte")
+    if '..' in path.replace('\\', '/').split('/'):
+        raise ValueError("Path contains directory traversal")
+    return path
+
 class PlaylistCreate(BaseModel):
     name: str
     files: List[str]
@@ -115,4 +124,88 @@ class RemoveFromPlaylist(BaseModel):
                 if not isinstance(f, str):
                     raise ValueError("All files must be strings")
                 validate_path_safe(f)
-        return v
\ No newline at end of file
+        return v
+
+
+class ReorderPlaylist(BaseModel):
+    name: str
+    file: str
+    before: Optional[str] = None
+
+    @field_validator('name')
+    @classmethod
+    def name_not_empty(cls, v):
+        if not v or not v.strip():
+            raise ValueError("Name cannot be empty")
+        return v.strip()
+
+    @field_validator('file', 'before')
+    @classmethod
+    def validate_file(cls, v):
+        # Playlists guardam os caminhos absolutos gravados pela varredura
+        if v is not None:
+            validate_stored_path(v)
+        return v
+
+class PlaybackProgress(BaseModel):
+    # path vem da URL do player; eventos de arquivos não indexados são descartados na gravação
+    path: str
+    session: str
+    player_slot: Optional[int] = None
+    seconds: float
+
+    @field_validator('path', 'session')
+    @classmethod
+    def not_empty(cls, v):
+        if not v or not v.strip():
+            raise ValueError("Value cannot be empty")
+        return v.strip()
+
+    @field_validator('player_slot')
+    @classmethod
+    def valid_slot(cls, v):
+        if v is not None and not 1 <= v <= 4:
+            raise ValueError("Player slot must be between 1 and 4")
+        return v
+
+    @field_validator('seconds')
+    @classmethod
+    def valid_seconds(cls, v):
+        if not 0 < v <= 3600:
+            raise ValueError("Seconds must be in (0, 3600]")
+        return v
+
+class SnapshotBurst(BaseModel):
+    # video_path no mesmo formato de /save_snapshot (caminho do player, com ou sem /video/)
+    video_path: str
+    start: float
+    count: int
+    interval: float
+
+    @field_validator('video_path')
+    @classmethod
+    def not_empty(cls, v):
+        if not v or not v.strip():
+            raise ValueError("Value cannot be empty")
+        return v.strip()
+
+    @field_validator('start')
+    @classmethod
+    def valid_start(cls, v):
+        if v < 0:
+            raise ValueError("Start must not be negative")
+        return v
+
+    @field_validator('count')
+    @classmethod
+    def valid_count(cls, v):
+        if not 1 <= v <= Config.SNAPSHOT_BURST_MAX_FRAMES:
+            raise ValueError(f"Count must be between 1 and {Config.SNAPSHOT_BURST_MAX_FRAMES}")
+        return v
+
+    @field_validator('interval')
+    @classmethod
+    def valid_interval(cls, v):
+        if not 0.01 <= v <= 60:
+            raise ValueError("Interval must be between 0.01 and 60 seconds")
+        return v
@@ -0,0 +1,144 @@
+from typing import List, Optional, Tuple
+
+# Gap between consecutive positions: an item can be moved between two
+# neighbours ~10 times before the playlist has to be renumbered.
+POSITION_GAP = 1024
+
+# Moves legacy endoflix_playlist.files arrays into endoflix_playlist_item.
+# FOR UPDATE serializes concurrent migrations of the same playlist; the
+# second one re-checks cardinality(files) and finds nothing left to move.
+MIGRATE_LEGACY_SQL = f"""
+    WITH legacy AS (
+        SELECT id, files FROM endoflix_playlist
+        WHERE id = ANY(%s) AND cardinality(files) > 0
+        FOR UPDATE
+    ), moved AS (
+        UPDATE endoflix_playlist p SET files = '{{}}'
+        FROM legacy WHERE p.id = legacy.id
+        RETURNING legacy.id, legacy.files
+    )
+    INSERT INTO endoflix_playlist_item (playlist_id, file_path, position)
+    SELECT m.id, u.file_path, COALESCE(b.last, 0) + u.ord * {POSITION_GAP}
+    FROM moved m
+    CROSS JOIN LATERAL unnest(m.files) WITH ORDINALITY AS u(file_path, ord)
+    LEFT JOIN LATERAL (
+        SELECT MAX(position) AS last FROM endoflix_playlist_item WHERE playlist_id = m.id
+    ) b ON TRUE
+"""
+
+APPEND_ITEMS_SQL = f"""
+    INSERT INTO endoflix_playlist_item (playlist_id, file_path, position)
+    SELECT p.id, u.file_path, COALESCE(b.last, 0) + u.ord * {POSITION_GAP}
+    FROM endoflix_playlist p
+    CROSS JOIN LATERAL unnest(%s::text[]) WITH ORDINALITY AS u(file_path, ord)
+    LEFT JOIN LATERAL (
+        SELECT MAX(position) AS last FROM endoflix_playlist_item WHERE playlist_id = p.id
+    ) b ON TRUE
+    WHERE p.{{key}} = %s
+"""
+
+# Positions given by the caller (ordinal * gap): batches written out of order
+# still read back in ordinal order. Used for freshly created (empty) playlists.
+INSERT_AT_SQL = f"""
+    INSERT INTO endoflix_playlist_item (playlist_id, file_path, position)
+    SELECT p.id, u.file_path, u.ord * {POSITION_GAP}
+    FROM endoflix_playlist p
+    CROSS JOIN LATERAL unnest(%s::bigint[], %s::text[]) AS u(ord, file_path)
+    WHERE p.name = %s
+"""
+
+def migrate_legacy_files(cur, playlist_ids: List[int]) -> int:
+    """Move items still stored in the files array of the given playlists. Returns rows moved."""
+    if not playlist_ids:
+        return 0
+    cur.execute(MIGRATE_LEGACY_SQL, (list(playlist_ids),))
+    return cur.rowcount
+
+def legacy_playlist_ids(cur, names: Optional[List[str]] = None) -> List[int]:
+    """Playlists (all, or those named) whose files array has not been migrated yet."""
+    if names is None:
+        cur.execute("SELECT id FROM endoflix_playlist WHERE cardinality(files) > 0")
+    else:
+        cur.execute("SELECT id FROM endoflix_playlist WHERE name = ANY(%s) AND cardinality(files) > 0", (list(names),))
+    return [row[0] for row in cur.fetchall()]
+
+def append_items(cur, playlist_id: int, paths: List[str]):
+    if paths:
+        cur.execute(APPEND_ITEMS_SQL.format(key='id'), (list(paths), playlist_id))
+
+def append_items_by_name(cur, playlist_name: str, paths: List[str]):
+    if paths:
+        cur.execute(APPEND_ITEMS_SQL.format(key='name'), (list(paths), playlist_name))
+
+def insert_items_at_by_name(cur, playlist_name: str, items: List[Tuple[int, str]]):
+    """Insert (ordinal, path) pairs at position ordinal * POSITION_GAP."""
+    if items:
+        ordinals, paths = zip(*items)
+        cur.execute(INSERT_AT_SQL, (list(ordinals), list(paths), playlist_name))
+
+def replace_items(cur, playlist_id: int, paths: List[str]):
+    cur.execute("DELETE FROM endoflix_playlist_item WHERE playlist_id = %s", (playlist_id,))
+    append_items(cur, playlist_id, paths)
+
+def remove_items(cur, playlist_id: int, paths: List[str]) -> int:
+    cur.execute("DELETE FROM endoflix_playlist_item WHERE playlist_id = %s AND file_path = ANY(%s)", (playlist_id, list(paths)))
+    return cur.rowcount
+
+def playlist_files(cur, playlist_id: int) -> List[str]:
+    cur.execute("SELECT file_path FROM endoflix_playlist_item WHERE playlist_id = %s ORDER BY position", (playlist_id,))
+    return [row[0] for row in cur.fetchall()]
+
+def renumber(cur, playlist_id: int):
+    # Duas etapas: posições negativas temporárias evitam colisões na chave primária
+    cur.execute(f"""
+        UPDATE endoflix_playlist_item i SET position = -r.rn * {POSITION_GAP}
+        FROM (
+            SELECT file_path, position, row_number() OVER (ORDER BY position) AS rn
+            FROM endoflix_playlist_item WHERE playlist_id = %s
+        ) r
+        WHERE i.playlist_id = %s AND i.position = r.position
+    """, (playlist_id, playlist_id))
+    cur.execute("UPDATE endoflix_playlist_item SET position = -position WHERE playlist_id = %s", (playlist_id,))
+
+def move_item(cur, playlist_id: int, file_path: str, before: Optional[str] = None) -> bool:
+    """Move file_path in front of `before` (or to the end). Only the moved row is written,
+    except when the gap between the neighbours is exhausted and the playlist is renumbered."""
+    for attempt in range(2):
+        cur.execute(
+            "SELECT MIN(position) FROM endoflix_playlist_item WHERE playlist_id = %s AND file_path = %s",
+            (playlist_id, file_path)
+        )
+        current = cur.fetchone()[0]
+        if current is None:
+            return False
+        if before is None:
+            cur.execute("SELECT MAX(position) FROM endoflix_playlist_item WHERE playlist_id = %s", (playlist_id,))
+            new_position = cur.fetchone()[0] + POSITION_GAP
+        else:
+            cur.execute("""
+                SELECT n.position,
+                       (SELECT MAX(position) FROM endoflix_playlist_item
+                        WHERE playlist_id = %s AND position < n.position AND position <> %s)
+                FROM endoflix_playlist_item n
+                WHERE n.playlist_id = %s AND n.file_path = %s
+                ORDER BY n.position LIMIT 1
+            """, (playlist_id, current, playlist_id, before))
+            row = cur.fetchone()
+            if not row:
+                return False
+            next_position, previous = row
+            if next_position == current:
+                return True  # Já está nessa posição
+            previous = previous or 0
+            if next_position - previous < 2:
+                if attempt:
+                    return False
+                renumber(cur, playlist_id)
+                continue
+            new_position = (previous + next_position) // 2
+        cur.execute(
+            "UPDATE endoflix_playlist_item SET position = %s WHERE playlist_id = %s AND position = %s",
+            (new_position, playlist_id, current)
+        )
+        return True
+    return False
@@ -0,0 +1,198 @@
+import os
+import atexit
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+from config import Config
+from db import Database
+
+# pg_advisory lock key: only one process refreshes mv_analytics_stats per interval
+ANALYTICS_REFRESH_LOCK = 0x656E646F  # 'endo'
+
+# Rollup totals that must match mv_analytics_stats; any difference means the
+# triggers were bypassed (TRUNCATE, disabled triggers, manual restore)
+ROLLUP_DRIFT_SQL = """
+    SELECT s.total_videos <> COALESCE(MAX(r.item_count) FILTER (WHERE r.dimension = 'videos'), 0)
+        OR s.total_playlists <> COALESCE(MAX(r.item_count) FILTER (WHERE r.dimension = 'playlists' AND r.value = 'saved'), 0)
+        OR s.total_sessions <> COALESCE(MAX(r.item_count) FILTER (WHERE r.dimension = 'sessions'), 0)
+    FROM mv_analytics_stats s
+    LEFT JOIN endoflix_analytics_rollup r ON r.dimension IN ('videos', 'playlists', 'sessions')
+    GROUP BY s.total_videos, s.total_playlists, s.total_sessions
+"""
+
+# Top files of a period from the downsampled view rollups, never from raw events
+TOP_VIEWED_HOURLY_SQL = """
+    SELECT f.file_path, t.views, t.watched_seconds
+    FROM (
+        SELECT file_id, SUM(views) AS views, SUM(watched_seconds) AS watched_seconds
+        FROM endoflix_view_hourly WHERE bucket >= date_trunc('hour', LOCALTIMESTAMP) - make_interval(hours => %s)
+        GROUP BY file_id ORDER BY views DESC, watched_seconds DESC LIMIT %s
+    ) t JOIN endoflix_files f ON f.id = t.file_id
+    ORDER BY t.views DESC, t.watched_seconds DESC
+"""
+TOP_VIEWED_DAILY_SQL = """
+    SELECT f.file_path, t.views, t.watched_seconds
+    FROM (
+        SELECT file_id, SUM(views) AS views, SUM(watched_seconds) AS watched_seconds
+        FROM endoflix_view_daily WHERE day > CURRENT_DATE - %s
+        GROUP BY file_id ORDER BY views DESC, watched_seconds DESC LIMIT %s
+    ) t JOIN endoflix_files f ON f.id = t.file_id
+    ORDER BY t.views DESC, t.watched_seconds DESC
+"""
+
+def session_timestamp(name: str) -> Optional[datetime]:
+    """Sessions are named '<YYYY-MM-DDTHH-MM-SS>_<suffix>'; None for other names."""
+    parts = name.split('_')[0].split('-')
+    if len(parts) < 5:
+        return None
+    try:
+        return datetime.strptime('-'.join(parts[:5]), '%Y-%m-%dT%H-%M-%S')
+    except ValueError:
+        return None
+
+class AnalyticsService:
+    """Dashboard numbers read from endoflix_analytics_rollup (see db_optimizations.sql).
+
+    The rollup is kept current by triggers, so reads cost a few index lookups
+    regardless of library size. A background thread refreshes
+    mv_analytics_stats every ANALYTICS_REFRESH_INTERVAL seconds and rebuilds
+    the rollup if its totals no longer match the view.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.shutdown)
+
+    def rollup(self) -> Dict[str, Dict[str, int]]:
+        """{dimension: {value: count}} for every non-empty rollup bucket."""
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT dimension, value, item_count FROM endoflix_analytics_rollup WHERE item_count > 0")
+                rows = cur.fetchall()
+            conn.rollback()  # Somente leitura
+        rollup: Dict[str, Dict[str, int]] = {}
+        for dimension, value, count in rows:
+            rollup.setdefault(dimension, {})[value] = count
+        return rollup
+
+    @staticmethod
+    def totals(rollup: Dict[str, Dict[str, int]]) -> Dict[str, int]:
+        playlists = rollup.get('playlists', {})
+        return {
+            'videos': rollup.get('videos', {}).get('', 0),
+            'saved_playlists': playlists.get('saved', 0),
+            'playlists': sum(playlists.values()),
+            'sessions': rollup.get('sessions', {}).get('', 0),
+        }
+
+    def dashboard(self) -> dict:
+        rollup = self.rollup()
+        totals = self.totals(rollup)
+        slots = rollup.get('player_slot', {})
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT name, play_count FROM endoflix_playlist ORDER BY play_count DESC, name LIMIT %s",
+                    (Config.ANALYTICS_LIST_LIMIT,)
+                )
+                playlists = [{"name": name, "play_count": play_count} for name, play_count in cur.fetchall()]
+                cur.execute("SELECT file_path, view_count, is_favorite FROM endoflix_files ORDER BY view_count DESC LIMIT 10")
+                top_videos = [{"path": row[0], "play_count": row[1], "favorited": row[2]} for row in cur.fetchall()]
+                cur.execute("SELECT name, videos FROM endoflix_session ORDER BY id DESC LIMIT %s", (Config.ANALYTICS_LIST_LIMIT,))
+                sessions = cur.fetchall()
+            conn.rollback()  # Somente leitura
+
+        recent = []
+        for name, videos in reversed(sessions):
+            timestamp = session_timestamp(name) or datetime.now()
+            recent.append({'name': name, 'videos': videos, 'timestamp': timestamp.isoformat()})
+        return {
+            'stats': {'videos': totals['videos'], 'playlists': totals['playlists'], 'sessions': totals['sessions']},
+            'playlists': playlists,
+            'top_videos': top_videos,
+            'file_types': rollup.get('extension', {}),
+            'video_codecs': rollup.get('video_codec', {}),
+            'resolutions': rollup.get('resolution', {}),
+            'orientations': rollup.get('orientation', {}),
+            'sessions': recent,
+            'player_usage': [slots.get(str(slot), 0) for slot in range(1, 5)]
+        }
+
+    def views(self, days: Optional[int] = None, hours: Optional[int] = None, limit: int = 10) -> dict:
+        """Most watched files and watch time per player slot in the last `hours` or `days`
+        (today included). Hour ranges read the hourly rollup, day ranges the daily one."""
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                if hours is not None:
+                    cur.execute(TOP_VIEWED_HOURLY_SQL, (hours, limit))
+                    top = cur.fetchall()
+                    slots = []  # O rollup por hora não guarda o player
+                else:
+                    cur.execute(TOP_VIEWED_DAILY_SQL, (days, limit))
+                    top = cur.fetchall()
+                    cur.execute(
+                        "SELECT player_slot, SUM(views), SUM(watched_seconds) FROM endoflix_view_daily WHERE day > CURRENT_DATE - %s GROUP BY player_slot ORDER BY player_slot",
+                        (days,)
+                    )
+                    slots = cur.fetchall()
+            conn.rollback()  # Somente leitura
+        return {
+            'top': [{'path': path, 'views': int(views), 'watched_seconds': float(seconds)} for path, views, seconds in top],
+            'player_slots': [
+                {'slot': slot or None, 'views': int(views), 'watched_seconds': float(seconds)} for slot, views, seconds in slots
+            ]
+        }
+
+    def refresh(self) -> bool:
+        """Refresh mv_analytics_stats and rebuild the rollup if it drifted.
+
+        Returns False when another process holds the refresh lock."""
+        with self.db.get_connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    # Mesmo snapshot para a view e o rollup: a comparação não sofre com escritas concorrentes
+                    cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                    cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (ANALYTICS_REFRESH_LOCK,))
+                    if not cur.fetchone()[0]:
+                        conn.rollback()
+                        return False
+                    cur.execute("SELECT refresh_analytics_stats()")
+                    cur.execute(ROLLUP_DRIFT_SQL)
+                    row = cur.fetchone()
+                    drifted = bool(row and row[0])
+                conn.commit()
+                if drifted:
+                    logging.warning("Rollups de análise divergentes de mv_analytics_stats; recalculando")
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT pg_advisory_xact_lock(%s)", (ANALYTICS_REFRESH_LOCK,))
+                        cur.execute("SELECT rebuild_analytics_rollup()")
+                    conn.commit()
+                return True
+            except Exception as e:
+                conn.rollback()
+                logging.error(f"Erro ao atualizar estatísticas de análise: {e}")
+                return False
+
+    def ensure_refresher(self):
+        # Inicia a thread sob demanda e após fork (workers do gunicorn)
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._refresh_loop, name='analytics-refresh', daemon=True)
+            self._thread.start()
+
+    def _refresh_loop(self):
+        while not self._stop.wait(Config.ANALYTICS_REFRESH_INTERVAL):
+            self.refresh()
+
+    def shutdown(self):
+        self._stop.set()
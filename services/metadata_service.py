@@ -0,0 +1,287 @@
+import json
+import logging
+import subprocess
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from psycopg2.extras import Json, execute_values
+from prometheus_flask_exporter import Counter
+from config import Config
+from db import Database
+from cache import RedisCache
+
+# Where metadata lookups were answered: 'cache' (local tier or Redis), 'db' or 'probe'
+metadata_lookups_counter = Counter('metadata_lookups', 'Metadata lookups by source', ['source'])
+
+PROBE_ENTRIES = (
+    "format=format_name,duration,bit_rate"
+    ":stream=codec_type,codec_name,profile,pix_fmt,width,height,duration,bit_rate,avg_frame_rate,channels,sample_rate"
+)
+
+UNKNOWN_METADATA = {
+    "duration_seconds": 0,
+    "resolution": "unknown",
+    "orientation": "unknown",
+    "video_codec": "unknown",
+    "audio_codec": None,
+    "fps": None,
+    "bit_rate": None,
+    "container": None
+}
+
+def _number(value, cast=float):
+    try:
+        return cast(value) if value not in (None, "", "N/A") else None
+    except (TypeError, ValueError):
+        return None
+
+def _frame_rate(value) -> Optional[float]:
+    # ffprobe reporta frame rates como fração ("30000/1001"); "0/0" quando desconhecido
+    try:
+        num, _, den = str(value).partition('/')
+        fps = float(num) / float(den or 1)
+        return round(fps, 3) if fps > 0 else None
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+
+def parse_probe_output(output: str) -> Dict[str, Any]:
+    """Turn ffprobe's JSON into the stored probe record (format + first video/audio stream)."""
+    data = json.loads(output)
+    fmt = data.get("format", {})
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    record = {
+        "container": fmt.get("format_name"),
+        "duration_seconds": _number(fmt.get("duration")),
+        "bit_rate": _number(fmt.get("bit_rate"), int),
+        "streams": len(streams),
+        "video": None,
+        "audio": None
+    }
+    if video:
+        record["video"] = {
+            "codec": video.get("codec_name"),
+            "profile": video.get("profile"),
+            "pix_fmt": video.get("pix_fmt"),
+            "width": video.get("width") or 0,
+            "height": video.get("height") or 0,
+            "fps": _frame_rate(video.get("avg_frame_rate")),
+            "duration_seconds": _number(video.get("duration")),
+            "bit_rate": _number(video.get("bit_rate"), int)
+        }
+    if audio:
+        record["audio"] = {
+            "codec": audio.get("codec_name"),
+            "channels": audio.get("channels"),
+            "sample_rate": _number(audio.get("sample_rate"), int),
+            "bit_rate": _number(audio.get("bit_rate"), int)
+        }
+    return record
+
+def summarize(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Flat metadata dict used by the indexer and the API."""
+    video = record.get("video") or {}
+    audio = record.get("audio") or {}
+    width, height = video.get("width", 0), video.get("height", 0)
+    # MKV/WebM não trazem duração por stream; usa a do container
+    duration = video.get("duration_seconds") or record.get("duration_seconds") or 0
+    if width and height:
+        resolution = f"{width}x{height}"
+        orientation = "portrait" if width < height else "landscape" if width > height else "square"
+    else:
+        resolution, orientation = "unknown", "unknown"
+    return {
+        "duration_seconds": duration,
+        "resolution": resolution,
+        "orientation": orientation,
+        "video_codec": video.get("codec") or "unknown",
+        "audio_codec": audio.get("codec"),
+        "fps": video.get("fps"),
+        "bit_rate": record.get("bit_rate") or video.get("bit_rate"),
+        "container": record.get("container")
+    }
+
+def _cached_record(value) -> Dict[str, Any]:
+    # Entradas gravadas antes do codec de cache ainda são strings JSON
+    return json.loads(value) if isinstance(value, str) else value
+
+class MetadataService:
+    """ffprobe results persisted per (path, size, mtime) in Postgres and Redis.
+
+    This is the only metadata cache: keys carry size and mtime, so an edited
+    file is probed again and an unchanged one never is, and a stale entry can
+    not be served. The in-process tier is RedisCache's bounded, pub/sub
+    invalidated local cache. Re-indexing a file drops the key of its previous
+    version. Lookups for many files cost one Redis MGET and one Postgres query.
+    A single-file miss is resolved single-flight (RedisCache.get_or_compute),
+    so concurrent requests for the same file run at most one ffprobe.
+    """
+
+    def __init__(self, db: Database, cache: RedisCache):
+        self.db = db
+        self.cache = cache
+
+    @staticmethod
+    def cache_key(file_path: str, size: int, mtime: float) -> str:
+        return f"probe:{file_path}:{size}:{float(mtime)!r}"
+
+    def lookup_many(self, items: Iterable[Tuple[str, int, float]]) -> Dict[str, Dict[str, Any]]:
+        """Stored metadata for (path, size, mtime) items; paths never probed are absent."""
+        items = [(str(path), size, float(mtime)) for path, size, mtime in items]
+        if not items:
+            return {}
+        keys = {self.cache_key(*item): item for item in items}
+        found = {}
+        for key, value in self.cache.batch_get(list(keys)).items():
+            try:
+                found[keys[key][0]] = summarize(_cached_record(value))
+            except (json.JSONDecodeError, TypeError) as e:
+                logging.error(f"Registro de probe inválido no cache para {keys[key][0]}: {e}")
+        metadata_lookups_counter.labels(source='cache').inc(len(found))
+
+        missing = [item for item in items if item[0] not in found]
+        if missing:
+            found.update({path: summarize(record) for path, record in self._load_records(missing).items()})
+        return found
+
+    def get(self, file_path: str, size: int, mtime: float) -> Dict[str, Any]:
+        file_path, mtime = str(file_path), float(mtime)
+        computed = []
+
+        def compute():
+            computed.append(True)
+            return self._resolve(file_path, size, mtime)
+
+        record = self.cache.get_or_compute(self.cache_key(file_path, size, mtime), compute)
+        if record is None:
+            return dict(UNKNOWN_METADATA)
+        try:
+            metadata = summarize(_cached_record(record))
+        except (json.JSONDecodeError, TypeError) as e:
+            logging.error(f"Registro de probe inválido no cache para {file_path}: {e}")
+            record = self._resolve(file_path, size, mtime)
+            return summarize(record) if record is not None else dict(UNKNOWN_METADATA)
+        if not computed:
+            metadata_lookups_counter.labels(source='cache').inc()
+        return metadata
+
+    def _resolve(self, file_path: str, size: int, mtime: float) -> Optional[Dict[str, Any]]:
+        """Record from Postgres, else from a fresh ffprobe (persisted). The caller caches it."""
+        records = self._query_records([(file_path, size, mtime)])
+        if file_path in records:
+            metadata_lookups_counter.labels(source='db').inc()
+            return records[file_path]
+        record = self._run_ffprobe(file_path)
+        if record is not None:
+            metadata_lookups_counter.labels(source='probe').inc()
+            self._persist(file_path, size, mtime, record)
+        return record
+
+    def _load_records(self, items: List[Tuple[str, int, float]]) -> Dict[str, Dict[str, Any]]:
+        """Probe records from Postgres (one query), written back to Redis."""
+        records = self._query_records(items)
+        if records:
+            metadata_lookups_counter.labels(source='db').inc(len(records))
+            self.cache.batch_set({self.cache_key(*item): records[item[0]] for item in items if item[0] in records})
+        return records
+
+    def _query_records(self, items: List[Tuple[str, int, float]]) -> Dict[str, Dict[str, Any]]:
+        records = {}
+        with self.db.get_connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    rows = execute_values(cur, """
+                        SELECT p.file_path, p.probe
+                        FROM endoflix_media_probe p
+                        JOIN (VALUES %s) AS v(file_path, size_bytes, mtime)
+                          ON p.file_path = v.file_path AND p.size_bytes = v.size_bytes AND p.mtime = v.mtime
+                    """, items, template="(%s, %s::bigint, %s::double precision)", fetch=True)
+                conn.rollback()  # Somente leitura; não deixa a conexão "idle in transaction"
+                records = {path: record for path, record in rows}
+            except Exception as e:
+                conn.rollback()
+                logging.error(f"Erro ao consultar probes no banco: {e}")
+        return records
+
+    def probe(self, file_path: str, size: int, mtime: float) -> Dict[str, Any]:
+        """Run ffprobe once (with a timeout) and persist the record. Failures are not stored."""
+        file_path = str(file_path)
+        record = self._run_ffprobe(file_path)
+        if record is None:
+            return dict(UNKNOWN_METADATA)
+        metadata_lookups_counter.labels(source='probe').inc()
+        self.store(file_path, size, mtime, record)
+        return summarize(record)
+
+    def _run_ffprobe(self, file_path: str) -> Optional[Dict[str, Any]]:
+        cmd = [Config.FFPROBE_PATH, "-v", "error", "-show_entries", PROBE_ENTRIES, "-of", "json", file_path]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=False, timeout=Config.FFPROBE_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            logging.error(f"ffprobe excedeu {Config.FFPROBE_TIMEOUT}s para {file_path}")
+            return None
+        except OSError as e:
+            logging.error(f"Não foi possível executar ffprobe para {file_path}: {e}")
+            return None
+        if result.returncode != 0:
+            stderr_text = result.stderr.decode('utf-8', errors='replace') if result.stderr else 'Unknown error'
+            logging.error(f"ffprobe failed for {file_path}: {stderr_text}")
+            return None
+        try:
+            return parse_probe_output(result.stdout.decode('utf-8', errors='replace'))
+        except (json.JSONDecodeError, AttributeError) as e:
+            logging.error(f"Failed to parse ffprobe output for {file_path}: {e}")
+            return None
+
+    def store(self, file_path: str, size: int, mtime: float, record: Dict[str, Any]):
+        """Persist a probe record, dropping the cache key of the file's previous version."""
+        self.cache.set(self.cache_key(file_path, size, mtime), record, ttl=Config.REDIS_TTL)
+        self._persist(file_path, size, mtime, record)
+
+    def _persist(self, file_path: str, size: int, mtime: float, record: Dict[str, Any]):
+        previous = None
+        with self.db.get_connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        WITH previous AS (
+                            SELECT size_bytes, mtime FROM endoflix_media_probe WHERE file_path = %s FOR UPDATE
+                        ), saved AS (
+                            INSERT INTO endoflix_media_probe (file_path, size_bytes, mtime, probe)
+                            VALUES (%s, %s, %s, %s)
+                            ON CONFLICT (file_path) DO UPDATE SET
+                                size_bytes = EXCLUDED.size_bytes,
+                                mtime = EXCLUDED.mtime,
+                                probe = EXCLUDED.probe,
+                                probed_at = CURRENT_TIMESTAMP
+                            RETURNING 1
+                        )
+                        SELECT size_bytes, mtime FROM previous
+                    """, (file_path, file_path, size, float(mtime), Json(record)))
+                    previous = cur.fetchone()
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logging.error(f"Erro ao gravar probe de {file_path}: {e}")
+        if previous and tuple(previous) != (size, float(mtime)):
+            self.cache.delete(self.cache_key(file_path, *previous))
+
+    def forget(self, file_paths: Iterable[str]):
+        """Drop stored metadata of files removed from the index."""
+        file_paths = [str(path) for path in file_paths]
+        if not file_paths:
+            return
+        with self.db.get_connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "DELETE FROM endoflix_media_probe WHERE file_path = ANY(%s) RETURNING file_path, size_bytes, mtime",
+                        (file_paths,)
+                    )
+                    removed = cur.fetchall()
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logging.error(f"Erro ao remover probes: {e}")
+                return
+        for path, size, mtime in removed:
+            self.cache.delete(self.cache_key(path, size, mtime))
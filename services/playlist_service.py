@@ -4,7 +4,42 @@ from pathlib import Path
 from typing import Optional
 from db import Database
 from cache import RedisCache
+from config import Config
 from utils import get_media_files
+from playlist_items import (
+    legacy_playlist_ids, migrate_legacy_files, move_item, playlist_files, remove_items, replace_items
+)
+
+# One row per (playlist, item) in position order; the LIMIT 1 lateral keeps the
+# old "first matching row" semantics if endoflix_files ever holds duplicates.
+HYDRATE_PLAYLISTS_SQL = """
+    SELECT p.name, p.play_count, p.source_folder, i.file_path, f.found, f.size_bytes, f.modified_at
+    FROM endoflix_playlist p
+    LEFT JOIN endoflix_playlist_item i ON i.playlist_id = p.id
+    LEFT JOIN LATERAL (
+        SELECT TRUE AS found, size_bytes, modified_at FROM endoflix_files WHERE file_path = i.file_path LIMIT 1
+    ) f ON TRUE
+    WHERE p.is_temp = FALSE AND p.name = ANY(%s)
+    ORDER BY p.name, i.position
+"""
+
+PLAYLIST_SUMMARIES_SQL = """
+    SELECT p.name, s.file_count, COALESCE(s.total_size, 0), p.play_count, p.source_folder
+    FROM endoflix_playlist p
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS file_count, SUM(f.size_bytes) AS total_size
+        FROM endoflix_playlist_item i
+        LEFT JOIN endoflix_files f ON f.file_path = i.file_path
+        WHERE i.playlist_id = p.id
+    ) s
+    WHERE p.is_temp = FALSE AND (%s::text IS NULL OR p.name > %s)
+    ORDER BY p.name
+    LIMIT %s
+"""
+
+def _cached_value(value):
+    # Entradas gravadas antes do codec de cache ainda são strings JSON
+    return json.loads(value) if isinstance(value, str) else value
 
 class PlaylistService:
     def __init__(self, db: Database, cache: RedisCache):
@@ -17,9 +52,10 @@ class PlaylistService:
             with conn.cursor() as cur:
                 try:
                     cur.execute(
-                        "INSERT INTO endoflix_playlist (name, files, play_count, source_folder) VALUES (%s, %s, 0, %s) ON CONFLICT (name) DO UPDATE SET files = EXCLUDED.files, play_count = endoflix_playlist.play_count, source_folder = EXCLUDED.source_folder RETURNING id",
-                        (name, files, source_folder)
+                        "INSERT INTO endoflix_playlist (name, files, play_count, source_folder) VALUES (%s, '{}', 0, %s) ON CONFLICT (name) DO UPDATE SET files = '{}', play_count = endoflix_playlist.play_count, source_folder = EXCLUDED.source_folder RETURNING id",
+                        (name, source_folder)
                     )
+                    replace_items(cur, cur.fetchone()[0], files)
                     conn.commit()
                     # Invalidate cache for this playlist
                     self.cache.delete(f"playlist:{name}")
@@ -30,38 +66,47 @@ class PlaylistService:
                     raise
 
     def get_playlist(self, name: str) -> Optional[dict]:
-        """Get playlist, check cache first, then DB, cache result."""
-        cache_key = f"playlist:{name}"
-        cached = self.cache.get(cache_key)
-        if cached:
-            try:
-                return json.loads(cached)
-            except json.JSONDecodeError:
-                pass  # Fall through to DB
+        """Get playlist from cache; on a miss one process hydrates it while others wait or get the stale copy."""
+        cached = self.cache.get_or_compute(f"playlist:{name}", lambda: self._load_playlists([name]).get(name), stale_ttl=Config.CACHE_STALE_TTL)
+        try:
+            return _cached_value(cached)
+        except json.JSONDecodeError:
+            return self._load_playlists([name]).get(name)
 
+    def _load_playlists(self, names: list) -> dict:
         with self.db.get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT files, play_count, source_folder FROM endoflix_playlist WHERE name = %s AND is_temp = FALSE", (name,))
-                result = cur.fetchone()
-                if not result:
-                    return None
-                files, play_count, source_folder = result
-                # Add metadata to files
-                files_with_meta = []
-                for f in files:
-                    cur2 = conn.cursor()
-                    cur2.execute("SELECT size_bytes, modified_at FROM endoflix_files WHERE file_path = %s", (f,))
-                    meta_result = cur2.fetchone()
-                    if meta_result:
-                        size, modified = meta_result
-                        files_with_meta.append({"path": f, "size": size, "modified": modified.isoformat() if modified else None, "extension": Path(f).suffix.lower()[1:]})
-                    else:
-                        files_with_meta.append({"path": f, "size": 0, "modified": None, "extension": Path(f).suffix.lower()[1:]})
-                    cur2.close()
-                playlist_data = {"name": name, "files": files_with_meta, "play_count": play_count, "source_folder": source_folder}
-                # Cache the result
-                self.cache.set(cache_key, json.dumps(playlist_data))
-                return playlist_data
+            return self._hydrate_playlists(conn, names)
+
+    def migrate_legacy_playlists(self) -> int:
+        """Move playlists still stored in the legacy files array to endoflix_playlist_item.
+
+        db_optimizations.sql migrates existing arrays; this catches the ones older
+        code wrote afterwards. Run once at startup, never on the read paths (write
+        paths migrate the playlist they touch). Returns the number of items moved."""
+        with self.db.get_connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    ids = legacy_playlist_ids(cur)
+                    moved = migrate_legacy_files(cur, ids)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        if ids:
+            logging.info(f"{moved} itens migrados de {len(ids)} playlists para endoflix_playlist_item")
+        return moved
+
+    def _hydrate_playlists(self, conn, names: list) -> dict:
+        """Load playlists with per-file metadata in one query, keeping each playlist's file order."""
+        playlists = {}
+        with conn.cursor() as cur:
+            cur.execute(HYDRATE_PLAYLISTS_SQL, (names,))
+            for name, play_count, source_folder, path, found, size, modified in cur.fetchall():
+                playlist = playlists.setdefault(name, {"name": name, "files": [], "play_count": play_count, "source_folder": source_folder})
+                if path is None:
+                    continue  # Playlist vazia
+                playlist["files"].append({"path": path, "size": size if found else 0, "modified": modified.isoformat() if modified else None, "extension": Path(path).suffix.lower()[1:]})
+        return playlists
 
     def update_playlist(self, name: str, source_folder: str, temp_playlist: Optional[str] = None) -> dict:
         """Update playlist by rescanning source_folder, incorporating temp_playlist if provided."""
@@ -69,10 +114,11 @@ class PlaylistService:
             with conn.cursor() as cur:
                 try:
                     # Verify playlist exists
-                    cur.execute("SELECT files, source_folder FROM endoflix_playlist WHERE name = %s AND is_temp = FALSE", (name,))
+                    cur.execute("SELECT id FROM endoflix_playlist WHERE name = %s AND is_temp = FALSE", (name,))
                     playlist = cur.fetchone()
                     if not playlist:
                         raise ValueError("Playlist not found")
+                    playlist_id = playlist[0]
 
                     # Get updated files from source_folder
                     updated_files = []
@@ -85,22 +131,21 @@ class PlaylistService:
 
                     # If temp_playlist provided, incorporate its files
                     if temp_playlist:
-                        cur.execute("SELECT files FROM endoflix_playlist WHERE name = %s AND is_temp = TRUE", (temp_playlist,))
+                        cur.execute("SELECT id FROM endoflix_playlist WHERE name = %s AND is_temp = TRUE", (temp_playlist,))
                         temp_result = cur.fetchone()
                         if temp_result:
-                            updated_files.extend(temp_result[0])
-                            # Delete temp playlist
-                            cur.execute("DELETE FROM endoflix_playlist WHERE name = %s AND is_temp = TRUE", (temp_playlist,))
+                            migrate_legacy_files(cur, [temp_result[0]])
+                            updated_files.extend(playlist_files(cur, temp_result[0]))
+                            # Delete temp playlist (items are removed by ON DELETE CASCADE)
+                            cur.execute("DELETE FROM endoflix_playlist WHERE id = %s", (temp_result[0],))
 
                     # Sanitize: remove duplicates and non-existent files
                     updated_files = list(dict.fromkeys(updated_files))  # Remove duplicates
                     valid_files = [f for f in updated_files if Path(f).exists()]
 
                     # Update DB
-                    cur.execute(
-                        "UPDATE endoflix_playlist SET files = %s, source_folder = %s WHERE name = %s AND is_temp = FALSE",
-                        (valid_files, source_folder, name)
-                    )
+                    cur.execute("UPDATE endoflix_playlist SET files = '{}', source_folder = %s WHERE id = %s", (source_folder, playlist_id))
+                    replace_items(cur, playlist_id, valid_files)
                     conn.commit()
                     # Invalidate cache
                     self.cache.delete(f"playlist:{name}")
@@ -129,32 +174,70 @@ class PlaylistService:
 
     def get_all_playlists(self) -> dict:
         """Get all non-temp playlists."""
+        return self.get_playlists(self.list_playlist_names())
+
+    def list_playlist_names(self, limit: Optional[int] = None, after: Optional[str] = None) -> list:
+        """Non-temp playlist names in name order, optionally one keyset page (names > after)."""
         with self.db.get_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT name FROM endoflix_playlist WHERE is_temp = FALSE")
-                names = [row[0] for row in cur.fetchall()]
-                playlists = {}
-                for name in names:
-                    playlist = self.get_playlist(name)
-                    if playlist:
-                        playlists[name] = playlist
-                return playlists
+                cur.execute(
+                    "SELECT name FROM endoflix_playlist WHERE is_temp = FALSE AND (%s::text IS NULL OR name > %s) ORDER BY name LIMIT %s",
+                    (after, after, limit)
+                )
+                return [row[0] for row in cur.fetchall()]
+
+    def get_playlists(self, names: list) -> dict:
+        """Hydrated playlists for names: one MGET for cached ones, one single-flight query for the rest."""
+        if not names:
+            return {}
+        keys = {f"playlist:{name}": name for name in names}
+
+        def hydrate(missing_keys):
+            hydrated = self._load_playlists([keys[key] for key in missing_keys])
+            return {f"playlist:{name}": data for name, data in hydrated.items()}
+
+        cached = self.cache.get_or_compute_many(list(keys), hydrate, stale_ttl=Config.CACHE_STALE_TTL)
+        playlists, invalid = {}, []
+        for key, name in keys.items():
+            try:
+                if key in cached:
+                    playlists[name] = _cached_value(cached[key])
+            except json.JSONDecodeError:
+                invalid.append(name)
+        if invalid:
+            playlists.update(self._load_playlists(invalid))
+        return {name: playlists[name] for name in names if name in playlists}
+
+    def get_playlist_summaries(self, limit: Optional[int] = None, after: Optional[str] = None) -> list:
+        """Name, file count, total size and play count per playlist, without per-file rows."""
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(PLAYLIST_SUMMARIES_SQL, (after, after, limit))
+                return [
+                    {"name": name, "file_count": file_count, "total_size": int(total_size), "play_count": play_count, "source_folder": source_folder}
+                    for name, file_count, total_size, play_count, source_folder in cur.fetchall()
+                ]
 
     def save_temp_playlist(self, temp_name: str, new_name: str) -> dict:
         """Save temp playlist as permanent."""
         with self.db.get_connection() as conn:
             with conn.cursor() as cur:
                 try:
-                    cur.execute("SELECT files, source_folder FROM endoflix_playlist WHERE name = %s AND is_temp = TRUE", (temp_name,))
+                    cur.execute("SELECT id, source_folder FROM endoflix_playlist WHERE name = %s AND is_temp = TRUE", (temp_name,))
                     result = cur.fetchone()
                     if not result:
                         raise ValueError("Temp playlist not found")
-                    files, source_folder = result
+                    temp_id, source_folder = result
+                    migrate_legacy_files(cur, [temp_id])
                     cur.execute(
-                        "INSERT INTO endoflix_playlist (name, files, play_count, source_folder, is_temp) VALUES (%s, %s, %s, %s, %s)",
-                        (new_name.strip(), files, 0, source_folder, False)
+                        "INSERT INTO endoflix_playlist (name, files, play_count, source_folder, is_temp) VALUES (%s, '{}', %s, %s, %s) RETURNING id",
+                        (new_name.strip(), 0, source_folder, False)
                     )
-                    cur.execute("DELETE FROM endoflix_playlist WHERE name = %s AND is_temp = TRUE", (temp_name,))
+                    playlist_id = cur.fetchone()[0]
+                    # Re-parent the scanned items instead of copying them
+                    cur.execute("UPDATE endoflix_playlist_item SET playlist_id = %s WHERE playlist_id = %s", (playlist_id, temp_id))
+                    cur.execute("DELETE FROM endoflix_playlist WHERE id = %s", (temp_id,))
+                    files = playlist_files(cur, playlist_id)
                     conn.commit()
                     self.cache.delete(f"playlist:{new_name}")
                     return {"name": new_name, "files": files, "source_folder": source_folder}
@@ -168,13 +251,13 @@ class PlaylistService:
         with self.db.get_connection() as conn:
             with conn.cursor() as cur:
                 try:
-                    cur.execute("SELECT files FROM endoflix_playlist WHERE name = %s AND is_temp = FALSE", (name,))
+                    cur.execute("SELECT id FROM endoflix_playlist WHERE name = %s AND is_temp = FALSE", (name,))
                     result = cur.fetchone()
                     if not result:
                         raise ValueError("Playlist not found")
-                    current_files = result[0]
-                    updated_files = [f for f in current_files if f not in files_to_remove]
-                    cur.execute("UPDATE endoflix_playlist SET files = %s WHERE name = %s AND is_temp = FALSE", (updated_files, name))
+                    migrate_legacy_files(cur, [result[0]])
+                    remove_items(cur, result[0], files_to_remove)
+                    updated_files = playlist_files(cur, result[0])
                     conn.commit()
                     self.cache.delete(f"playlist:{name}")
                     return {"name": name, "files": updated_files}
@@ -189,13 +272,35 @@ class PlaylistService:
             with conn.cursor() as cur:
                 try:
                     cur.execute(
-                        "INSERT INTO endoflix_playlist (name, files, play_count, source_folder) VALUES (%s, %s, %s, %s) ON CONFLICT (name) DO UPDATE SET files = EXCLUDED.files, play_count = EXCLUDED.play_count, source_folder = EXCLUDED.source_folder",
-                        (name, files, play_count, source_folder)
+                        "INSERT INTO endoflix_playlist (name, files, play_count, source_folder) VALUES (%s, '{}', %s, %s) ON CONFLICT (name) DO UPDATE SET files = '{}', play_count = EXCLUDED.play_count, source_folder = EXCLUDED.source_folder RETURNING id",
+                        (name, play_count, source_folder)
                     )
+                    replace_items(cur, cur.fetchone()[0], files)
                     conn.commit()
                     self.cache.delete(f"playlist:{name}")
                     return {"name": name, "files": files, "play_count": play_count, "source_folder": source_folder}
                 except Exception as e:
                     conn.rollback()
                     logging.error(f"Error importing playlist: {str(e)}")
-                    raise
\ No newline at end of file
+                    raise
+
+    def reorder_playlist(self, name: str, file_path: str, before: Optional[str] = None) -> dict:
+        """Move file_path in front of `before` (or to the end); only the moved item row is written."""
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                try:
+                    cur.execute("SELECT id FROM endoflix_playlist WHERE name = %s AND is_temp = FALSE", (name,))
+                    result = cur.fetchone()
+                    if not result:
+                        raise ValueError("Playlist not found")
+                    migrate_legacy_files(cur, [result[0]])
+                    if not move_item(cur, result[0], file_path, before):
+                        raise ValueError("File not found in playlist")
+                    files = playlist_files(cur, result[0])
+                    conn.commit()
+                    self.cache.delete(f"playlist:{name}")
+                    return {"name": name, "files": files}
+                except Exception as e:
+                    conn.rollback()
+                    logging.error(f"Error reordering playlist: {str(e)}")
+                    raise
@@ -0,0 +1,143 @@
+import logging
+from typing import Optional, Tuple
+from config import Config
+from db import Database
+
+JOB_COLUMNS = (
+    "id", "playlist_name", "status", "total", "generated", "failed", "attempts",
+    "cancel_requested", "message", "created_at", "started_at", "heartbeat_at", "finished_at"
+)
+TERMINAL_STATUSES = ('done', 'failed', 'cancelled')
+
+# Oldest queued job, or a running one whose worker stopped sending heartbeats.
+# SKIP LOCKED lets several workers claim concurrently without blocking each other.
+CLAIM_JOB_SQL = f"""
+    UPDATE endoflix_thumbnail_job j
+    SET status = 'running', worker = %s, attempts = j.attempts + 1,
+        started_at = COALESCE(j.started_at, CURRENT_TIMESTAMP), heartbeat_at = CURRENT_TIMESTAMP
+    WHERE j.id = (
+        SELECT id FROM endoflix_thumbnail_job
+        WHERE status = 'queued'
+           OR (status = 'running' AND heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s))
+        ORDER BY created_at
+        FOR UPDATE SKIP LOCKED
+        LIMIT 1
+    )
+    RETURNING {', '.join('j.' + column for column in JOB_COLUMNS)}
+"""
+
+def _job_row(row) -> Optional[dict]:
+    if row is None:
+        return None
+    job = dict(zip(JOB_COLUMNS, row))
+    for column in ('created_at', 'started_at', 'heartbeat_at', 'finished_at'):
+        if job[column] is not None:
+            job[column] = job[column].isoformat()
+    done = job['generated'] + job['failed']
+    job['progress'] = round(done / job['total'], 4) if job['total'] else (1.0 if job['status'] == 'done' else 0.0)
+    return job
+
+class ThumbnailJobQueue:
+    """Postgres-backed queue of thumbnail jobs (table endoflix_thumbnail_job).
+
+    The web app enqueues, reports and cancels; thumbnail_worker.py claims
+    and runs. Progress and cancellation go through the job row, so any
+    process can follow a job started by any other.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    def _execute(self, sql: str, params: tuple = (), fetch: bool = True):
+        with self.db.get_connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(sql, params)
+                    row = cur.fetchone() if fetch else None
+                conn.commit()
+                return row
+            except Exception:
+                conn.rollback()
+                raise
+
+    def enqueue(self, playlist_name: str) -> Tuple[dict, bool]:
+        """Queue a job for the playlist, or return its queued/running job. Returns (job, created)."""
+        row = self._execute(f"""
+            INSERT INTO endoflix_thumbnail_job (playlist_name) VALUES (%s)
+            ON CONFLICT (playlist_name) WHERE status IN ('queued', 'running') DO NOTHING
+            RETURNING {', '.join(JOB_COLUMNS)}
+        """, (playlist_name,))
+        if row is not None:
+            return _job_row(row), True
+        row = self._execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM endoflix_thumbnail_job WHERE playlist_name = %s AND status IN ('queued', 'running')",
+            (playlist_name,)
+        )
+        if row is None:
+            # O job ativo terminou entre as duas consultas
+            return self.enqueue(playlist_name)
+        return _job_row(row), False
+
+    def get(self, job_id: int) -> Optional[dict]:
+        return _job_row(self._execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM endoflix_thumbnail_job WHERE id = %s", (job_id,)))
+
+    def cancel(self, job_id: int) -> Optional[dict]:
+        """Queued jobs are cancelled at once; running ones stop at their next progress update."""
+        return _job_row(self._execute(f"""
+            UPDATE endoflix_thumbnail_job
+            SET cancel_requested = TRUE,
+                status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+                finished_at = CASE WHEN status = 'queued' THEN CURRENT_TIMESTAMP ELSE finished_at END
+            WHERE id = %s
+            RETURNING {', '.join(JOB_COLUMNS)}
+        """, (job_id,)))
+
+    def claim(self, worker: str) -> Optional[dict]:
+        job = _job_row(self._execute(CLAIM_JOB_SQL, (worker, Config.THUMB_JOB_HEARTBEAT_TIMEOUT)))
+        if job and job['attempts'] > Config.THUMB_JOB_MAX_ATTEMPTS:
+            logging.error(f"Job de thumbnails {job['id']} excedeu {Config.THUMB_JOB_MAX_ATTEMPTS} tentativas")
+            self.finish(job['id'], worker, 'failed', 'Too many attempts')
+            return self.claim(worker)
+        return job
+
+    # Updates of a running job below only apply while `worker` still owns it: once
+    # another worker reclaims the job, the superseded one can't overwrite the new attempt.
+
+    def start(self, job_id: int, worker: str, total: int, generated: int) -> bool:
+        """Record the work found on (re)start. Failures from an interrupted attempt are retried."""
+        return self._execute("""
+            UPDATE endoflix_thumbnail_job SET total = %s, generated = %s, failed = 0, heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND worker = %s AND status = 'running'
+            RETURNING id
+        """, (total, generated, job_id, worker)) is not None
+
+    def heartbeat(self, job_id: int, worker: str) -> bool:
+        """Keep the job claimed while long steps run. Returns False if another worker took it over."""
+        return self._execute("""
+            UPDATE endoflix_thumbnail_job SET heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND worker = %s AND status = 'running'
+            RETURNING id
+        """, (job_id, worker)) is not None
+
+    def progress(self, job_id: int, worker: str, generated: int, failed: int) -> bool:
+        """Store counters and heartbeat. Returns False if the job was cancelled or taken over."""
+        row = self._execute("""
+            UPDATE endoflix_thumbnail_job
+            SET generated = %s, failed = %s, heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND worker = %s AND status = 'running'
+            RETURNING cancel_requested
+        """, (generated, failed, job_id, worker))
+        return bool(row) and not row[0]
+
+    def finish(self, job_id: int, worker: str, status: str, message: Optional[str] = None):
+        self._execute("""
+            UPDATE endoflix_thumbnail_job SET status = %s, message = %s, finished_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND worker = %s AND status = 'running'
+        """, (status, message, job_id, worker), fetch=False)
+
+    def release(self, job_id: int, worker: str):
+        """Hand a running job back to the queue (worker shutting down)."""
+        self._execute(
+            "UPDATE endoflix_thumbnail_job SET status = 'queued', worker = NULL, attempts = GREATEST(attempts - 1, 0) WHERE id = %s AND worker = %s AND status = 'running'",
+            (job_id, worker), fetch=False
+        )
@@ -0,0 +1,154 @@
+import re
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from psycopg2.extras import execute_values
+from config import Config
+from db import Database
+from fingerprint import fingerprint_file
+
+KINDS = ('thumb', 'sprite')
+HASH_ID_PATTERN = re.compile(r'^[0-9a-f]{16,128}$')
+
+# Which previews each file's content already has: one query for the whole playlist
+MISSING_PREVIEWS_SQL = """
+    SELECT p.file_path, f.hash_id, COALESCE(array_agg(t.kind) FILTER (WHERE t.kind IS NOT NULL), '{}'),
+           f.duration_seconds, f.video_codec, f.resolution
+    FROM unnest(%s::text[]) AS p(file_path)
+    LEFT JOIN endoflix_files f ON f.file_path = p.file_path
+    LEFT JOIN endoflix_thumbnail t ON t.hash_id = f.hash_id
+    GROUP BY p.file_path, f.hash_id, f.duration_seconds, f.video_codec, f.resolution
+"""
+
+# Previews whose content no longer belongs to any indexed file
+COLLECT_ORPHANS_SQL = """
+    DELETE FROM endoflix_thumbnail t
+    WHERE t.created_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+      AND NOT EXISTS (SELECT 1 FROM endoflix_files f WHERE f.hash_id = t.hash_id)
+    RETURNING t.hash_id, t.kind
+"""
+
+class ThumbnailStore:
+    """Content-addressed preview store: <root>/<kind>/<ab>/<cd>/<hash_id>.webp.
+
+    Previews are keyed by the file fingerprint (endoflix_files.hash_id), so
+    moved, renamed or duplicated videos share one thumbnail and one sprite.
+    endoflix_thumbnail indexes what exists, which turns existence and orphan
+    checks into set queries instead of directory listings.
+    """
+
+    def __init__(self, db: Database, root: Optional[Path] = None):
+        self.db = db
+        self.root = Path(root or Config.THUMB_STORE_DIR)
+
+    def path(self, hash_id: str, kind: str, ext: str = 'webp') -> Path:
+        # Dois níveis de 256 diretórios: nenhum diretório cresce com a biblioteca
+        return self.root / kind / hash_id[:2] / hash_id[2:4] / f"{hash_id}.{ext}"
+
+    def sprite_paths(self, hash_id: str) -> Tuple[Path, Path]:
+        """Sprite sheet and its JSON index."""
+        return self.path(hash_id, 'sprite'), self.path(hash_id, 'sprite', 'json')
+
+    def missing(self, files: List[str], kinds: Iterable[str] = KINDS) -> Dict[str, Tuple[str, List[str], Optional[dict]]]:
+        """{hash_id: (file_path, kinds to generate, stored media info)} for the files' content, one entry per distinct hash.
+
+        The media info (duration_seconds, video_codec, resolution) comes from
+        endoflix_files, so generation needs no probe; it is None for files not
+        indexed by a scan yet, which are fingerprinted here."""
+        kinds = list(kinds)
+        files = list(dict.fromkeys(files))
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(MISSING_PREVIEWS_SQL, (files,))
+                rows = cur.fetchall()
+            conn.rollback()  # Somente leitura
+
+        pending: Dict[str, Tuple[str, List[str], Optional[dict]]] = {}
+        unindexed = []
+        for file_path, hash_id, existing, duration, codec, resolution in rows:
+            if hash_id is None:
+                unindexed.append(file_path)
+                continue
+            needed = [kind for kind in kinds if kind not in existing]
+            if needed:
+                media = {'duration_seconds': float(duration), 'video_codec': codec, 'resolution': resolution} if duration else None
+                pending.setdefault(hash_id, (file_path, needed, media))
+
+        if unindexed:
+            fingerprints = {}
+            for file_path in unindexed:
+                try:
+                    fingerprints[file_path] = fingerprint_file(file_path, Config.HASH_ALGORITHM)
+                except OSError as e:
+                    logging.warning(f"Não foi possível calcular o fingerprint de {file_path}: {e}")
+            with self.db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "SELECT hash_id, array_agg(kind) FROM endoflix_thumbnail WHERE hash_id = ANY(%s) GROUP BY hash_id",
+                        (list(set(fingerprints.values())),)
+                    )
+                    existing = dict(cur.fetchall())
+                conn.rollback()
+            for file_path, hash_id in fingerprints.items():
+                needed = [kind for kind in kinds if kind not in existing.get(hash_id, [])]
+                if needed and hash_id not in pending:
+                    pending[hash_id] = (file_path, needed, None)
+        return pending
+
+    def add(self, entries: List[Tuple[str, str]]):
+        """Index generated previews, given as (hash_id, kind), once their files are in place."""
+        rows = []
+        for hash_id, kind in entries:
+            try:
+                rows.append((hash_id, kind, self.path(hash_id, kind).stat().st_size))
+            except OSError:
+                logging.warning(f"Preview {kind} de {hash_id} não encontrado no disco; não indexado")
+        if not rows:
+            return
+        with self.db.get_connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    execute_values(cur, """
+                        INSERT INTO endoflix_thumbnail (hash_id, kind, size_bytes) VALUES %s
+                        ON CONFLICT (hash_id, kind) DO UPDATE SET size_bytes = EXCLUDED.size_bytes
+                    """, rows)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def hash_for(self, file_path: str) -> Optional[str]:
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT hash_id FROM endoflix_files WHERE file_path = %s", (file_path,))
+                row = cur.fetchone()
+            conn.rollback()
+        return row[0] if row else None
+
+    def collect_garbage(self, grace_days: Optional[int] = None) -> int:
+        """Delete previews no indexed file references (kept for grace_days after creation,
+        which covers files fingerprinted before their first scan). Returns how many."""
+        grace_days = Config.THUMB_ORPHAN_GRACE_DAYS if grace_days is None else grace_days
+        with self.db.get_connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(COLLECT_ORPHANS_SQL, (grace_days,))
+                    orphans = cur.fetchall()
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        # Linhas removidas antes dos arquivos: um preview sem linha é apenas regenerado
+        for hash_id, kind in orphans:
+            paths = self.sprite_paths(hash_id) if kind == 'sprite' else (self.path(hash_id, kind),)
+            for path in paths:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logging.error(f"Erro ao remover preview órfão {path}: {e}")
+        if orphans:
+            logging.info(f"{len(orphans)} previews órfãos removidos")
+        return len(orphans)
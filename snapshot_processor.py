@@ -1,99 +1,201 @@
 import os
-import base64
+import uuid
+import atexit
 import logging
+import threading
+import subprocess
 from datetime import datetime
 from queue import Queue, Full
-from concurrent.futures import ThreadPoolExecutor
-import threading
+from collections import OrderedDict
 from config import Config
-from typing import List, Dict, Any, Optional
+from media_commands import burst_command
+from load_controller import low_priority_kwargs
+from typing import List, Dict, Any, Optional, Tuple
+
+SNAPSHOT_EXTENSIONS = {'image/webp': 'webp', 'image/png': 'png', 'image/jpeg': 'jpg'}
+
+class SnapshotQueueFull(Exception):
+    """Raised when a job would exceed the queue's job or byte limit."""
+
+def snapshots_dir_for(video_path: str) -> str:
+    return os.path.join(os.path.dirname(video_path), 'snapshots')
 
 class SnapshotProcessor:
-    def __init__(self):
-        self.queue = Queue(maxsize=Config.QUEUE_MAX_SIZE)
-        self.executor = ThreadPoolExecutor(max_workers=Config.SNAPSHOT_WORKERS)
-        self._start_workers()
+    """Writes snapshot frames outside the request thread.
+
+    Each upload becomes one job (all frames of a request). SNAPSHOT_WORKERS
+    threads write jobs to <video dir>/snapshots. The queue is bounded by job
+    count and by bytes waiting to be written; submit() never blocks and
+    raises SnapshotQueueFull instead, so the caller can answer 429. Job
+    status goes to Redis when a cache is given, so any app process can
+    report it. submit_burst() queues a server-side burst instead: one ffmpeg
+    run extracts the frames from the video, reporting progress as it goes.
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.queue = Queue(maxsize=Config.SNAPSHOT_QUEUE_MAX_JOBS)
+        self._lock = threading.Lock()
+        self._pending_bytes = 0
+        self._jobs: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._threads: List[threading.Thread] = []
+        self._pid = None
+        atexit.register(self.cleanup)
+
+    def submit(self, video_path: str, frames: List[Tuple[bytes, str]], is_burst: bool = False) -> Dict[str, Any]:
+        """Queue frames, given as (image bytes, extension), for video_path. Returns the job status."""
+        self._ensure_workers()
+        size = sum(len(data) for data, _ in frames)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        job = {'id': uuid.uuid4().hex, 'status': 'queued', 'total': len(frames), 'saved': 0, 'failed': 0, 'files': []}
+        with self._lock:
+            if self._pending_bytes + size > Config.SNAPSHOT_QUEUE_MAX_BYTES and self._pending_bytes > 0:
+                raise SnapshotQueueFull()
+            try:
+                self.queue.put_nowait((self._process_job, (job['id'], video_path, frames, is_burst, timestamp, size)))
+            except Full:
+                raise SnapshotQueueFull()
+            self._pending_bytes += size
+        self._set_status(job)
+        return job
+
+    def submit_burst(self, video_path: str, start: float, count: int, interval: float) -> Dict[str, Any]:
+        """Queue a burst of count frames, one every interval seconds from start, extracted by ffmpeg."""
+        self._ensure_workers()
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        job = {'id': uuid.uuid4().hex, 'status': 'queued', 'total': count, 'saved': 0, 'failed': 0, 'files': []}
+        try:
+            self.queue.put_nowait((self._extract_burst, (job['id'], video_path, start, count, interval, timestamp)))
+        except Full:
+            raise SnapshotQueueFull()
+        self._set_status(job)
+        return job
 
-    def _start_workers(self):
-        for _ in range(Config.SNAPSHOT_WORKERS):
-            self.executor.submit(self._worker_loop)
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if self.cache is not None:
+            # Status sobrescrito a cada progresso: sempre lido do Redis, nunca do cache local
+            job = self.cache.get(f"snapshot_job:{job_id}", local=False)
+            if job is not None:
+                return job
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _set_status(self, job: Dict[str, Any]):
+        with self._lock:
+            self._jobs[job['id']] = dict(job)
+            self._jobs.move_to_end(job['id'])
+            while len(self._jobs) > Config.SNAPSHOT_JOB_HISTORY:
+                self._jobs.popitem(last=False)
+        if self.cache is not None:
+            self.cache.set(f"snapshot_job:{job['id']}", job, ttl=Config.SNAPSHOT_JOB_TTL, local=False)
+
+    def _ensure_workers(self):
+        # Threads criadas sob demanda e recriadas após fork (workers do gunicorn)
+        if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+            return
+        with self._lock:
+            if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+                return
+            self._pid = os.getpid()
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(len(self._threads), Config.SNAPSHOT_WORKERS):
+                thread = threading.Thread(target=self._worker_loop, name=f'snapshot-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
 
     def _worker_loop(self):
         while True:
+            item = self.queue.get()
             try:
-                data = self.queue.get()
-                if data is None:
+                if item is None:
                     break
-
-                self._process_snapshot(data)
-                self.queue.task_done()
+                process, args = item
+                process(*args)
             except Exception as e:
                 logging.error(f"Erro no worker de snapshot: {e}")
+            finally:
                 self.queue.task_done()
 
-    def _process_snapshot(self, data: Dict[str, Any]) -> None:
+    def _process_job(self, job_id: str, video_path: str, frames: List[Tuple[bytes, str]], is_burst: bool, timestamp: str, size: int):
+        job = {'id': job_id, 'status': 'running', 'total': len(frames), 'saved': 0, 'failed': 0, 'files': []}
+        self._set_status(job)
         try:
-            video_path = data['video_path']
-            image_data = data['image_data']
-            is_burst = data['is_burst']
-            burst_index = data['burst_index']
-
-            # Remove o prefixo da URL do vídeo
-            video_path = video_path.replace('/video/', '')
-            video_path = os.path.normpath(video_path)
-
-            # Cria a pasta snapshots se não existir
-            snapshots_dir = self._ensure_snapshots_dir(video_path)
-            
-            # Gera o nome do arquivo
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            if is_burst:
-                filename = f'burst_{timestamp}_{burst_index}.webp'
-            else:
-                filename = f'snapshot_{timestamp}.webp'
-            
-            # Salva a imagem
-            file_path = os.path.join(snapshots_dir, filename)
-            image_data = base64.b64decode(image_data.split(',')[1])
-            with open(file_path, 'wb') as f:
-                f.write(image_data)
+            snapshots_dir = snapshots_dir_for(video_path)
+            os.makedirs(snapshots_dir, exist_ok=True)
+            for index, (data, extension) in enumerate(frames, 1):
+                filename = f'burst_{timestamp}_{index}.{extension}' if is_burst else f'snapshot_{timestamp}.{extension}'
+                try:
+                    with open(os.path.join(snapshots_dir, filename), 'wb', buffering=Config.SNAPSHOT_WRITE_BUFFER) as f:
+                        f.write(data)
+                    job['saved'] += 1
+                    job['files'].append(filename)
+                except OSError as e:
+                    logging.error(f"Erro ao salvar snapshot {filename}: {e}")
+                    job['failed'] += 1
+            job['status'] = 'done' if not job['failed'] else 'failed'
         except Exception as e:
-            logging.error(f"Erro ao processar snapshot: {e}")
+            logging.error(f"Erro ao processar snapshots de {video_path}: {e}")
+            job['status'] = 'failed'
+            job['error'] = str(e)
+        finally:
+            with self._lock:
+                self._pending_bytes -= size
+        self._set_status(job)
 
-    def _ensure_snapshots_dir(self, video_path: str) -> str:
-        video_dir = os.path.dirname(video_path)
-        snapshots_dir = os.path.join(video_dir, 'snapshots')
-        if not os.path.exists(snapshots_dir):
-            os.makedirs(snapshots_dir)
-        return snapshots_dir
-
-    def add_snapshot(self, video_path: str, image_data: str, is_burst: bool = False, burst_index: int = 0) -> bool:
+    def _extract_burst(self, job_id: str, video_path: str, start: float, count: int, interval: float, timestamp: str):
+        job = {'id': job_id, 'status': 'running', 'total': count, 'saved': 0, 'failed': 0, 'files': []}
+        self._set_status(job)
+        snapshots_dir = snapshots_dir_for(video_path)
+        prefix = f'burst_{timestamp}_'
+        process = None
         try:
-            self.queue.put({
-                'video_path': video_path,
-                'image_data': image_data,
-                'is_burst': is_burst,
-                'burst_index': burst_index
-            }, timeout=Config.CONNECTION_TIMEOUT)
-            return True
-        except Full:
-            logging.error("Fila de snapshots cheia")
-            return False
+            os.makedirs(snapshots_dir, exist_ok=True)
+            cmd = burst_command(Config.FFMPEG_PATH, video_path, os.path.join(snapshots_dir, f'{prefix}%d.webp'),
+                                start, count, interval, Config.SNAPSHOT_BURST_QUALITY)
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, **low_priority_kwargs())
+            # O timer encerra o ffmpeg mesmo que ele pare de emitir progresso
+            timer = threading.Timer(Config.SNAPSHOT_BURST_TIMEOUT, process.kill)
+            timer.start()
+            # Progresso do ffmpeg (-progress pipe:1): um bloco key=value a cada ~0.5s
+            try:
+                for line in process.stdout:
+                    if line.startswith('frame='):
+                        try:
+                            saved = min(count, int(line[6:]))
+                        except ValueError:
+                            continue
+                        if saved != job['saved']:
+                            job['saved'] = saved
+                            self._set_status(job)
+                returncode = process.wait()
+                timed_out = not timer.is_alive()
+            finally:
+                timer.cancel()
+            # A contagem final vem dos arquivos gerados (o vídeo pode acabar antes de count quadros)
+            job['files'] = [f'{prefix}{i}.webp' for i in range(1, count + 1)
+                            if os.path.exists(os.path.join(snapshots_dir, f'{prefix}{i}.webp'))]
+            job['saved'] = len(job['files'])
+            job['failed'] = count - job['saved']
+            job['status'] = 'done' if returncode == 0 and job['saved'] else 'failed'
+            if timed_out:
+                job['error'] = f'Tempo limite de {Config.SNAPSHOT_BURST_TIMEOUT}s excedido'
+            elif returncode != 0:
+                job['error'] = f'ffmpeg terminou com código {returncode}'
         except Exception as e:
-            logging.error(f"Erro ao adicionar snapshot: {e}")
-            return False
-
-    def add_burst(self, video_path: str, frames: List[str]) -> bool:
-        success = True
-        for i, frame_data in enumerate(frames, 1):
-            if not self.add_snapshot(video_path, frame_data, is_burst=True, burst_index=i):
-                success = False
-        return success
+            if process is not None and process.poll() is None:
+                process.kill()
+            logging.error(f"Erro ao extrair burst de {video_path}: {e}")
+            job['status'] = 'failed'
+            job['error'] = str(e)
+        self._set_status(job)
 
     def cleanup(self):
-        for _ in range(Config.SNAPSHOT_WORKERS):
-            try:
-                self.queue.put(None, timeout=Config.CONNECTION_TIMEOUT)
-            except Full:
-                pass
-        self.executor.shutdown(wait=True) 
\ No newline at end of file
+        """Write what is queued, then stop the workers."""
+        if self._pid != os.getpid():
+            return
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=Config.CONNECTION_TIMEOUT)
+        self._threads = []
@@ -0,0 +1,280 @@
+import os
+import asyncio
+import secrets
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+from flask import Response, request
+from werkzeug.wsgi import wrap_file
+from config import Config
+
+Range = Tuple[int, int]
+
+
+@dataclass
+class RangePlan:
+    """Status, headers and byte ranges of a response, independent of the server that sends it."""
+    status: int
+    headers: Dict[str, str]
+    size: int
+    mimetype: str
+    ranges: List[Range] = field(default_factory=list)  # Vazio: sem corpo
+    boundary: Optional[str] = None  # Só em multipart/byteranges
+
+    @property
+    def content_type(self) -> str:
+        return f'multipart/byteranges; boundary={self.boundary}' if self.boundary else self.mimetype
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when none of the requested byte ranges overlap the file."""
+
+
+def make_etag(stats: os.stat_result) -> str:
+    """Strong validator derived from size and mtime (no file read needed)."""
+    return f'"{stats.st_size:x}-{stats.st_mtime_ns:x}"'
+
+
+def parse_range_header(header: Optional[str], size: int, max_length: Optional[int] = None,
+                       max_ranges: Optional[int] = None) -> Optional[List[Range]]:
+    """Parse a `Range: bytes=...` header into inclusive (start, end) pairs.
+
+    Returns None when the header is absent or malformed (serve the full
+    entity). Open-ended ranges (`500-`) are capped at `max_length` bytes so a
+    `bytes=0-` on a huge file does not turn into a multi-GB response.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec.strip():
+        return None
+
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part or '-' not in part:
+            return None
+        first, _, last = part.partition('-')
+        first, last = first.strip(), last.strip()
+        try:
+            if not first:
+                # Sufixo: últimos N bytes
+                suffix = int(last)
+                if suffix <= 0:
+                    continue
+                start, end = max(size - suffix, 0), size - 1
+            else:
+                start = int(first)
+                if last:
+                    end = min(int(last), size - 1)
+                    if end < start:
+                        return None
+                else:
+                    end = size - 1
+                    if max_length:
+                        end = min(end, start + max_length - 1)
+        except ValueError:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, end))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+    if max_ranges and len(ranges) > max_ranges:
+        # Muitos intervalos: responde com o primeiro para evitar abuso
+        ranges = ranges[:1]
+    return ranges
+
+
+def if_range_matches(if_range: Optional[str], etag: str, mtime: float) -> bool:
+    """Evaluate an If-Range precondition against the current validators."""
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # Comparação forte: ETags fracos nunca satisfazem If-Range
+        return if_range == etag
+    try:
+        since = parsedate_to_datetime(if_range)
+    except (TypeError, ValueError):
+        return False
+    return int(mtime) <= int(since.timestamp())
+
+
+def iter_file_range(path: str, start: int, end: int, chunk_size: int = None) -> Iterator[bytes]:
+    """Yield the inclusive byte range in bounded chunks."""
+    chunk_size = chunk_size or Config.STREAM_CHUNK_SIZE
+    remaining = end - start + 1
+    with open(path, 'rb', buffering=0) as f:
+        f.seek(start)
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def _iter_multipart(path: str, ranges: List[Range], size: int, mimetype: str, boundary: str) -> Iterator[bytes]:
+    for start, end in ranges:
+        yield _part_header(boundary, mimetype, start, end, size)
+        yield from iter_file_range(path, start, end)
+        yield b'\r\n'
+    yield f'--{boundary}--\r\n'.encode()
+
+
+def _part_header(boundary: str, mimetype: str, start: int, end: int, size: int) -> bytes:
+    return (f'--{boundary}\r\n'
+            f'Content-Type: {mimetype}\r\n'
+            f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n').encode()
+
+
+class RangeReader:
+    """File object limited to one byte range, for wsgi.file_wrapper.
+
+    fileno() is passed through, so gunicorn can still sendfile from the
+    current offset (bounded by Content-Length). When the wrapper iterates
+    instead (no sendfile: SSL, sendfile off, Werkzeug's FileWrapper),
+    read() stops at the end of the range rather than at EOF.
+    """
+
+    def __init__(self, path: str, start: int, end: int):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start + 1
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b''
+        size = self._remaining if size is None or size < 0 else min(size, self._remaining)
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def fileno(self) -> int:
+        return self._file.fileno()
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+def _single_range_body(path: str, start: int, end: int):
+    """Prefer the server's wsgi.file_wrapper (sendfile under gunicorn)."""
+    if Config.STREAM_USE_SENDFILE and 'wsgi.file_wrapper' in request.environ:
+        # O gunicorn usa o offset atual do arquivo e o Content-Length para o sendfile
+        return wrap_file(request.environ, RangeReader(path, start, end), Config.STREAM_CHUNK_SIZE)
+    return iter_file_range(path, start, end)
+
+
+def plan_range_response(path: str, get_header: Callable[[str], Optional[str]], mimetype: str = 'video/mp4',
+                        stats: Optional[os.stat_result] = None) -> RangePlan:
+    """Decide status, headers and ranges for `path` honouring Range/If-Range/If-None-Match.
+
+    get_header looks up a request header by name; stats may be passed when
+    the caller already has them (e.g. from a non-blocking stat).
+    """
+    stats = stats or os.stat(path)
+    size = stats.st_size
+    etag = make_etag(stats)
+    last_modified = format_datetime(datetime.fromtimestamp(int(stats.st_mtime), tz=timezone.utc), usegmt=True)
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': etag,
+        'Last-Modified': last_modified,
+    }
+
+    if get_header('If-None-Match') == etag:
+        return RangePlan(304, headers, size, mimetype)
+
+    ranges = None
+    if if_range_matches(get_header('If-Range'), etag, stats.st_mtime):
+        try:
+            ranges = parse_range_header(
+                get_header('Range'), size,
+                max_length=Config.STREAM_MAX_RANGE_BYTES,
+                max_ranges=Config.STREAM_MAX_RANGES
+            )
+        except RangeNotSatisfiable:
+            headers['Content-Range'] = f'bytes */{size}'
+            return RangePlan(416, headers, size, mimetype)
+
+    if not ranges:
+        headers['Content-Length'] = str(size)
+        return RangePlan(200, headers, size, mimetype, [(0, size - 1)] if size else [])
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        headers['Content-Length'] = str(end - start + 1)
+        return RangePlan(206, headers, size, mimetype, ranges)
+    boundary = secrets.token_hex(16)
+    length = sum(len(_part_header(boundary, mimetype, s, e, size)) + (e - s + 1) + 2 for s, e in ranges)
+    length += len(f'--{boundary}--\r\n')
+    headers['Content-Length'] = str(length)
+    return RangePlan(206, headers, size, mimetype, ranges, boundary)
+
+
+def send_file_range(path: str, mimetype: str = 'video/mp4', plan: Optional[RangePlan] = None) -> Response:
+    """Build a streaming response for `path` honouring Range/If-Range.
+
+    Memory per connection is bounded by STREAM_CHUNK_SIZE regardless of the
+    file or range size. `plan` may be passed when the caller needs the status
+    before the response is built.
+    """
+    plan = plan or plan_range_response(path, request.headers.get, mimetype)
+    if plan.boundary:
+        body = _iter_multipart(path, plan.ranges, plan.size, mimetype, plan.boundary)
+        response = Response(body, status=plan.status, content_type=plan.content_type, headers=plan.headers)
+    elif plan.ranges:
+        start, end = plan.ranges[0]
+        response = Response(_single_range_body(path, start, end), status=plan.status, mimetype=mimetype, headers=plan.headers)
+    elif plan.status == 200:
+        # Arquivo vazio
+        response = Response(iter(()), status=plan.status, mimetype=mimetype, headers=plan.headers)
+    else:
+        return Response(status=plan.status, headers=plan.headers)
+
+    response.direct_passthrough = True
+    logging.debug(f"Streaming {path}: status={response.status_code} ranges={plan.ranges}")
+    return response
+
+
+async def aiter_file_range(path: str, start: int, end: int, executor=None, chunk_size: int = None) -> AsyncIterator[bytes]:
+    """Async counterpart of iter_file_range: open, read and close run on `executor`, off the event loop."""
+    loop = asyncio.get_running_loop()
+    chunk_size = chunk_size or Config.STREAM_CHUNK_SIZE
+    remaining = end - start + 1
+    f = await loop.run_in_executor(executor, open, path, 'rb', 0)
+    try:
+        await loop.run_in_executor(executor, f.seek, start)
+        while remaining > 0:
+            data = await loop.run_in_executor(executor, f.read, min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        await loop.run_in_executor(executor, f.close)
+
+
+async def aiter_plan_body(path: str, plan: RangePlan, executor=None) -> AsyncIterator[bytes]:
+    """Body of a RangePlan (single range or multipart/byteranges), read without blocking the event loop."""
+    if not plan.boundary:
+        for start, end in plan.ranges:
+            async for chunk in aiter_file_range(path, start, end, executor):
+                yield chunk
+        return
+    for start, end in plan.ranges:
+        yield _part_header(plan.boundary, plan.mimetype, start, end, plan.size)
+        async for chunk in aiter_file_range(path, start, end, executor):
+            yield chunk
+        yield b'\r\n'
+    yield f'--{plan.boundary}--\r\n'.encode()
@@ -1,13 +1,15 @@
 #!/usr/bin/env python3
 """
 Test script for EndoFlix thumbnail logic implementation.
-Tests all requirements: .thumbs folder creation, 50x50 WebP thumbnails,
+Tests all requirements: content-addressed store layout
+(THUMB_STORE_DIR/<kind>/<ab>/<cd>/<hash>.webp), 50x50 WebP thumbnails,
 frame extraction from 10% into video, sanitization, and performance.
 """
 
 import os
 import sys
 import time
+import shutil
 import logging
 from pathlib import Path
 from PIL import Image
@@ -19,6 +21,7 @@ sys.path.insert(0, os.getcwd())
 from thumbnail_processor import ThumbnailProcessor
 from db import Database
 from config import Config
+from fingerprint import fingerprint_file
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -29,8 +32,24 @@ class ThumbnailTester:
         self.config = Config()
         self.db = Database()
         self.processor = ThumbnailProcessor()
+        self.store = self.processor.store
         self.test_dir = Path("test_thumbnails")
         self.playlist_name = "test_playlist"
+        self.orphan_hash = "0" * 64
+
+    def video_hashes(self, video_files):
+        """Fingerprint of each video, as the store computes it for unindexed files."""
+        return {video: fingerprint_file(video, Config.HASH_ALGORITHM) for video in video_files}
+
+    def thumb_path(self, video_path):
+        return self.store.path(fingerprint_file(video_path, Config.HASH_ALGORITHM), 'thumb')
+
+    def playlist_videos(self):
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT files FROM endoflix_playlist WHERE name = %s", (self.playlist_name,))
+                result = cur.fetchone()
+                return result[0] if result else []
 
     def setup_test_playlist(self):
         """Create a test playlist with the sample videos."""
@@ -60,60 +79,67 @@ class ThumbnailTester:
         """Clean up any previous test artifacts."""
         logger.info("Cleaning up previous test artifacts...")
 
-        # Remove .thumbs directory if it exists
-        thumbs_dir = self.test_dir / '.thumbs'
-        if thumbs_dir.exists():
-            import shutil
-            shutil.rmtree(thumbs_dir)
-            logger.info("Removed existing .thumbs directory")
+        # Remove only the test videos' previews: the store is shared with the real library
+        hashes = list(self.video_hashes(str(f.absolute()) for f in self.test_dir.glob("*.mp4")).values())
+        hashes.append(self.orphan_hash)
+        for hash_id in hashes:
+            for path in (self.store.path(hash_id, 'thumb'), *self.store.sprite_paths(hash_id)):
+                if path.exists():
+                    path.unlink()
+        logger.info(f"Removed stored previews of {len(hashes)} test hashes")
 
-        # Remove test playlist from database
+        # Remove test playlist and preview index rows from database
         with self.db.get_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("DELETE FROM endoflix_playlist WHERE name = %s", (self.playlist_name,))
+                cur.execute("DELETE FROM endoflix_thumbnail WHERE hash_id = ANY(%s)", (hashes,))
                 conn.commit()
-                logger.info("Removed existing test playlist from database")
+                logger.info("Removed existing test playlist and preview rows from database")
 
-    def test_thumbs_folder_creation(self):
-        """Test 1: Verify .thumbs folder is created in playlist directory."""
-        logger.info("Testing .thumbs folder creation...")
+    def test_store_layout(self):
+        """Test 1: Verify thumbnails are saved in the content-addressed store, not next to the videos."""
+        logger.info("Testing thumbnail store layout...")
 
-        thumbs_dir = self.test_dir / '.thumbs'
-        assert not thumbs_dir.exists(), ".thumbs directory should not exist before processing"
+        video_files = self.playlist_videos()
+        for video_path, hash_id in self.video_hashes(video_files).items():
+            assert not self.store.path(hash_id, 'thumb').exists(), f"Thumbnail should not exist before processing: {video_path}"
 
         # Process thumbnails
         result = self.processor.process_playlist_thumbnails(self.playlist_name)
         assert result['success'], f"Thumbnail processing failed: {result.get('error', 'Unknown error')}"
 
-        # Check if .thumbs directory was created
-        assert thumbs_dir.exists(), ".thumbs directory was not created"
-        assert thumbs_dir.is_dir(), ".thumbs should be a directory"
+        for video_path, hash_id in self.video_hashes(video_files).items():
+            thumb_path = self.store.path(hash_id, 'thumb')
+            expected = Path(self.store.root) / 'thumb' / hash_id[:2] / hash_id[2:4] / f"{hash_id}.webp"
+            assert thumb_path == expected, f"Unexpected store path {thumb_path}"
+            assert thumb_path.exists(), f"Thumbnail was not created in the store for {video_path}"
+
+        # O layout antigo gravava <pasta>/.thumbs/<nome>.webp
+        assert not (self.test_dir / '.thumbs').exists(), ".thumbs directory should no longer be created"
 
-        logger.info("✓ .thumbs folder creation test passed")
+        logger.info("✓ Thumbnail store layout test passed")
         return True
 
     def test_thumbnail_generation(self):
-        """Test 2: Verify 50x50 square WebP thumbnails with same name as video."""
+        """Test 2: Verify 50x50 square WebP thumbnails keyed by the video fingerprint."""
         logger.info("Testing thumbnail generation...")
 
-        thumbs_dir = self.test_dir / '.thumbs'
+        video_files = self.playlist_videos()
+        assert len(video_files) > 0, "No video files in playlist"
 
-        # Get video files
+        hashes = self.video_hashes(video_files)
         with self.db.get_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT files FROM endoflix_playlist WHERE name = %s", (self.playlist_name,))
-                result = cur.fetchone()
-                video_files = result[0] if result else []
-
-        assert len(video_files) > 0, "No video files in playlist"
+                cur.execute("SELECT hash_id FROM endoflix_thumbnail WHERE kind = 'thumb' AND hash_id = ANY(%s)", (list(hashes.values()),))
+                indexed = {row[0] for row in cur.fetchall()}
 
         # Check each video has a corresponding thumbnail
-        for video_path in video_files:
-            video_name = Path(video_path).stem
-            thumb_path = thumbs_dir / f"{video_name}.webp"
+        for video_path, hash_id in hashes.items():
+            thumb_path = self.store.path(hash_id, 'thumb')
 
-            assert thumb_path.exists(), f"Thumbnail not found for {video_name}"
+            assert thumb_path.exists(), f"Thumbnail not found for {Path(video_path).name}"
             assert thumb_path.is_file(), f"Thumbnail should be a file: {thumb_path}"
+            assert hash_id in indexed, f"Thumbnail not indexed in endoflix_thumbnail: {thumb_path}"
 
             # Verify it's a valid WebP image
             try:
@@ -152,53 +178,53 @@ class ThumbnailTester:
         return True
 
     def test_sanitization(self):
-        """Test 4: Test sanitization (deleting orphaned thumbs, creating only for new videos)."""
+        """Test 4: Test sanitization (collecting orphaned thumbs, sharing thumbs between copies of a video)."""
         logger.info("Testing sanitization...")
 
-        thumbs_dir = self.test_dir / '.thumbs'
-
-        # First, create an orphaned thumbnail (no corresponding video)
-        orphaned_thumb = thumbs_dir / "orphaned.webp"
+        # First, index an orphaned thumbnail (no indexed video has its hash), past the grace period
+        orphaned_thumb = self.store.path(self.orphan_hash, 'thumb')
+        orphaned_thumb.parent.mkdir(parents=True, exist_ok=True)
         orphaned_thumb.write_bytes(b"fake webp data")
-
-        # Add a new video to the playlist
-        new_video_path = self.test_dir / "test_video4.mp4"
-        # Copy an existing video as the new one
-        import shutil
-        shutil.copy(self.test_dir / "test_video1.mp4", new_video_path)
-
-        # Update playlist with new video
         with self.db.get_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT files FROM endoflix_playlist WHERE name = %s", (self.playlist_name,))
-                result = cur.fetchone()
-                current_files = result[0] if result else []
-                current_files.append(str(new_video_path.absolute()))
-                cur.execute("UPDATE endoflix_playlist SET files = %s WHERE name = %s", (current_files, self.playlist_name))
+                cur.execute(
+                    "INSERT INTO endoflix_thumbnail (hash_id, kind, size_bytes, created_at) VALUES (%s, 'thumb', %s, CURRENT_TIMESTAMP - INTERVAL '1 day') ON CONFLICT (hash_id, kind) DO NOTHING",
+                    (self.orphan_hash, orphaned_thumb.stat().st_size)
+                )
                 conn.commit()
 
-        # Re-run thumbnail processing
-        result = self.processor.process_playlist_thumbnails(self.playlist_name)
-        assert result['success'], f"Thumbnail processing failed: {result.get('error', 'Unknown error')}"
-
-        # Check orphaned thumbnail was deleted
+        assert self.store.collect_garbage(grace_days=0) >= 1, "Orphaned thumbnail was not collected"
         assert not orphaned_thumb.exists(), "Orphaned thumbnail was not deleted"
 
-        # Check new thumbnail was created
-        new_thumb_path = thumbs_dir / "test_video4.webp"
-        assert new_thumb_path.exists(), "New thumbnail was not created"
+        # Add a copy of an existing video to the playlist
+        new_video_path = self.test_dir / "test_video4.mp4"
+        shutil.copy(self.test_dir / "test_video1.mp4", new_video_path)
 
-        # Clean up
-        new_video_path.unlink()
+        # Update playlist with new video
+        current_files = self.playlist_videos()
         with self.db.get_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT files FROM endoflix_playlist WHERE name = %s", (self.playlist_name,))
-                result = cur.fetchone()
-                current_files = result[0] if result else []
-                current_files = [f for f in current_files if f != str(new_video_path.absolute())]
-                cur.execute("UPDATE endoflix_playlist SET files = %s WHERE name = %s", (current_files, self.playlist_name))
+                cur.execute("UPDATE endoflix_playlist SET files = %s WHERE name = %s",
+                            (current_files + [str(new_video_path.absolute())], self.playlist_name))
                 conn.commit()
 
+        try:
+            # Re-run thumbnail processing
+            result = self.processor.process_playlist_thumbnails(self.playlist_name)
+            assert result['success'], f"Thumbnail processing failed: {result.get('error', 'Unknown error')}"
+
+            # Same content, same fingerprint: the copy reuses the existing thumbnail
+            assert not result.get('generated'), f"Copy of a video should not generate a new thumbnail: {result}"
+            assert self.thumb_path(str(new_video_path.absolute())) == self.thumb_path(str((self.test_dir / "test_video1.mp4").absolute()))
+            assert not (self.test_dir / '.thumbs').exists(), ".thumbs directory should no longer be created"
+        finally:
+            # Clean up
+            new_video_path.unlink()
+            with self.db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("UPDATE endoflix_playlist SET files = %s WHERE name = %s", (current_files, self.playlist_name))
+                    conn.commit()
+
         logger.info("✓ Sanitization test passed")
         return True
 
@@ -237,11 +263,10 @@ class ThumbnailTester:
         assert result['success'], f"Large playlist processing failed: {result.get('error', 'Unknown error')}"
         assert processing_time < 120, f"Processing took too long: {processing_time:.2f} seconds (should be < 120s for 120 videos)"
 
-        # Verify all thumbnails were created (should be 3 unique thumbnails since same videos repeated)
-        thumbs_dir = self.test_dir / '.thumbs'
-        expected_thumbs = len(set(Path(f).stem for f in large_video_files))  # Unique video names
-        actual_thumbs = len(list(thumbs_dir.glob("*.webp")))
-        assert actual_thumbs >= expected_thumbs, f"Expected at least {expected_thumbs} thumbnails, got {actual_thumbs}"
+        # Verify all thumbnails were created (one per distinct content, since the same video is repeated)
+        hashes = set(self.video_hashes(set(large_video_files)).values())
+        actual_thumbs = sum(1 for hash_id in hashes if self.store.path(hash_id, 'thumb').exists())
+        assert actual_thumbs == len(hashes), f"Expected {len(hashes)} thumbnails, got {actual_thumbs}"
 
         # Verify batch processing and worker settings
         logger.info(f"Configuration: workers={self.processor.max_workers}, batch_size={self.processor.batch_size}, timeout={self.processor.ffmpeg_timeout}s")
@@ -264,28 +289,14 @@ class ThumbnailTester:
         assert self.processor.ffmpeg_timeout == 60, f"Expected 60s timeout, got {self.processor.ffmpeg_timeout}"
         assert self.processor.batch_size == 100, f"Expected batch size 100, got {self.processor.batch_size}"
 
-        # Test .thumbs folder creation as hidden
-        thumbs_dir = self.test_dir / '.thumbs'
+        # Test the store location comes from the configuration
+        assert Path(self.store.root) == Path(Config.THUMB_STORE_DIR), f"Store root {self.store.root} is not THUMB_STORE_DIR"
         result = self.processor.process_playlist_thumbnails(self.playlist_name)
         assert result['success'], f"Thumbnail processing failed: {result.get('error', 'Unknown error')}"
 
-        assert thumbs_dir.exists(), ".thumbs directory was not created"
-        if os.name == 'nt':  # Windows
-            import ctypes
-            attrs = ctypes.windll.kernel32.GetFileAttributesW(str(thumbs_dir))
-            is_hidden = bool(attrs & 2)  # FILE_ATTRIBUTE_HIDDEN
-            assert is_hidden, ".thumbs directory should be hidden on Windows"
-
         # Test correct saving location
-        with self.db.get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT files FROM endoflix_playlist WHERE name = %s", (self.playlist_name,))
-                result = cur.fetchone()
-                video_files = result[0] if result else []
-
-        for video_path in video_files:
-            video_name = Path(video_path).stem
-            thumb_path = thumbs_dir / f"{video_name}.webp"
+        for video_path in self.playlist_videos():
+            thumb_path = self.thumb_path(video_path)
             assert thumb_path.exists(), f"Thumbnail not saved in correct location: {thumb_path}"
 
         # Test progress logging (check if logs contain expected messages)
@@ -312,7 +323,7 @@ class ThumbnailTester:
             # Run tests
             test_results = []
 
-            test_results.append(("Thumbs folder creation", self.test_thumbs_folder_creation()))
+            test_results.append(("Thumbnail store layout", self.test_store_layout()))
             test_results.append(("Thumbnail generation", self.test_thumbnail_generation()))
             test_results.append(("Frame extraction timing", self.test_frame_extraction_timing()))
             test_results.append(("Sanitization", self.test_sanitization()))
@@ -0,0 +1,76 @@
+import pytest
+from unittest.mock import MagicMock
+from services.analytics_service import AnalyticsService, session_timestamp
+
+ROLLUP_ROWS = [
+    ('videos', '', 3), ('extension', '.mp4', 2), ('extension', '.mkv', 1),
+    ('video_codec', 'h264', 3), ('playlists', 'saved', 2), ('playlists', 'temp', 1),
+    ('sessions', '', 2), ('player_slot', '1', 2), ('player_slot', '3', 1)
+]
+
+class TestAnalyticsService:
+    @pytest.fixture
+    def service(self):
+        db = MagicMock()
+        service = AnalyticsService(db)
+        service.cursor = db.get_connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        return service
+
+    def test_stats_from_rollup(self, service):
+        """Test totals come from the rollup table, not from counting the library"""
+        service.cursor.fetchall.return_value = ROLLUP_ROWS
+        totals = service.totals(service.rollup())
+        assert totals == {'videos': 3, 'saved_playlists': 2, 'playlists': 3, 'sessions': 2}
+        assert 'endoflix_files' not in service.cursor.execute.call_args[0][0]
+
+    def test_dashboard(self, service):
+        service.cursor.fetchall.side_effect = [
+            ROLLUP_ROWS,
+            [('fav', 7)],
+            [('/v/a.mp4', 5, True)],
+            [('2024-05-02T10-00-00_b', ['/v/b.mp4', None]), ('2024-05-01T10-00-00_a', ['/v/a.mp4'])]
+        ]
+        data = service.dashboard()
+        assert data['stats'] == {'videos': 3, 'playlists': 3, 'sessions': 2}
+        assert data['file_types'] == {'.mp4': 2, '.mkv': 1}
+        assert data['player_usage'] == [2, 0, 1, 0]
+        # Sessões mais recentes, em ordem cronológica
+        assert [s['name'] for s in data['sessions']] == ['2024-05-01T10-00-00_a', '2024-05-02T10-00-00_b']
+        assert data['sessions'][0]['timestamp'] == '2024-05-01T10:00:00'
+
+    def test_refresh_skipped_when_locked(self, service):
+        service.cursor.fetchone.return_value = (False,)
+        assert service.refresh() is False
+        executed = [c[0][0] for c in service.cursor.execute.call_args_list]
+        assert not any('refresh_analytics_stats' in sql for sql in executed)
+
+    def test_refresh_rebuilds_on_drift(self, service):
+        """Test a rollup that no longer matches mv_analytics_stats is rebuilt"""
+        service.cursor.fetchone.side_effect = [(True,), (True,)]
+        assert service.refresh() is True
+        executed = [c[0][0] for c in service.cursor.execute.call_args_list]
+        assert 'SELECT refresh_analytics_stats()' in executed
+        assert 'SELECT rebuild_analytics_rollup()' in executed
+
+    def test_refresh_without_drift(self, service):
+        service.cursor.fetchone.side_effect = [(True,), (False,)]
+        assert service.refresh() is True
+        executed = [c[0][0] for c in service.cursor.execute.call_args_list]
+        assert 'SELECT rebuild_analytics_rollup()' not in executed
+
+    def test_session_timestamp(self):
+        assert session_timestamp('2024-05-01T10-30-00_abc').hour == 10
+        assert session_timestamp('minha sessão') is None
+
+    def test_views_by_day_use_daily_rollup(self, service):
+        service.cursor.fetchall.side_effect = [[('/v/a.mp4', 4, 120.0)], [(0, 4, 0.0), (2, 0, 120.0)]]
+        data = service.views(days=7)
+        assert data['top'] == [{'path': '/v/a.mp4', 'views': 4, 'watched_seconds': 120.0}]
+        assert data['player_slots'][0]['slot'] is None
+        executed = ' '.join(c[0][0] for c in service.cursor.execute.call_args_list)
+        assert 'endoflix_view_daily' in executed and 'endoflix_view_events' not in executed
+
+    def test_views_by_hour_use_hourly_rollup(self, service):
+        service.cursor.fetchall.return_value = []
+        service.views(hours=6)
+        assert 'endoflix_view_hourly' in service.cursor.execute.call_args[0][0]
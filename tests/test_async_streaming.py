@@ -0,0 +1,174 @@
+import json
+import asyncio
+import threading
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from flask import Flask
+from async_streaming import StreamingApp
+
+
+def run(app, method, path, headers=(), body=b'', query=b''):
+    """Drive one ASGI request through `app`; returns (status, headers, body)."""
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query,
+             'headers': [(k.lower().encode(), v.encode()) for k, v in headers], 'client': ('127.0.0.1', 5000)}
+    asyncio.run(asyncio.wait_for(app(scope, receive, send), 5))
+    start = sent[0]
+    return start['status'], {k.decode(): v.decode() for k, v in start['headers']}, b''.join(m.get('body', b'') for m in sent[1:])
+
+
+class TestStreamingApp:
+    @pytest.fixture
+    def flask_app(self):
+        app = Flask(__name__)
+        app.secret_key = 'test'
+        return app
+
+    @pytest.fixture
+    def cookie(self, flask_app):
+        session = flask_app.session_interface.get_signing_serializer(flask_app).dumps({'_user_id': '1'})
+        return ('Cookie', f'session={session}')
+
+    @pytest.fixture
+    def app(self, flask_app):
+        async def fallback(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 299, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b'flask'})
+
+        recorder = MagicMock()
+        recorder.record_async = AsyncMock(return_value=True)
+        scans = []
+
+        def scan_source(folder, incremental=True):
+            scans.append((folder, incremental))
+            yield 'data: {"status": "start"}\n\n'
+            yield 'data: {"status": "done"}\n\n'
+
+        app = StreamingApp(fallback, flask_app, view_recorder=recorder, scan_source=scan_source)
+        app._redis = MagicMock()
+        app.scans = scans
+        return app
+
+    @pytest.fixture
+    def media(self, tmp_path):
+        path = tmp_path / 'video.mp4'
+        path.write_bytes(bytes(range(256)) * 40)
+        return path
+
+    def test_range_request(self, app, cookie, media):
+        """Test a range request is answered on the event loop with the exact bytes"""
+        status, headers, body = run(app, 'GET', f'/video/{media}', [cookie, ('Range', 'bytes=10-19')])
+        assert status == 206
+        assert headers['content-range'] == f'bytes 10-19/{media.stat().st_size}'
+        assert body == media.read_bytes()[10:20]
+        app.view_recorder.record_async.assert_awaited_once()
+
+    def test_full_and_multipart(self, app, cookie, media):
+        """Test full and multi-range responses match Content-Length"""
+        status, headers, body = run(app, 'GET', f'/video/{media}', [cookie])
+        assert (status, body) == (200, media.read_bytes())
+        status, headers, body = run(app, 'GET', f'/video/{media}', [cookie, ('Range', 'bytes=0-4,100-104')])
+        assert status == 206 and headers['content-type'].startswith('multipart/byteranges')
+        assert int(headers['content-length']) == len(body)
+
+    def test_empty_responses_are_not_views(self, app, cookie, media):
+        """Test 304 and 416 responses do not count as views"""
+        etag = run(app, 'GET', f'/video/{media}', [cookie, ('Range', 'bytes=0-0')])[1]['etag']
+        app.view_recorder.record_async.reset_mock()
+        assert run(app, 'GET', f'/video/{media}', [cookie, ('If-None-Match', etag)])[0] == 304
+        assert run(app, 'GET', f'/video/{media}', [cookie, ('Range', 'bytes=999999-')])[0] == 416
+        app.view_recorder.record_async.assert_not_awaited()
+
+    def test_missing_file(self, app, cookie, tmp_path):
+        status, _, body = run(app, 'GET', f'/video/{tmp_path}/missing.mp4', [cookie])
+        assert status == 404
+        assert json.loads(body)['error']
+
+    def test_unauthenticated_goes_to_flask(self, app, media):
+        """Test requests without a valid session fall back to Flask (login redirect)"""
+        assert run(app, 'GET', f'/video/{media}')[0] == 299
+        assert run(app, 'GET', f'/video/{media}', [('Cookie', 'session=forged.value')])[0] == 299
+
+    def test_user_loader_runs_off_the_loop(self, app, cookie, media):
+        """Test the user loader (possibly DB-backed) is called on the IO pool, not the event loop"""
+        threads = []
+        with patch('async_streaming.load_user', side_effect=lambda user_id: threads.append(threading.current_thread().name) or object()):
+            assert run(app, 'GET', f'/video/{media}', [cookie, ('Range', 'bytes=0-0')])[0] == 206
+        assert threads and threads[0].startswith('asgi-io')
+
+    def test_other_routes_go_to_flask(self, app, cookie):
+        assert run(app, 'GET', '/playlists', [cookie])[0] == 299
+
+    def test_scan_events(self, app, cookie, tmp_path):
+        """Test the scan generator runs off the loop and its SSE events are forwarded"""
+        status, headers, body = run(app, 'GET', '/scan', [cookie], query=f'folder={tmp_path}&full=1'.encode())
+        assert status == 200 and headers['content-type'].startswith('text/event-stream')
+        assert body.count(b'data: ') == 2
+        assert app.scans == [(str(tmp_path), False)]
+
+    def test_scan_post_validation(self, app, cookie, tmp_path):
+        status, _, _ = run(app, 'POST', '/scan', [cookie], body=json.dumps({'folder': str(tmp_path / 'nope')}).encode())
+        assert status == 400
+        status, _, body = run(app, 'POST', '/scan', [cookie], body=json.dumps({'folder': str(tmp_path)}).encode())
+        assert status == 200 and app.scans == [(str(tmp_path), True)]
+
+    def test_scan_end_reaches_slow_client(self, app, cookie, tmp_path):
+        """Test the end of a scan is delivered even when a slow client keeps the event queue full"""
+        def many(folder, incremental=True):
+            for i in range(200):
+                yield f'data: {{"n": {i}}}\n\n'
+
+        app.scan_source = many
+        sent = []
+
+        async def receive():
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            await asyncio.sleep(0.001)
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/scan', 'query_string': f'folder={tmp_path}'.encode(),
+                 'headers': [(b'cookie', cookie[1].encode())], 'client': ('127.0.0.1', 5000)}
+        with patch('async_streaming.Config.ASGI_SCAN_QUEUE', 2):
+            asyncio.run(asyncio.wait_for(app(scope, receive, send), 5))
+        assert b''.join(m.get('body', b'') for m in sent[1:]).count(b'data: ') == 200
+        assert sent[-1] == {'type': 'http.response.body', 'body': b''}
+
+    def test_scan_stops_on_disconnect(self, app, cookie, tmp_path):
+        """Test a client leaving mid-scan closes the scan generator instead of leaving it running"""
+        closed = threading.Event()
+
+        def endless(folder, incremental=True):
+            try:
+                while True:
+                    yield 'data: {}\n\n'
+            finally:
+                closed.set()
+
+        app.scan_source = endless
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.sleep(0.05)
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            pass
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/scan', 'query_string': f'folder={tmp_path}'.encode(),
+                 'headers': [(b'cookie', cookie[1].encode())], 'client': None}
+        asyncio.run(asyncio.wait_for(app(scope, receive, send), 5))
+        assert closed.wait(5)
@@ -0,0 +1,193 @@
+import json
+import zlib
+import pytest
+from unittest.mock import patch, MagicMock
+from cache import RedisCache
+
+def make_cache():
+    # Instâncias independentes (RedisCache é singleton), simulando dois workers
+    cache = object.__new__(RedisCache)
+    RedisCache.__init__(cache)
+    cache._client = MagicMock()
+    cache._subscribed.set()
+    return cache
+
+@pytest.fixture
+def workers():
+    with patch.object(RedisCache, '_ensure_subscriber'):
+        yield make_cache(), make_cache()
+
+class TestRedisCacheCoherence:
+    def test_delete_invalidates_other_workers(self, workers):
+        """Test a delete in one worker evicts the key from another worker's local tier"""
+        a, b = workers
+        b._local_cache['playlist:x'] = 'stale'
+        a._client.incr.return_value = 1
+        a.delete('playlist:x')
+        channel, payload = a._client.publish.call_args[0]
+        b._epoch = 0
+        b._handle_invalidation(payload)
+        assert 'playlist:x' not in b._local_cache
+
+    def test_own_invalidation_keeps_local_value(self, workers):
+        a, _ = workers
+        a._client.incr.return_value = 1
+        a._epoch = 0
+        a.delete('playlist:x')
+        a.set('playlist:x', 'fresh')
+        # A mensagem do próprio delete chega depois do valor recalculado
+        a._handle_invalidation(a._client.publish.call_args[0][1])
+        assert a._local_cache['playlist:x'] == 'fresh'
+
+    def test_set_publishes_nothing(self, workers):
+        """Test writes leave the epoch and the other workers' local tiers alone"""
+        a, b = workers
+        b._local_cache['probe:x'] = 'kept'
+        a.set('probe:x', 'v')
+        a.batch_set({'k1': '1', 'k2': '2'})
+        a._client.incr.assert_not_called()
+        a._client.publish.assert_not_called()
+        assert b._local_cache['probe:x'] == 'kept'
+
+    def test_non_local_key_skips_local_tier(self, workers):
+        """Test a key written and read with local=False always comes from Redis"""
+        a, _ = workers
+        a.set('snapshot_job:1', {'status': 'running'}, local=False)
+        assert 'snapshot_job:1' not in a._local_cache
+        a._client.get.return_value = a._encode({'status': 'done'})
+        assert a.get('snapshot_job:1', local=False) == {'status': 'done'}
+        assert 'snapshot_job:1' not in a._local_cache
+
+    def test_epoch_gap_clears_local_tier(self, workers):
+        """Test a missed invalidation message drops every local entry"""
+        _, b = workers
+        b._local_cache['a'] = '1'
+        b._local_cache['b'] = '2'
+        b._epoch = 3
+        b._handle_invalidation(json.dumps({'origin': 'other', 'epoch': 6, 'keys': ['a']}))
+        assert len(b._local_cache) == 0
+        assert b._epoch == 6
+
+    def test_lagging_epoch_poll_clears_local_tier(self, workers):
+        """Test the epoch poll fallback clears the local tier when messages never arrive"""
+        _, b = workers
+        b._epoch = 2
+        b._local_cache['a'] = '1'
+        b._check_epoch(4)
+        assert 'a' in b._local_cache  # Mensagens podem estar a caminho
+        b._check_epoch(4)
+        assert 'a' not in b._local_cache
+        assert b._epoch == 4
+
+    def test_invalidation_during_read_skips_local_fill(self, workers):
+        """Test a value read from Redis before an invalidation is not cached locally after it"""
+        _, b = workers
+        b._epoch = 0
+        message = json.dumps({'origin': 'other', 'epoch': 1, 'keys': ['playlist:x']})
+
+        def read(key):
+            # Invalidação tratada pela thread do subscriber entre a leitura e o preenchimento
+            b._handle_invalidation(message)
+            return b._encode('old')
+
+        b._client.get.side_effect = read
+        assert b.get('playlist:x') == 'old'
+        assert 'playlist:x' not in b._local_cache
+        b._client.get.side_effect = None
+        b._client.get.return_value = b._encode('new')
+        assert b.get('playlist:x') == 'new'
+        assert b._local_cache['playlist:x'] == 'new'
+
+    def test_invalidation_during_batch_read_skips_local_fill(self, workers):
+        _, b = workers
+        b._epoch = 0
+        message = json.dumps({'origin': 'other', 'epoch': 1, 'keys': ['playlist:x']})
+        b._client.mget.side_effect = lambda keys: b._handle_invalidation(message) or [b._encode('old')]
+        assert b.batch_get(['playlist:x']) == {'playlist:x': 'old'}
+        assert 'playlist:x' not in b._local_cache
+
+    def test_local_tier_bypassed_without_subscriber(self, workers):
+        a, _ = workers
+        a._local_cache['k'] = 'stale'
+        a._subscribed.clear()
+        a._client.get.return_value = zlib.compress(b'fresh')
+        assert a.get('k') == 'fresh'
+
+class TestRedisCacheBatch:
+    def test_batch_get_only_fetches_local_misses(self, workers):
+        """Test batch_get serves local hits and sends only the misses to Redis"""
+        a, _ = workers
+        a._local_cache['playlist:a'] = {'name': 'a'}
+        a._client.mget.return_value = [a._encode({'name': 'b'}), None]
+        found = a.batch_get(['playlist:a', 'playlist:b', 'playlist:c'])
+        a._client.mget.assert_called_once_with(['playlist:b', 'playlist:c'])
+        assert found == {'playlist:a': {'name': 'a'}, 'playlist:b': {'name': 'b'}}
+        assert a._local_cache['playlist:b'] == {'name': 'b'}
+
+    def test_batch_get_all_local_skips_redis(self, workers):
+        a, _ = workers
+        a._local_cache['k'] = 'v'
+        assert a.batch_get(['k']) == {'k': 'v'}
+        a._client.mget.assert_not_called()
+
+    def test_batch_set_fills_local_tier(self, workers):
+        a, _ = workers
+        a.batch_set({'k1': {'files': [1, 2]}, 'k2': 'text'})
+        assert a._local_cache['k1'] == {'files': [1, 2]}
+        assert a._local_cache['k2'] == 'text'
+
+    def test_batch_get_reads_legacy_values(self, workers):
+        a, _ = workers
+        a._client.mget.return_value = [zlib.compress(b'{"name": "old"}')]
+        assert a.batch_get(['playlist:old']) == {'playlist:old': '{"name": "old"}'}
+
+class TestSingleFlight:
+    @pytest.fixture(autouse=True)
+    def fast_poll(self):
+        with patch('cache.Config.CACHE_LOCK_POLL_INTERVAL', 0):
+            yield
+
+    def test_lease_holder_computes_and_keeps_stale_copy(self, workers):
+        a, _ = workers
+        a._client.mget.return_value = [None]
+        a._client.incr.return_value = 1
+        pipe = a._client.pipeline.return_value
+        pipe.execute.return_value = [True]
+        compute = MagicMock(return_value={'name': 'p'})
+        assert a.get_or_compute('playlist:p', compute, stale_ttl=60) == {'name': 'p'}
+        compute.assert_called_once()
+        written = [c[0][0] for c in pipe.setex.call_args_list]
+        assert written == ['playlist:p', 'stale:playlist:p']
+        # Lease liberado com o token de quem o obteve
+        assert pipe.eval.call_args[0][2] == 'lock:playlist:p'
+
+    def test_waiter_serves_stale_copy(self, workers):
+        """Test a process without the lease gets the stale copy instead of recomputing"""
+        a, _ = workers
+        a._client.pipeline.return_value.execute.return_value = [None]
+        a._client.mget.side_effect = [[None], [a._encode({'name': 'old'})]]
+        compute = MagicMock()
+        assert a.get_or_compute('playlist:p', compute, stale_ttl=60) == {'name': 'old'}
+        compute.assert_not_called()
+
+    def test_waiter_gets_value_filled_by_lease_holder(self, workers):
+        a, _ = workers
+        a._client.pipeline.return_value.execute.return_value = [None]
+        a._client.mget.side_effect = [[None], [None, b'token'], [a._encode('fresh'), b'token']]
+        compute = MagicMock()
+        assert a.get_or_compute('k', compute) == 'fresh'
+        compute.assert_not_called()
+
+    def test_waiter_computes_when_lease_released_empty(self, workers):
+        a, _ = workers
+        a._client.pipeline.return_value.execute.return_value = [None]
+        a._client.mget.side_effect = [[None], [None, None]]
+        compute = MagicMock(return_value=None)
+        assert a.get_or_compute('playlist:missing', compute) is None
+        compute.assert_called_once()
+
+    def test_delete_drops_stale_copy(self, workers):
+        a, _ = workers
+        a._client.incr.return_value = 1
+        a.delete('playlist:p')
+        a._client.delete.assert_called_once_with('playlist:p', 'stale:playlist:p')
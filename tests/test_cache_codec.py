@@ -0,0 +1,45 @@
+import zlib
+import logging
+import pytest
+from unittest.mock import patch
+from cache_codec import CacheCodec, CodecError, HAS_ZSTD, NONE, ZLIB, ZSTD
+
+PLAYLIST = {
+    "name": "p",
+    "play_count": 3,
+    "source_folder": None,
+    "files": [{"path": f"/videos/clip_{i}.mp4", "size": 1000 + i, "modified": None, "extension": "mp4"} for i in range(200)]
+}
+
+class TestCacheCodec:
+    @pytest.mark.parametrize("compression", ["none", "zlib", "zstd"])
+    def test_round_trip_keeps_type(self, compression):
+        codec = CacheCodec(compression)
+        assert codec.decode(codec.encode(PLAYLIST)) == PLAYLIST
+        assert codec.decode(codec.encode("texto")) == "texto"
+
+    def test_small_values_not_compressed(self):
+        codec = CacheCodec('zlib', min_size=512)
+        assert codec.encode("1")[0] & 0x0F == NONE
+        assert codec.encode(PLAYLIST)[0] & 0x0F == ZLIB
+
+    def test_zstd_falls_back_to_zlib(self):
+        codec = CacheCodec('zstd')
+        assert codec.encode(PLAYLIST)[0] & 0x0F == (ZSTD if HAS_ZSTD else ZLIB)
+
+    def test_missing_backends_are_reported(self, caplog):
+        """Test a configured codec that is not installed is logged instead of silently replaced"""
+        with patch('cache_codec.HAS_ZSTD', False), patch('cache_codec.HAS_MSGPACK', False), caplog.at_level(logging.WARNING):
+            codec = CacheCodec('zstd')
+        assert codec.compression == ZLIB
+        assert 'zstandard' in caplog.text and 'msgpack' in caplog.text
+
+    def test_decodes_legacy_zlib_values(self):
+        """Test values written before the header byte (bare zlib streams) still decode"""
+        assert CacheCodec().decode(zlib.compress(b'{"a": 1}', level=6)) == '{"a": 1}'
+
+    def test_invalid_header(self):
+        with pytest.raises(CodecError):
+            CacheCodec().decode(b'\x0f123')
+        with pytest.raises(CodecError):
+            CacheCodec().decode(b'')
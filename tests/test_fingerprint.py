@@ -0,0 +1,61 @@
+import os
+import hashlib
+import tempfile
+import pytest
+from fingerprint import fingerprint_file, get_strategy, STRATEGIES
+
+MB = 1024 * 1024
+
+@pytest.fixture
+def large_file():
+    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+        temp_file.write(os.urandom(6 * MB))
+        temp_path = temp_file.name
+    yield temp_path
+    os.unlink(temp_path)
+
+class TestFingerprint:
+    def test_legacy_strategy_matches_original_hash(self, large_file):
+        """Test sha256-headmid:1 reproduces hashes stored before hash_algo existed"""
+        expected = hashlib.sha256()
+        with open(large_file, 'rb') as f:
+            expected.update(f.read(2 * MB))
+            f.seek(os.path.getsize(large_file) // 2)
+            expected.update(f.read(2 * MB))
+        assert fingerprint_file(large_file, 'sha256-headmid:1') == expected.hexdigest()
+
+    def test_sampled_strategy_detects_tail_change(self, large_file):
+        """Test sampled strategies cover the end of the file"""
+        before = fingerprint_file(large_file, 'blake2b-sampled:1')
+        assert len(before) == 64
+        assert fingerprint_file(large_file, 'blake2b-sampled:1') == before
+        with open(large_file, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b'\x00' if f.read(1) != b'\x00' else b'\x01')
+        assert fingerprint_file(large_file, 'blake2b-sampled:1') != before
+
+    def test_sampled_strategy_includes_size(self):
+        """Test files sharing all sampled bytes but differing in size hash differently"""
+        paths = []
+        try:
+            for size in (4 * MB, 4 * MB + 1):
+                with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+                    temp_file.write(b'x' * size)
+                    paths.append(temp_file.name)
+            assert fingerprint_file(paths[0], 'blake2b-sampled:1') != fingerprint_file(paths[1], 'blake2b-sampled:1')
+        finally:
+            for path in paths:
+                os.unlink(path)
+
+    @pytest.mark.parametrize('name', sorted(STRATEGIES))
+    def test_small_and_empty_files(self, name):
+        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+            temp_path = temp_file.name
+        try:
+            assert fingerprint_file(temp_path, name)
+        finally:
+            os.unlink(temp_path)
+
+    def test_unknown_algorithm(self):
+        with pytest.raises(ValueError):
+            get_strategy('md5:1')
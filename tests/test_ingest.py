@@ -0,0 +1,94 @@
+import pytest
+from datetime import datetime
+from unittest.mock import patch, MagicMock
+from ingest import BatchIngestor, upsert_files, file_row, FILE_COLUMNS
+from config import Config
+
+def make_file(path):
+    return {
+        "hash_id": "abc",
+        "hash_algo": "sha256-headmid:1",
+        "file_path": path,
+        "size_bytes": 10,
+        "created_at": datetime.now(),
+        "modified_at": datetime.now(),
+        "duration_seconds": 1.0,
+        "resolution": "1920x1080",
+        "orientation": "landscape",
+        "video_codec": "h264",
+        "view_count": 0,
+        "last_viewed_at": None,
+        "is_favorite": False
+    }
+
+class TestBatchIngestor:
+    @patch('ingest.execute_values')
+    def test_upsert_dedupes_paths(self, mock_execute):
+        """Test duplicate paths in a batch collapse into one row"""
+        count = upsert_files(MagicMock(), [make_file('a.mp4'), make_file('a.mp4'), make_file('b.mp4')])
+        assert count == 2
+        assert len(mock_execute.call_args[0][2]) == 2
+
+    @patch('ingest.execute_values')
+    def test_flush_once_per_batch(self, mock_execute):
+        """Test rows are buffered and written once the batch size is reached"""
+        conn = MagicMock()
+        ingestor = BatchIngestor(conn, 'temp_test', batch_size=3)
+        ingestor.add_file(make_file('a.mp4'))
+        ingestor.add_file(make_file('b.mp4'))
+        assert conn.commit.call_count == 0
+        ingestor.add_existing('c.mp4')
+        assert conn.commit.call_count == 1
+        cur = conn.cursor.return_value.__enter__.return_value
+        playlist_calls = [c for c in cur.execute.call_args_list if 'endoflix_playlist' in c[0][0]]
+        assert len(playlist_calls) == 1
+        assert playlist_calls[0][0][1][0] == ['a.mp4', 'b.mp4', 'c.mp4']
+        assert ingestor.total_rows == 2
+
+    @patch('ingest.execute_values')
+    def test_ordered_items_keep_walk_order(self, mock_execute):
+        """Test items added with their walk index are positioned by it, not by completion order"""
+        conn = MagicMock()
+        ingestor = BatchIngestor(conn, 'temp_test', batch_size=2)
+        ingestor.add_file(make_file('c.mp4'), order=3)
+        ingestor.add_existing('a.mp4', order=1)
+        ingestor.add_file(make_file('b.mp4'), order=2)
+        ingestor.flush()
+        cur = conn.cursor.return_value.__enter__.return_value
+        placed = {}
+        for call in cur.execute.call_args_list:
+            if 'endoflix_playlist_item' in call[0][0]:
+                ordinals, paths, name = call[0][1]
+                assert name == 'temp_test'
+                placed.update(zip(ordinals, paths))
+        assert [placed[k] for k in sorted(placed)] == ['a.mp4', 'b.mp4', 'c.mp4']
+
+    def test_file_row_default_hash_algo(self):
+        """Test rows without hash_algo are tagged with the configured algorithm"""
+        data = make_file('a.mp4')
+        del data['hash_algo']
+        assert file_row(data)[FILE_COLUMNS.index('hash_algo')] == Config.HASH_ALGORITHM
+
+    @patch('ingest.execute_values')
+    def test_bad_row_only_drops_itself(self, mock_execute):
+        """Test a batch the database rejects is retried row by row and only the bad row is reported"""
+        def upsert(cur, sql, rows, **kwargs):
+            if any(row[FILE_COLUMNS.index('file_path')] == 'bad.mp4' for row in rows):
+                raise Exception('invalid byte sequence')
+        mock_execute.side_effect = upsert
+        conn = MagicMock()
+        ingestor = BatchIngestor(conn, batch_size=10)
+        for path in ('a.mp4', 'bad.mp4', 'b.mp4'):
+            ingestor.add_file(make_file(path))
+        assert ingestor.flush() == 2
+        assert ingestor.total_rows == 2
+        assert ingestor.pop_errors() == [('bad.mp4', 'invalid byte sequence')]
+        assert ingestor.pop_errors() == []
+        assert conn.commit.call_count == 2
+
+    @patch('ingest.execute_values')
+    def test_flush_empty(self, mock_execute):
+        """Test flushing an empty buffer does nothing"""
+        conn = MagicMock()
+        assert BatchIngestor(conn).flush() == 0
+        conn.commit.assert_not_called()
@@ -0,0 +1,44 @@
+import os
+import pytest
+from unittest.mock import patch
+from load_controller import AdaptiveConcurrency, LoadSample, low_priority_kwargs
+
+IDLE = LoadSample(cpu=20.0, iowait=1.0, load_per_cpu=0.3, memory=40.0)
+BUSY_CPU = LoadSample(cpu=95.0, iowait=1.0, load_per_cpu=0.9, memory=40.0)
+BUSY_IO = LoadSample(cpu=30.0, iowait=35.0, load_per_cpu=0.9, memory=40.0)
+MODERATE = LoadSample(cpu=70.0, iowait=5.0, load_per_cpu=0.5, memory=40.0)
+
+class TestAdaptiveConcurrency:
+    @pytest.fixture
+    def controller(self):
+        with patch('load_controller.sample_load'):
+            return AdaptiveConcurrency('test', 1, 4)
+
+    def run(self, controller, samples):
+        limits = []
+        with patch('load_controller.sample_load', side_effect=samples), \
+             patch('load_controller.Config.LOAD_SAMPLE_INTERVAL', 0):
+            for _ in samples:
+                limits.append(controller.limit())
+        return limits
+
+    def test_shrinks_under_load_and_grows_back(self, controller):
+        """Test the limit follows load one step per sample, within its bounds"""
+        limits = self.run(controller, [BUSY_CPU, BUSY_IO, BUSY_CPU, BUSY_CPU, IDLE, IDLE])
+        assert limits == [3, 2, 1, 1, 2, 3]
+
+    def test_holds_between_marks(self, controller):
+        assert self.run(controller, [BUSY_CPU, MODERATE, MODERATE]) == [3, 3, 3]
+
+    def test_samples_at_most_once_per_interval(self, controller):
+        with patch('load_controller.sample_load', return_value=BUSY_CPU) as sample, \
+             patch('load_controller.Config.LOAD_SAMPLE_INTERVAL', 60):
+            assert [controller.limit() for _ in range(5)] == [3] * 5
+        assert sample.call_count == 1
+
+    def test_low_priority_kwargs(self):
+        kwargs = low_priority_kwargs()
+        if os.name == 'nt':
+            assert 'creationflags' in kwargs
+        else:
+            assert callable(kwargs['preexec_fn'])
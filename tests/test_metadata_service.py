@@ -0,0 +1,91 @@
+import json
+import subprocess
+import pytest
+from unittest.mock import patch, MagicMock
+from services.metadata_service import MetadataService, parse_probe_output, summarize
+
+FFPROBE_OUTPUT = json.dumps({
+    "streams": [
+        {"codec_type": "video", "codec_name": "h264", "width": 1920, "height": 1080, "avg_frame_rate": "30000/1001", "bit_rate": "4000000"},
+        {"codec_type": "audio", "codec_name": "aac", "channels": 2, "sample_rate": "48000"}
+    ],
+    "format": {"format_name": "matroska,webm", "duration": "10.5", "bit_rate": "4200000"}
+}).encode()
+
+class TestMetadataService:
+    @pytest.fixture
+    def service(self):
+        db = MagicMock()
+        cache = MagicMock()
+        cache.get.return_value = None
+        cache.get_or_compute.side_effect = lambda key, compute, *args, **kwargs: compute()
+        cache.batch_get.return_value = {}
+        cursor = db.get_connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = None
+        service = MetadataService(db, cache)
+        service.cursor = cursor
+        return service
+
+    def test_parse_full_record(self):
+        """Test one probe captures container, bitrate, fps and audio codec"""
+        metadata = summarize(parse_probe_output(FFPROBE_OUTPUT.decode()))
+        assert metadata['video_codec'] == 'h264'
+        assert metadata['audio_codec'] == 'aac'
+        assert metadata['container'] == 'matroska,webm'
+        assert metadata['bit_rate'] == 4200000
+        assert metadata['fps'] == pytest.approx(29.97)
+        # Sem duração no stream, usa a do container
+        assert metadata['duration_seconds'] == 10.5
+        assert metadata['resolution'] == '1920x1080'
+        assert metadata['orientation'] == 'landscape'
+
+    def test_cache_hit_skips_ffprobe(self, service):
+        record = parse_probe_output(FFPROBE_OUTPUT.decode())
+        service.cache.get_or_compute.side_effect = None
+        service.cache.get_or_compute.return_value = record
+        with patch('services.metadata_service.subprocess.run') as mock_run:
+            assert service.get('/v/a.mkv', 1000, 12.5)['video_codec'] == 'h264'
+            mock_run.assert_not_called()
+        service.db.get_connection.assert_not_called()
+
+    def test_database_hit_backfills_redis(self, service):
+        record = parse_probe_output(FFPROBE_OUTPUT.decode())
+        with patch('services.metadata_service.execute_values', return_value=[('/v/a.mkv', record)]):
+            found = service.lookup_many([('/v/a.mkv', 1000, 12.5), ('/v/b.mkv', 2000, 13.0)])
+        assert set(found) == {'/v/a.mkv'}
+        service.cache.batch_set.assert_called_once()
+
+    def test_miss_probes_and_persists(self, service):
+        with patch('services.metadata_service.execute_values', return_value=[]), \
+             patch('services.metadata_service.subprocess.run') as mock_run:
+            mock_run.return_value = MagicMock(returncode=0, stdout=FFPROBE_OUTPUT)
+            result = service.get('/v/a.mkv', 1000, 12.5)
+        assert result['audio_codec'] == 'aac'
+        assert mock_run.call_args.kwargs['timeout']
+        # Gravado no Redis por get_or_compute, no banco por _persist
+        assert service.cache.get_or_compute.call_args[0][0] == service.cache_key('/v/a.mkv', 1000, 12.5)
+        assert 'INSERT INTO endoflix_media_probe' in service.cursor.execute.call_args[0][0]
+
+    def test_ffprobe_error_not_persisted(self, service):
+        with patch('services.metadata_service.subprocess.run') as mock_run:
+            mock_run.return_value = MagicMock(returncode=1, stderr=b'error')
+            result = service.probe('/v/a.mkv', 1000, 12.5)
+        assert result['video_codec'] == 'unknown'
+        assert result['duration_seconds'] == 0
+        service.cache.set.assert_not_called()
+
+    def test_ffprobe_timeout(self, service):
+        with patch('services.metadata_service.subprocess.run', side_effect=subprocess.TimeoutExpired('ffprobe', 30)):
+            assert service.probe('/v/a.mkv', 1000, 12.5)['video_codec'] == 'unknown'
+        service.cache.set.assert_not_called()
+
+    def test_reindex_drops_previous_version(self, service):
+        """Test storing a new probe deletes the cache key of the file's previous size/mtime"""
+        service.cursor.fetchone.return_value = (900, 11.0)
+        service.store('/v/a.mkv', 1000, 12.5, parse_probe_output(FFPROBE_OUTPUT.decode()))
+        service.cache.delete.assert_called_once_with(service.cache_key('/v/a.mkv', 900, 11.0))
+
+    def test_forget_removes_records(self, service):
+        service.cursor.fetchall.return_value = [('/v/a.mkv', 1000, 12.5)]
+        service.forget(['/v/a.mkv'])
+        service.cache.delete.assert_called_once_with(service.cache_key('/v/a.mkv', 1000, 12.5))
@@ -141,6 +141,44 @@ class TestPlaylists:
         assert 'name' in data
         assert 'files' in data
 
+    def test_get_playlists_summary_paginated(self, authenticated_client, test_db):
+        """Test GET /playlists?view=summary pages with a cursor and omits file rows"""
+        with test_db.cursor() as cur:
+            for name in ('test_page_a', 'test_page_b', 'test_page_c'):
+                cur.execute(
+                    "INSERT INTO endoflix_playlist (name, files) VALUES (%s, %s)",
+                    (name, ['test_x.mp4', 'test_y.mp4'])
+                )
+            test_db.commit()
+        seen = {}
+        cursor = None
+        while True:
+            url = '/playlists?view=summary&limit=2' + (f'&cursor={cursor}' if cursor else '')
+            response = authenticated_client.get(url)
+            assert response.status_code == 200
+            data = response.get_json()
+            assert len(data['playlists']) <= 2
+            seen.update(data['playlists'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        assert seen['test_page_b']['file_count'] == 2
+        assert 'files' not in seen['test_page_b']
+        assert {'test_page_a', 'test_page_b', 'test_page_c'} <= set(seen)
+
+    def test_get_playlists_fields(self, authenticated_client, test_db):
+        """Test fields= trims playlists and their file rows"""
+        with test_db.cursor() as cur:
+            cur.execute(
+                "INSERT INTO endoflix_playlist (name, files) VALUES (%s, %s)",
+                ('test_fields', ['test_x.mp4'])
+            )
+            test_db.commit()
+        response = authenticated_client.get('/export_playlist/test_fields?fields=name,files.path')
+        assert response.get_json() == {'name': 'test_fields', 'files': [{'path': 'test_x.mp4'}]}
+        response = authenticated_client.get('/playlists?fields=bogus')
+        assert response.status_code == 400
+
     def test_export_playlist_not_found(self, authenticated_client):
         """Test GET /export_playlist/<name> for non-existent"""
         response = authenticated_client.get('/export_playlist/nonexistent')
@@ -162,6 +200,16 @@ class TestPlaylists:
         assert response.status_code == 200
         assert response.get_json()['success'] == True
 
+    def test_reorder_playlist_absolute_paths(self, authenticated_client):
+        """Test POST /reorder_playlist accepts the absolute paths stored by scans and rejects traversal"""
+        from unittest.mock import patch
+        with patch('blueprints.playlists.playlist_service.reorder_playlist', return_value={'files': ['/videos/b.mp4', '/videos/a.mp4']}) as reorder:
+            response = authenticated_client.post('/reorder_playlist', json={'name': 'p', 'file': '/videos/b.mp4', 'before': '/videos/a.mp4'})
+            assert response.status_code == 200
+            reorder.assert_called_once_with('p', '/videos/b.mp4', '/videos/a.mp4')
+            response = authenticated_client.post('/reorder_playlist', json={'name': 'p', 'file': '/videos/../etc/passwd'})
+            assert response.status_code == 400
+
     def test_import_playlist_json(self, authenticated_client):
         """Test POST /import_playlist with JSON file"""
         import_data = {
@@ -202,7 +250,13 @@ class TestPlaylists:
             )
             test_db.commit()
         response = authenticated_client.post('/generate_thumbnails/thumb_test')
-        assert response.status_code == 200
+        assert response.status_code == 202
         data = response.get_json()
-        assert 'status' in data
-        assert data['status'] == 'started'
\ No newline at end of file
+        assert data['status'] in ('queued', 'running')
+        # Um job ativo por playlist
+        again = authenticated_client.post('/generate_thumbnails/thumb_test').get_json()
+        assert again['job_id'] == data['job_id']
+        progress = authenticated_client.get(f"/thumbnail_jobs/{data['job_id']}").get_json()
+        assert progress['playlist_name'] == 'thumb_test'
+        response = authenticated_client.post(f"/thumbnail_jobs/{data['job_id']}/cancel")
+        assert response.get_json()['job']['cancel_requested'] is True
@@ -1,4 +1,7 @@
+import io
+import time
 import pytest
+from unittest.mock import patch
 from flask import url_for
 
 class TestRoutes:
@@ -55,4 +58,35 @@ class TestRoutes:
         """Test that logout requires login"""
         response = client.get('/logout')
         assert response.status_code == 302
-        assert '/login' in response.headers['Location']
\ No newline at end of file
+        assert '/login' in response.headers['Location']
+
+    def test_save_snapshot_multipart(self, authenticated_client, tmp_path):
+        """Test binary snapshot upload is queued and written in the background"""
+        video = tmp_path / 'clip.mp4'
+        video.write_bytes(b'video')
+        response = authenticated_client.post('/save_snapshot', data={
+            'video_path': str(video),
+            'is_burst': 'true',
+            'frame': [(io.BytesIO(b'one'), 'f1.webp', 'image/webp'), (io.BytesIO(b'two'), 'f2.webp', 'image/webp')]
+        }, content_type='multipart/form-data')
+        assert response.status_code == 202
+        job_id = response.get_json()['job_id']
+        for _ in range(50):
+            job = authenticated_client.get(f'/snapshot_jobs/{job_id}').get_json()
+            if job['status'] == 'done':
+                break
+            time.sleep(0.1)
+        assert job['saved'] == 2
+        assert sorted(p.read_bytes() for p in (tmp_path / 'snapshots').iterdir()) == [b'one', b'two']
+
+    def test_snapshot_burst(self, authenticated_client, tmp_path):
+        """Test server-side burst requests are validated and queued"""
+        video = tmp_path / 'clip.mp4'
+        video.write_bytes(b'video')
+        response = authenticated_client.post('/snapshot_burst', json={'video_path': str(video), 'start': 1, 'count': 0, 'interval': 1})
+        assert response.status_code == 400
+        with patch('blueprints.video.snapshot_processor.submit_burst', return_value={'id': 'abc', 'status': 'queued'}) as submit:
+            response = authenticated_client.post('/snapshot_burst', json={'video_path': str(video), 'start': 1.5, 'count': 60, 'interval': 0.2})
+        assert response.status_code == 202
+        assert response.get_json()['job_id'] == 'abc'
+        submit.assert_called_once_with(str(video), 1.5, 60, 0.2)
@@ -25,6 +25,53 @@ class TestPlaylistService:
         assert result['name'] == 'test_get'
         assert len(result['files']) == 1
 
+    def test_get_playlist_keeps_order_and_metadata(self, service, test_db):
+        """Test hydrated files keep playlist order and carry indexed metadata"""
+        with test_db.cursor() as cur:
+            cur.execute(
+                "INSERT INTO endoflix_files (hash_id, file_path, size_bytes) VALUES (%s, %s, %s) ON CONFLICT (file_path) DO UPDATE SET size_bytes = EXCLUDED.size_bytes",
+                ('hash_order', 'test_b_indexed.mp4', 1234)
+            )
+            test_db.commit()
+        service.create_playlist('test_order', ['test_z.mkv', 'test_b_indexed.mp4', 'test_a.mp4'], '/tmp')
+        service.cache.delete('playlist:test_order')
+        result = service.get_playlist('test_order')
+        assert [f['path'] for f in result['files']] == ['test_z.mkv', 'test_b_indexed.mp4', 'test_a.mp4']
+        assert result['files'][1]['size'] == 1234
+        assert result['files'][0] == {'path': 'test_z.mkv', 'size': 0, 'modified': None, 'extension': 'mkv'}
+        assert service.get_all_playlists()['test_order'] == result
+
+    def test_legacy_array_migrated_at_startup(self, service, test_db):
+        """Test a playlist stored in the old files array is moved to endoflix_playlist_item"""
+        with test_db.cursor() as cur:
+            cur.execute(
+                "INSERT INTO endoflix_playlist (name, files) VALUES (%s, %s)",
+                ('test_legacy', ['test_1.mp4', 'test_2.mp4', 'test_3.mp4'])
+            )
+            test_db.commit()
+        assert service.migrate_legacy_playlists() >= 3
+        result = service.get_playlist('test_legacy')
+        assert [f['path'] for f in result['files']] == ['test_1.mp4', 'test_2.mp4', 'test_3.mp4']
+        with test_db.cursor() as cur:
+            cur.execute("SELECT files FROM endoflix_playlist WHERE name = 'test_legacy'")
+            assert cur.fetchone()[0] == []
+            cur.execute("SELECT COUNT(*) FROM endoflix_playlist_item i JOIN endoflix_playlist p ON p.id = i.playlist_id WHERE p.name = 'test_legacy'")
+            assert cur.fetchone()[0] == 3
+
+    def test_reorder_playlist(self, service, test_db):
+        """Test moving an item only changes its position"""
+        service.create_playlist('test_reorder', ['test_1.mp4', 'test_2.mp4', 'test_3.mp4'], '/tmp')
+        result = service.reorder_playlist('test_reorder', 'test_3.mp4', 'test_1.mp4')
+        assert result['files'] == ['test_3.mp4', 'test_1.mp4', 'test_2.mp4']
+        # Repeated moves into the same gap eventually renumber the playlist
+        for _ in range(12):
+            result = service.reorder_playlist('test_reorder', 'test_2.mp4', 'test_1.mp4')
+            result = service.reorder_playlist('test_reorder', 'test_1.mp4', 'test_2.mp4')
+        assert result['files'] == ['test_3.mp4', 'test_1.mp4', 'test_2.mp4']
+        assert service.reorder_playlist('test_reorder', 'test_3.mp4')['files'][-1] == 'test_3.mp4'
+        with pytest.raises(ValueError):
+            service.reorder_playlist('test_reorder', 'test_missing.mp4')
+
     def test_get_playlist_not_found(self, service):
         """Test get_playlist for non-existent"""
         result = service.get_playlist('nonexistent')
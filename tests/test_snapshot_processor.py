@@ -0,0 +1,102 @@
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+from snapshot_processor import SnapshotProcessor, SnapshotQueueFull
+
+def wait_for(processor, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = processor.status(job_id)
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError('job did not finish')
+
+class TestSnapshotProcessor:
+    def test_burst_written_in_background(self, tmp_path):
+        video = tmp_path / 'clip.mp4'
+        processor = SnapshotProcessor()
+        job = processor.submit(str(video), [(b'a', 'webp'), (b'b', 'png')], is_burst=True)
+        assert job['status'] == 'queued'
+        job = wait_for(processor, job['id'])
+        assert (job['saved'], job['failed']) == (2, 0)
+        files = sorted((tmp_path / 'snapshots').iterdir())
+        assert [f.suffix for f in files] == ['.webp', '.png']
+        assert all(f.name.startswith('burst_') for f in files)
+        processor.cleanup()
+
+    def test_full_queue_is_rejected(self, tmp_path):
+        """Test submit fails fast instead of blocking the request when the queue is full"""
+        processor = SnapshotProcessor()
+        processor.queue.maxsize = 1
+        with patch.object(processor, '_ensure_workers'):
+            processor.submit(str(tmp_path / 'a.mp4'), [(b'a', 'webp')])
+            with pytest.raises(SnapshotQueueFull):
+                processor.submit(str(tmp_path / 'a.mp4'), [(b'b', 'webp')])
+
+    def test_byte_limit(self, tmp_path):
+        processor = SnapshotProcessor()
+        with patch.object(processor, '_ensure_workers'), patch('snapshot_processor.Config.SNAPSHOT_QUEUE_MAX_BYTES', 10):
+            # Um upload maior que o limite ainda passa com a fila vazia
+            processor.submit(str(tmp_path / 'a.mp4'), [(b'x' * 20, 'webp')])
+            with pytest.raises(SnapshotQueueFull):
+                processor.submit(str(tmp_path / 'a.mp4'), [(b'y', 'webp')])
+
+    def test_status_prefers_shared_cache(self, tmp_path):
+        cache = MagicMock()
+        cache.get.return_value = {'id': 'x', 'status': 'done'}
+        processor = SnapshotProcessor(cache)
+        assert processor.status('x')['status'] == 'done'
+        cache.get.assert_called_with('snapshot_job:x', local=False)
+
+    def test_server_burst_single_ffmpeg_run(self, tmp_path):
+        """Test a server-side burst extracts every frame with one ffmpeg invocation and reports progress"""
+        video = tmp_path / 'clip.mp4'
+        published = []
+        cache = MagicMock()
+        cache.get.return_value = None
+        cache.set.side_effect = lambda key, job, ttl, local: published.append(dict(job))
+        processor = SnapshotProcessor(cache)
+
+        def fake_popen(cmd, **kwargs):
+            pattern = cmd[-1]
+            for i in range(1, 4):
+                (tmp_path / 'snapshots' / (pattern.rsplit('/', 1)[-1] % i)).write_bytes(b'x')
+            process = MagicMock()
+            process.stdout = iter(['frame=1\n', 'progress=continue\n', 'frame=3\n', 'progress=end\n'])
+            process.wait.return_value = 0
+            return process
+
+        with patch('snapshot_processor.subprocess.Popen', side_effect=fake_popen) as popen:
+            job = processor.submit_burst(str(video), 12.5, 3, 0.5)
+            assert (job['status'], job['total']) == ('queued', 3)
+            job = wait_for(processor, job['id'])
+        processor.cleanup()
+
+        assert popen.call_count == 1
+        cmd = popen.call_args[0][0]
+        assert cmd[cmd.index('-ss') + 1] == '12.5'
+        assert cmd[cmd.index('-frames:v') + 1] == '3'
+        assert 'fps=1/0.5' in cmd[cmd.index('-vf') + 1]
+        assert cmd[-1].startswith(str(tmp_path / 'snapshots' / 'burst_')) and cmd[-1].endswith('_%d.webp')
+        assert (job['status'], job['saved'], job['failed']) == ('done', 3, 0)
+        assert [f.rsplit('_', 1)[-1] for f in job['files']] == ['1.webp', '2.webp', '3.webp']
+        # Progresso intermediário publicado antes do status final
+        saved = [job['saved'] for job in published if job['status'] == 'running']
+        assert 1 in saved and 3 in saved
+
+    def test_server_burst_short_video(self, tmp_path):
+        """Test frames ffmpeg could not extract count as failed"""
+        processor = SnapshotProcessor()
+
+        def fake_popen(cmd, **kwargs):
+            (tmp_path / 'snapshots' / (cmd[-1].rsplit('/', 1)[-1] % 1)).write_bytes(b'x')
+            process = MagicMock()
+            process.stdout = iter(['frame=1\n', 'progress=end\n'])
+            process.wait.return_value = 0
+            return process
+
+        with patch('snapshot_processor.subprocess.Popen', side_effect=fake_popen):
+            job = wait_for(processor, processor.submit_burst(str(tmp_path / 'clip.mp4'), 0, 5, 1)['id'])
+        processor.cleanup()
+        assert (job['saved'], job['failed']) == (1, 4)
@@ -0,0 +1,106 @@
+import pytest
+import os
+from flask import Flask
+from streaming import parse_range_header, if_range_matches, make_etag, send_file_range, RangeNotSatisfiable
+
+class TestRangeParsing:
+    def test_no_header(self):
+        """Test missing Range header serves full entity"""
+        assert parse_range_header(None, 1000) is None
+
+    def test_simple_range(self):
+        """Test closed range"""
+        assert parse_range_header('bytes=0-99', 1000) == [(0, 99)]
+
+    def test_open_range_capped(self):
+        """Test open-ended range is capped at max_length"""
+        assert parse_range_header('bytes=100-', 10**10, max_length=1000) == [(100, 1099)]
+
+    def test_suffix_range(self):
+        """Test suffix range returns the last N bytes"""
+        assert parse_range_header('bytes=-100', 1000) == [(900, 999)]
+
+    def test_multiple_ranges(self):
+        """Test comma separated ranges"""
+        assert parse_range_header('bytes=0-9, 20-29', 1000) == [(0, 9), (20, 29)]
+
+    def test_unsatisfiable(self):
+        """Test range past end of file"""
+        with pytest.raises(RangeNotSatisfiable):
+            parse_range_header('bytes=2000-', 1000)
+
+    def test_malformed(self):
+        """Test malformed header is ignored"""
+        assert parse_range_header('items=0-1', 1000) is None
+        assert parse_range_header('bytes=abc-', 1000) is None
+
+    def test_if_range(self):
+        """Test If-Range with ETag and date validators"""
+        assert if_range_matches(None, '"a"', 0)
+        assert if_range_matches('"a"', '"a"', 0)
+        assert not if_range_matches('"b"', '"a"', 0)
+        assert if_range_matches('Thu, 01 Jan 2015 00:00:00 GMT', '"a"', 1420070400)
+        assert not if_range_matches('Thu, 01 Jan 2015 00:00:00 GMT', '"a"', 1420070401)
+
+class TestSendFileRange:
+    @pytest.fixture
+    def media(self, tmp_path):
+        path = tmp_path / "video.mp4"
+        path.write_bytes(bytes(range(256)) * 40)
+        app = Flask(__name__)
+
+        @app.route('/v')
+        def serve():
+            return send_file_range(str(path))
+
+        return app.test_client(), path
+
+    def test_full_response(self, media):
+        """Test request without Range returns 200 with whole file"""
+        client, path = media
+        response = client.get('/v')
+        assert response.status_code == 200
+        assert response.data == path.read_bytes()
+
+    def test_partial_response(self, media):
+        """Test single range returns 206 with exact bytes"""
+        client, path = media
+        response = client.get('/v', headers={'Range': 'bytes=10-19'})
+        assert response.status_code == 206
+        assert response.headers['Content-Range'] == f'bytes 10-19/{os.path.getsize(path)}'
+        assert response.data == path.read_bytes()[10:20]
+
+    def test_multipart_response(self, media):
+        """Test multiple ranges return multipart/byteranges"""
+        client, path = media
+        response = client.get('/v', headers={'Range': 'bytes=0-4,100-104'})
+        assert response.status_code == 206
+        assert response.mimetype == 'multipart/byteranges'
+        assert int(response.headers['Content-Length']) == len(response.data)
+
+    def test_if_range_mismatch(self, media):
+        """Test stale If-Range falls back to full response"""
+        client, path = media
+        response = client.get('/v', headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+        assert response.status_code == 200
+
+    def test_if_range_match(self, media):
+        """Test matching If-Range keeps the partial response"""
+        client, path = media
+        etag = make_etag(os.stat(path))
+        response = client.get('/v', headers={'Range': 'bytes=0-9', 'If-Range': etag})
+        assert response.status_code == 206
+
+    def test_unsatisfiable_range(self, media):
+        """Test 416 for range beyond file size"""
+        client, path = media
+        response = client.get('/v', headers={'Range': 'bytes=999999-'})
+        assert response.status_code == 416
+
+    def test_file_wrapper_stops_at_range_end(self, media):
+        """Test a file wrapper that iterates instead of using sendfile yields only the range"""
+        from werkzeug.wsgi import FileWrapper
+        client, path = media
+        response = client.get('/v', headers={'Range': 'bytes=10-19'}, environ_base={'wsgi.file_wrapper': FileWrapper})
+        assert response.status_code == 206
+        assert response.data == path.read_bytes()[10:20]
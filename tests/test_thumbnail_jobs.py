@@ -0,0 +1,128 @@
+import threading
+import pytest
+from datetime import datetime
+from unittest.mock import patch, MagicMock
+from services.thumbnail_jobs import ThumbnailJobQueue, JOB_COLUMNS
+
+def job_row(**overrides):
+    job = {
+        "id": 1, "playlist_name": "p", "status": "running", "total": 0, "generated": 0, "failed": 0,
+        "attempts": 1, "cancel_requested": False, "message": None, "created_at": datetime(2024, 1, 1),
+        "started_at": None, "heartbeat_at": None, "finished_at": None
+    }
+    job.update(overrides)
+    return tuple(job[column] for column in JOB_COLUMNS)
+
+class TestThumbnailJobQueue:
+    @pytest.fixture
+    def queue(self):
+        queue = ThumbnailJobQueue(MagicMock())
+        queue.cursor = queue.db.get_connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        return queue
+
+    def test_enqueue_returns_active_job(self, queue):
+        """Test a second request for the same playlist gets the job already queued"""
+        queue.cursor.fetchone.side_effect = [None, job_row(id=7, status='queued')]
+        job, created = queue.enqueue('p')
+        assert (job['id'], created) == (7, False)
+        assert 'ON CONFLICT (playlist_name)' in queue.cursor.execute.call_args_list[0][0][0]
+
+    def test_progress_reports_cancellation(self, queue):
+        queue.cursor.fetchone.return_value = (True,)
+        assert queue.progress(1, 'w1', 5, 0) is False
+        queue.cursor.fetchone.return_value = (False,)
+        assert queue.progress(1, 'w1', 6, 0) is True
+
+    def test_superseded_worker_cannot_update(self, queue):
+        """Test updates from a worker whose job was reclaimed by another one match no row"""
+        queue.cursor.fetchone.return_value = None
+        assert queue.progress(1, 'old', 5, 0) is False
+        assert queue.heartbeat(1, 'old') is False
+        sql, params = queue.cursor.execute.call_args[0]
+        assert 'worker = %s' in sql and params == (1, 'old')
+
+    def test_claim_fails_jobs_out_of_attempts(self, queue):
+        queue.cursor.fetchone.side_effect = [job_row(attempts=99), job_row(id=2, attempts=1)]
+        job = queue.claim('w1')
+        assert job['id'] == 2
+        executed = [c[0][0] for c in queue.cursor.execute.call_args_list]
+        assert any("SET status = %s" in sql for sql in executed)
+
+    def test_job_progress_fraction(self, queue):
+        queue.cursor.fetchone.return_value = job_row(total=4, generated=2, failed=1)
+        assert queue.get(1)['progress'] == 0.75
+
+class TestThumbnailWorker:
+    @pytest.fixture
+    def worker(self):
+        # thumbnail_worker importa o processador (que depende do banco) só na execução
+        with patch.dict('sys.modules', {'thumbnail_processor': MagicMock()}):
+            import importlib
+            import thumbnail_worker
+            yield importlib.reload(thumbnail_worker)
+
+    def test_resume_counts_previous_work(self, worker):
+        """Test a resumed job keeps the thumbnails generated by the crashed attempt"""
+        queue = MagicMock()
+        queue.progress.return_value = True
+
+        def process(name, on_start, on_progress):
+            on_start(3)
+            on_progress(3, 0)
+            return {'success': True, 'message': 'ok', 'generated': 3, 'failed': 0, 'cancelled': False}
+
+        worker.ThumbnailProcessor.return_value.process_playlist_thumbnails.side_effect = process
+        job = dict(zip(JOB_COLUMNS, job_row(attempts=2, generated=5)))
+        worker.run_job(queue, job, threading.Event(), 'w1')
+        queue.start.assert_called_once_with(1, 'w1', 8, 5)
+        queue.progress.assert_called_with(1, 'w1', 8, 0)
+        queue.finish.assert_called_once_with(1, 'w1', 'done', 'ok')
+
+    def test_shutdown_releases_job(self, worker):
+        queue = MagicMock()
+        stop = threading.Event()
+        stop.set()
+        worker.ThumbnailProcessor.return_value.process_playlist_thumbnails.return_value = {'success': True, 'cancelled': True}
+        worker.run_job(queue, dict(zip(JOB_COLUMNS, job_row())), stop, 'w1')
+        queue.release.assert_called_once_with(1, 'w1')
+        queue.finish.assert_not_called()
+
+    def test_cancelled_before_start(self, worker):
+        queue = MagicMock()
+        worker.run_job(queue, dict(zip(JOB_COLUMNS, job_row(cancel_requested=True))), threading.Event(), 'w1')
+        queue.finish.assert_called_once_with(1, 'w1', 'cancelled')
+
+    def test_heartbeat_without_progress(self, worker):
+        """Test the heartbeat keeps a job claimed through a long step that reports no progress"""
+        queue = MagicMock()
+        beats = threading.Event()
+        queue.heartbeat.side_effect = lambda *args: beats.set() or True
+
+        def process(name, on_start, on_progress):
+            assert beats.wait(2)
+            return {'success': True, 'message': 'ok', 'cancelled': False}
+
+        worker.ThumbnailProcessor.return_value.process_playlist_thumbnails.side_effect = process
+        with patch.object(worker.Config, 'THUMB_JOB_HEARTBEAT_TIMEOUT', 0.03):
+            worker.run_job(queue, dict(zip(JOB_COLUMNS, job_row())), threading.Event(), 'w1')
+        queue.heartbeat.assert_called_with(1, 'w1')
+        queue.finish.assert_called_once_with(1, 'w1', 'done', 'ok')
+
+    def test_lost_job_is_not_finished(self, worker):
+        """Test a worker whose job was reclaimed stops and leaves the row to the new owner"""
+        queue = MagicMock()
+        queue.heartbeat.return_value = False
+
+        def process(name, on_start, on_progress):
+            for _ in range(200):
+                if not on_progress(0, 0):
+                    return {'success': True, 'cancelled': True}
+                threading.Event().wait(0.01)
+            return {'success': True, 'cancelled': False}
+
+        queue.progress.return_value = True
+        worker.ThumbnailProcessor.return_value.process_playlist_thumbnails.side_effect = process
+        with patch.object(worker.Config, 'THUMB_JOB_HEARTBEAT_TIMEOUT', 0.03):
+            worker.run_job(queue, dict(zip(JOB_COLUMNS, job_row())), threading.Event(), 'w1')
+        queue.finish.assert_not_called()
+        queue.release.assert_not_called()
@@ -0,0 +1,134 @@
+import json
+import pytest
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+from thumbnail_processor import ThumbnailProcessor, sprite_vtt
+from services.thumbnail_store import ThumbnailStore
+from media_commands import thumbnail_command, lowres_factor, parse_width
+
+SPRITE_ARGS = ('ffmpeg', 4, 2, 160, 70, 300, True)
+HASH = 'ab12' + '0' * 60
+
+def fake_ffmpeg(cmd, **kwargs):
+    Path(cmd[-1]).write_bytes(b'RIFF')
+    return MagicMock(returncode=0)
+
+class TestSprites:
+    def test_generate_sprite_single_pass(self, tmp_path):
+        """Test all frames come from one ffmpeg call with a tile filter graph"""
+        sprite, index = ThumbnailStore(MagicMock(), tmp_path).sprite_paths(HASH)
+        with patch('thumbnail_processor.get_video_metadata', return_value={'duration_seconds': 100.0}), \
+             patch('thumbnail_processor.subprocess.run', side_effect=fake_ffmpeg) as run:
+            assert ThumbnailProcessor.generate_sprite('/v/movie.mp4', str(sprite), str(index), *SPRITE_ARGS)
+
+        cmd = run.call_args[0][0]
+        assert run.call_count == 1
+        assert cmd[:3] == ['ffmpeg', '-skip_frame', 'nokey']
+        graph = cmd[cmd.index('-vf') + 1]
+        assert graph.startswith('fps=4/100.000,') and graph.endswith('tile=2x2')
+        assert sprite.read_bytes() == b'RIFF'
+        data = json.loads(index.read_text())
+        assert (data['tile_width'], data['tile_height'], data['rows']) == (160, 90, 2)
+        assert data['cues'][3] == {'start': 75.0, 'end': 100.0, 'x': 160, 'y': 90}
+
+    def test_generate_sprite_failure_leaves_nothing(self, tmp_path):
+        sprite, index = ThumbnailStore(MagicMock(), tmp_path).sprite_paths(HASH)
+        with patch('thumbnail_processor.get_video_metadata', return_value={'duration_seconds': 100.0}), \
+             patch('thumbnail_processor.subprocess.run', return_value=MagicMock(returncode=1, stderr=b'boom')):
+            assert not ThumbnailProcessor.generate_sprite('/v/movie.mp4', str(sprite), str(index), *SPRITE_ARGS)
+        assert list(sprite.parent.iterdir()) == []
+
+    def test_sprite_vtt(self):
+        index = {'tile_width': 160, 'tile_height': 90, 'cues': [{'start': 0, 'end': 3725.5, 'x': 160, 'y': 0}]}
+        vtt = sprite_vtt(index, '/sprites/a.webp')
+        assert vtt.splitlines()[:4] == ['WEBVTT', '', '00:00:00.000 --> 01:02:05.500', '/sprites/a.webp#xywh=160,0,160,90']
+
+class TestThumbnailSeek:
+    def test_stored_duration_skips_probe(self, tmp_path):
+        """Test the duration stored in endoflix_files is used instead of probing again"""
+        media = {'duration_seconds': 200.0, 'video_codec': 'mpeg2video', 'resolution': '1920x1080'}
+        with patch('thumbnail_processor.get_video_metadata') as probe, \
+             patch('thumbnail_processor.subprocess.run', side_effect=fake_ffmpeg) as run:
+            assert ThumbnailProcessor.generate_thumbnail('/v/a.mpg', str(tmp_path / 't.webp'), 'ffmpeg', 50, 80, 0.1, 60, media, True)
+        probe.assert_not_called()
+        cmd = run.call_args[0][0]
+        assert cmd[cmd.index('-ss') + 1] == '20.0'
+        assert cmd[1:3] == ['-skip_frame', 'nokey'] and cmd[cmd.index('-lowres') + 1] == '3'
+        assert 'flags=fast_bilinear' in cmd[cmd.index('-vf') + 1]
+
+    def test_accurate_path_unchanged(self):
+        cmd = thumbnail_command('ffmpeg', '/v/a.mp4', '/t.webp', 12.5, 50, 80, codec='h264', width=1920)
+        assert cmd[1:3] == ['-ss', '12.5'] and '-skip_frame' not in cmd and 'fast_bilinear' not in ' '.join(cmd)
+
+    def test_lowres_only_for_supporting_codecs(self):
+        assert lowres_factor('h264', 1920, 50) == 0
+        assert lowres_factor('mpeg4', 640, 50) == 2
+        assert lowres_factor('mpeg4', 0, 50) == 0
+        assert parse_width('1280x720') == 1280 and parse_width('unknown') == 0
+
+class TestThumbnailStore:
+    @pytest.fixture
+    def store(self, tmp_path):
+        store = ThumbnailStore(MagicMock(), tmp_path)
+        store.cursor = store.db.get_connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        return store
+
+    def test_sharded_paths(self, store, tmp_path):
+        assert store.path(HASH, 'thumb') == tmp_path / 'thumb' / 'ab' / '12' / f'{HASH}.webp'
+        assert store.sprite_paths(HASH)[1].name == f'{HASH}.json'
+
+    def test_missing_deduplicates_content(self, store):
+        """Test moved or duplicated videos map to one entry and existing previews are skipped"""
+        store.cursor.fetchall.return_value = [
+            ('/a/intro.mp4', 'h1', [], 60, 'h264', '1920x1080'),
+            ('/b/intro.mp4', 'h1', [], 60, 'h264', '1920x1080'),
+            ('/c/moved.mp4', 'h2', ['thumb', 'sprite'], 30, 'h264', '1280x720'),
+            ('/d/new.mp4', 'h3', ['thumb'], None, None, None),
+        ]
+        pending = store.missing(['/a/intro.mp4', '/b/intro.mp4', '/c/moved.mp4', '/d/new.mp4'])
+        media = {'duration_seconds': 60.0, 'video_codec': 'h264', 'resolution': '1920x1080'}
+        assert pending == {'h1': ('/a/intro.mp4', ['thumb', 'sprite'], media), 'h3': ('/d/new.mp4', ['sprite'], None)}
+        assert store.cursor.execute.call_count == 1
+
+    def test_missing_fingerprints_unindexed_files(self, store):
+        store.cursor.fetchall.side_effect = [[('/new.mp4', None, [], None, None, None)], [('h9', ['thumb'])]]
+        with patch('services.thumbnail_store.fingerprint_file', return_value='h9') as fingerprint:
+            assert store.missing(['/new.mp4']) == {'h9': ('/new.mp4', ['sprite'], None)}
+        fingerprint.assert_called_once()
+
+    def test_add_indexes_files_on_disk(self, store):
+        path = store.path(HASH, 'thumb')
+        path.parent.mkdir(parents=True)
+        path.write_bytes(b'x' * 10)
+        with patch('services.thumbnail_store.execute_values') as values:
+            store.add([(HASH, 'thumb'), ('cd34' + '0' * 60, 'thumb')])
+        assert values.call_args[0][2] == [(HASH, 'thumb', 10)]
+
+    def test_collect_garbage_removes_files(self, store):
+        sprite, index = store.sprite_paths(HASH)
+        sprite.parent.mkdir(parents=True)
+        sprite.write_bytes(b'x')
+        index.write_text('{}')
+        store.cursor.fetchall.return_value = [(HASH, 'sprite')]
+        assert store.collect_garbage() == 1
+        assert not sprite.exists() and not index.exists()
+
+class TestProcessPlaylist:
+    def test_only_missing_previews_are_generated(self, tmp_path):
+        with patch('thumbnail_processor.Database'):
+            processor = ThumbnailProcessor()
+        processor.store = MagicMock(wraps=ThumbnailStore(MagicMock(), tmp_path))
+        processor.store.collect_garbage.return_value = 0
+        processor.store.missing.return_value = {HASH: ('/v/a.mp4', ['sprite'], None)}
+        processor.store.add = MagicMock()
+        cursor = processor.db.get_connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = (1, '/v', ['/v/a.mp4', '/v/b.mp4'])
+        executor = MagicMock()
+        future = MagicMock()
+        future.result.return_value = (None, True)
+        with patch('thumbnail_processor.playlist_files', return_value=[]), \
+             patch('thumbnail_processor.get_pool', return_value=executor), \
+             patch('thumbnail_processor.imap_unordered', side_effect=lambda ex, fn, tasks, n: ((t, future) for t in tasks)):
+            result = processor.process_playlist_thumbnails('p')
+        assert result['generated'] == 1
+        processor.store.add.assert_called_with([(HASH, 'sprite')])
@@ -3,7 +3,9 @@ import os
 import tempfile
 from pathlib import Path
 from unittest.mock import patch, MagicMock
-from utils import calculate_hash, get_video_metadata_cached, process_file, get_media_files
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from utils import calculate_hash, get_video_metadata_cached, process_file, get_media_files, iter_media_entries, run_scan_pipeline, match_legacy_moves, folder_like_pattern
 
 class TestUtils:
     def test_calculate_hash(self):
@@ -49,67 +51,26 @@ class TestUtils:
         finally:
             os.unlink(temp_path)
 
-    @patch('utils.REDIS_CLIENT')
-    def test_get_video_metadata_cached_hit(self, mock_cache):
-        # Mock cache hit
-        mock_cache.get.return_value = '{"duration_seconds": 10, "resolution": "1920x1080"}'
+    @patch('utils.METADATA_SERVICE')
+    def test_get_video_metadata_cached_hit(self, mock_service):
+        mock_service.get.return_value = {"duration_seconds": 10, "resolution": "1920x1080"}
 
         result = get_video_metadata_cached('/fake/path1.mp4', 1000, 1234567890)
         assert result['duration_seconds'] == 10
         assert result['resolution'] == '1920x1080'
+        mock_service.get.assert_called_once_with('/fake/path1.mp4', 1000, 1234567890)
 
-    @patch('utils.DB_POOL')
-    @patch('utils.REDIS_CLIENT')
-    def test_get_video_metadata_cached_miss_db_hit(self, mock_cache, mock_pool):
-        # Mock cache miss, DB hit
-        mock_cache.get.return_value = None
-
-        mock_conn = MagicMock()
-        mock_cur = MagicMock()
-        mock_cur.fetchone.return_value = ('h264', '1920x1080', 'landscape', 10.5)
-        mock_conn.cursor.return_value = mock_cur
-        mock_pool.getconn.return_value = mock_conn
-
-        result = get_video_metadata_cached('/fake/path2.mp4', 1000, 1234567890)
-        assert result['video_codec'] == 'h264'
-        assert result['duration_seconds'] == 10.5
-
-    @patch('utils.DB_POOL')
-    @patch('utils.REDIS_CLIENT')
-    def test_get_video_metadata_cached_miss_ffprobe(self, mock_cache, mock_pool):
-        # Mock cache miss, DB miss, use ffprobe
-        mock_cache.get.return_value = None
-
-        mock_conn = MagicMock()
-        mock_cur = MagicMock()
-        mock_cur.fetchone.return_value = None
-        mock_conn.cursor.return_value = mock_cur
-        mock_pool.getconn.return_value = mock_conn
-
-        # Mock subprocess
-        with patch('utils.subprocess.run') as mock_run:
-            mock_run.return_value = MagicMock(returncode=0, stdout=b'{"streams": [{"codec_type": "video", "codec_name": "h264", "width": 1920, "height": 1080, "duration": "10.5"}]}')
-            result = get_video_metadata_cached('/fake/path3.mp4', 1000, 1234567890)
-            assert result['video_codec'] == 'h264'
-            assert result['duration_seconds'] == 10.5
+    @patch('utils.METADATA_SERVICE')
+    def test_get_video_metadata_cached_keys_on_file_stats(self, mock_service, tmp_path):
+        """Test size and mtime are read from the file when not given"""
+        video = tmp_path / "video.mp4"
+        video.write_bytes(b"x" * 10)
+        mock_service.get.return_value = {"video_codec": "h264", "duration_seconds": 10.5}
 
-    @patch('utils.DB_POOL')
-    @patch('utils.REDIS_CLIENT')
-    def test_get_video_metadata_cached_ffprobe_error(self, mock_cache, mock_pool):
-        # Mock ffprobe error
-        mock_cache.get.return_value = None
-
-        mock_conn = MagicMock()
-        mock_cur = MagicMock()
-        mock_cur.fetchone.return_value = None
-        mock_conn.cursor.return_value = mock_cur
-        mock_pool.getconn.return_value = mock_conn
-
-        with patch('utils.subprocess.run') as mock_run:
-            mock_run.return_value = MagicMock(returncode=1, stderr=b'error')
-            result = get_video_metadata_cached('/fake/path4.mp4', 1000, 1234567890)
-            assert result['video_codec'] == 'unknown'
-            assert result['duration_seconds'] == 0
+        result = get_video_metadata_cached(str(video))
+        assert result['video_codec'] == 'h264'
+        stats = os.stat(video)
+        mock_service.get.assert_called_once_with(str(video), stats.st_size, stats.st_mtime)
 
     def test_get_media_files_invalid_folder(self):
         """Test get_media_files with invalid folder"""
@@ -139,4 +100,118 @@ class TestUtils:
     def test_process_file_nonexistent(self):
         """Test process_file with non-existent file"""
         with pytest.raises(FileNotFoundError):
-            process_file(Path('/nonexistent'))
\ No newline at end of file
+            process_file(Path('/nonexistent'))
+
+    def test_iter_media_entries(self, tmp_path):
+        """Test iter_media_entries finds media files recursively with stats"""
+        (tmp_path / "a.mp4").write_bytes(b"a")
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "sub" / "b.MKV").write_bytes(b"bb")
+        (tmp_path / "notes.txt").write_text("x")
+        entries = {Path(path).name: (stats, inode) for path, stats, inode in iter_media_entries(tmp_path)}
+        assert set(entries) == {"a.mp4", "b.MKV"}
+        assert entries["b.MKV"][0].st_size == 2
+
+    @patch('utils.calculate_hash')
+    @patch('utils.load_scan_manifest')
+    @patch('utils.DB_POOL')
+    def test_get_media_files_incremental_skips_unchanged(self, mock_pool, mock_manifest, mock_hash, tmp_path):
+        """Test unchanged files are resolved from the manifest without hashing"""
+        video = tmp_path / "test.mp4"
+        video.write_bytes(b"fake")
+        stats = os.stat(video)
+        mock_manifest.return_value = {
+            str(video): (str(video), stats.st_size, stats.st_mtime_ns, stats.st_ino, 'hash', 1.5, stats.st_size, datetime.now())
+        }
+        events = list(get_media_files(str(tmp_path), incremental=True))
+        assert any('Arquivo inalterado' in event for event in events)
+        mock_hash.assert_not_called()
+
+    @patch('utils.get_pool')
+    @patch('utils.resolve_hashed_files')
+    @patch('utils.DB_POOL')
+    def test_get_media_files_bad_row_keeps_scanning(self, mock_pool, mock_resolve, mock_get_pool, tmp_path):
+        """Test a row the database rejects becomes an error event and the scan still ends"""
+        for name in ('good.mp4', 'bad.mp4'):
+            (tmp_path / name).write_bytes(b"x")
+        mock_get_pool.return_value = ThreadPoolExecutor(max_workers=2)
+        mock_resolve.side_effect = lambda conn, hashed, stats: ([], [], list(hashed))
+        stored = []
+
+        def upsert(cur, sql, rows, **kwargs):
+            if 'endoflix_files' in sql:
+                if any(row[2].endswith('bad.mp4') for row in rows):
+                    raise Exception('row rejected')
+                stored.extend(row[2] for row in rows)
+
+        def file_data(file, hash_id, metadata=None):
+            return {"hash_id": hash_id, "hash_algo": "sha256-headmid:1", "file_path": str(file), "size_bytes": 1,
+                    "created_at": None, "modified_at": None, "video_codec": "h264", "resolution": "1x1",
+                    "orientation": "landscape", "duration_seconds": 1.0, "view_count": 0, "last_viewed_at": None,
+                    "is_favorite": False}
+
+        with patch('utils.calculate_hash', side_effect=lambda f: f"hash-{Path(f).name}"), \
+             patch('utils.METADATA_SERVICE') as mock_service, \
+             patch('utils.process_file', side_effect=file_data), \
+             patch('ingest.execute_values', side_effect=upsert):
+            mock_service.lookup_many.side_effect = lambda items: {path: {"duration_seconds": 1} for path, _, _ in items}
+            events = list(get_media_files(str(tmp_path), incremental=False))
+
+        mock_get_pool.return_value.shutdown()
+        assert stored == [str(tmp_path / 'good.mp4')]
+        assert any('"error"' in event and 'bad.mp4' in event for event in events)
+        assert '"end"' in events[-1]
+
+    def test_folder_like_pattern(self):
+        """Test the folder pattern ends at a separator and escapes LIKE wildcards"""
+        pattern = folder_like_pattern(os.path.join('media', 'my_videos%'))
+        assert 'my\\_videos\\%' in pattern
+        assert pattern.endswith(os.sep.replace('\\', '\\\\') + '%')
+        assert folder_like_pattern('videos' + os.sep) == folder_like_pattern('videos')
+
+    @patch('utils.fingerprint_file')
+    def test_legacy_fingerprint_move(self, mock_fingerprint, tmp_path):
+        """Test a file moved before its row was re-fingerprinted is matched with the row's old algorithm"""
+        video = tmp_path / "moved.mp4"
+        video.write_bytes(b"abc")
+        stats = os.stat(video)
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchall.return_value = [('oldhash', 'sha256-headmid:1', str(tmp_path / 'gone.mp4'), 3)]
+        mock_fingerprint.return_value = 'oldhash'
+        moves = match_legacy_moves(conn, [(1, video, 'newhash')], {str(video): (stats, stats.st_ino)})
+        assert moves == [(1, video, 'newhash', str(tmp_path / 'gone.mp4'))]
+        mock_fingerprint.assert_called_once_with(video, 'sha256-headmid:1')
+
+    @patch('utils.resolve_hashed_files')
+    @patch('utils.get_pool')
+    def test_scan_pipeline_reads_each_file_once(self, mock_get_pool, mock_resolve, tmp_path):
+        """Test new files are hashed once and the hash is reused by the probe stage"""
+        files = []
+        for n in range(5):
+            path = tmp_path / f"video{n}.mp4"
+            path.write_bytes(b"x" * (n + 1))
+            files.append(path)
+        file_stats = {str(f): (os.stat(f), os.stat(f).st_ino) for f in files}
+        executor = ThreadPoolExecutor(max_workers=2)
+        mock_get_pool.return_value = executor
+        mock_resolve.side_effect = lambda conn, hashed, stats: ([], [], list(hashed))
+        ingestor = MagicMock()
+
+        with patch('utils.calculate_hash', side_effect=lambda f: f"hash-{Path(f).name}") as mock_hash, \
+             patch('utils.METADATA_SERVICE') as mock_service, \
+             patch('utils.process_file', side_effect=lambda f, h, m=None: {"hash_id": h, "file_path": str(f), "duration_seconds": 1, "size_bytes": 1, "modified_at": None}) as mock_process:
+            # Um arquivo já analisado antes (mesmo path/size/mtime) não passa pelo ffprobe
+            mock_service.lookup_many.return_value = {str(files[0]): {"duration_seconds": 1}}
+            mock_service.probe.return_value = {"duration_seconds": 1}
+            events = list(run_scan_pipeline(MagicMock(), list(enumerate(files, 1)), ingestor, file_stats, len(files)))
+
+        executor.shutdown()
+        assert mock_hash.call_count == 5
+        assert mock_service.probe.call_count == 4
+        assert mock_process.call_count == 5
+        assert all(call.args[1] == f"hash-{Path(call.args[0]).name}" for call in mock_process.call_args_list)
+        assert sum('"update"' in event for event in events) == 5
+        assert ingestor.add_file.call_count == 5
+        # Cada arquivo entra na playlist temporária com o índice da ordem da pasta
+        assert {call.args[0]['file_path']: call.kwargs['order'] for call in ingestor.add_file.call_args_list} == {str(f): n for n, f in enumerate(files, 1)}
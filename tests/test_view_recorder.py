@@ -0,0 +1,114 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from view_recorder import ViewRecorder
+
+class TestViewRecorder:
+    @pytest.fixture
+    def recorder(self):
+        db = MagicMock()
+        cache = MagicMock()
+        cache.add.return_value = True
+        recorder = ViewRecorder(db, cache)
+        with patch.object(recorder, '_ensure_flusher'):
+            yield recorder
+
+    def test_range_requests_count_once(self, recorder):
+        """Test many range requests of one playback count as a single view"""
+        assert recorder.record('/videos/a.mp4', 'player-1') is True
+        for _ in range(20):
+            assert recorder.record('/videos/a.mp4', 'player-1') is False
+        assert recorder.pending()['/videos/a.mp4'][0] == 1
+
+    def test_separate_playbacks_count(self, recorder):
+        """Test distinct playbacks of the same file are counted separately"""
+        recorder.record('/videos/a.mp4', 'player-1')
+        recorder.record('/videos/a.mp4', 'player-2')
+        assert recorder.pending()['/videos/a.mp4'][0] == 2
+
+    def test_dedup_across_workers(self, recorder):
+        """Test a view already claimed in Redis by another worker is not counted"""
+        recorder.cache.add.return_value = False
+        assert recorder.record('/videos/a.mp4', 'player-1') is False
+        assert recorder.pending() == {}
+
+    def test_record_async(self, recorder):
+        """Test the asyncio path dedups through the async Redis client and shares the buffer"""
+        import asyncio
+        from unittest.mock import AsyncMock
+        client = MagicMock()
+        client.set = AsyncMock(side_effect=[True, False])
+        assert asyncio.run(recorder.record_async('/videos/a.mp4', 'p1', client)) is True
+        assert asyncio.run(recorder.record_async('/videos/a.mp4', 'p1', client)) is False
+        assert asyncio.run(recorder.record_async('/videos/a.mp4', 'p2', client)) is False
+        assert recorder.pending()['/videos/a.mp4'][0] == 1
+        assert client.set.await_count == 2
+
+    def test_flush_batches_updates(self, recorder):
+        """Test flush issues one batched UPDATE and clears the buffer"""
+        recorder.record('/videos/a.mp4', 'p1')
+        recorder.record('/videos/b.mp4', 'p1')
+        with patch('view_recorder.execute_values') as mock_execute:
+            mock_execute.return_value = [('/videos/a.mp4',), ('/videos/b.mp4',)]
+            assert recorder.flush() == 2
+            assert mock_execute.call_count == 1
+            rows = mock_execute.call_args[0][2]
+            assert {row[0] for row in rows} == {'/videos/a.mp4', '/videos/b.mp4'}
+        assert recorder.pending() == {}
+
+    def test_flush_failure_requeues(self, recorder):
+        """Test increments are kept when the database write fails"""
+        recorder.record('/videos/a.mp4', 'p1')
+        with patch('view_recorder.execute_values', side_effect=Exception('db down')):
+            assert recorder.flush() == 0
+        assert recorder.pending()['/videos/a.mp4'][0] == 1
+
+    def test_views_and_progress_become_events(self, recorder):
+        """Test counted views and progress reports are buffered as playback events"""
+        recorder.record('/videos/a.mp4', 'p1')
+        recorder.record('/videos/a.mp4', 'p1')  # Mesma reprodução: sem novo evento
+        recorder.progress('/videos/a.mp4', 'page-1', 2, 30.0)
+        events = recorder.pending_events()
+        assert [(e[0], e[2], e[4], e[5]) for e in events] == [('/videos/a.mp4', None, 1, 0.0), ('/videos/a.mp4', 2, 0, 30.0)]
+
+    def test_flush_appends_events_in_one_statement(self, recorder):
+        recorder.progress('/videos/a.mp4', 'page-1', 1, 12.5)
+        recorder.progress('/videos/b.mp4', 'page-1', 3, 30.0)
+        cursor = recorder.db.get_connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        recorder.flush()
+        assert cursor.execute.call_count == 1
+        sql, columns = cursor.execute.call_args[0]
+        assert 'endoflix_view_events' in sql and 'endoflix_view_daily' in sql
+        assert columns[0] == ['/videos/a.mp4', '/videos/b.mp4']
+        assert columns[2] == [1, 3]
+        assert recorder.pending_events() == []
+
+    def test_event_flush_failure_requeues(self, recorder):
+        recorder.progress('/videos/a.mp4', 'page-1', 1, 12.5)
+        recorder.db.get_connection.side_effect = Exception('db down')
+        recorder.flush()
+        assert len(recorder.pending_events()) == 1
+
+    def test_event_buffer_is_bounded(self, recorder):
+        with patch('view_recorder.Config.VIEW_EVENT_BUFFER_MAX', 2):
+            for i in range(3):
+                recorder.progress(f'/videos/{i}.mp4', 'page-1', 1, 1.0)
+        assert [e[0] for e in recorder.pending_events()] == ['/videos/1.mp4', '/videos/2.mp4']
+
+    def test_partition_maintenance_runs_from_flusher(self, recorder):
+        """Test the flusher creates view-event partitions on its first pass and then once per interval"""
+        cur = recorder.db.get_connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        cur.fetchone.return_value = (True,)
+        recorder._maybe_maintain()
+        recorder._maybe_maintain()
+        executed = [c[0][0] for c in cur.execute.call_args_list]
+        assert sum('maintain_view_events' in sql for sql in executed) == 1
+        with patch('view_recorder.Config.VIEW_PARTITION_MAINTENANCE_INTERVAL', 0):
+            recorder._next_maintenance = 0.0
+            recorder._maybe_maintain()
+        assert sum('maintain_view_events' in c[0][0] for c in cur.execute.call_args_list) == 2
+
+    def test_partition_maintenance_skipped_when_locked(self, recorder):
+        cur = recorder.db.get_connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        cur.fetchone.return_value = (False,)
+        assert recorder.maintain_partitions() is False
+        assert not any('maintain_view_events' in c[0][0] for c in cur.execute.call_args_list)
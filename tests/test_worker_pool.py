@@ -0,0 +1,54 @@
+import pytest
+import time
+from worker_pool import get_pool, imap_unordered, shutdown_pools
+
+def square(x):
+    return x * x
+
+def slow_first(x):
+    if x == 0:
+        time.sleep(0.3)
+    return x
+
+class TestWorkerPool:
+    def teardown_method(self):
+        shutdown_pools()
+
+    def test_pool_is_reused(self):
+        """Test the same executor is returned across calls"""
+        assert get_pool('test', 2, kind='thread') is get_pool('test', 2, kind='thread')
+
+    def test_imap_unordered_results(self):
+        """Test all items are processed"""
+        executor = get_pool('test', 2, kind='thread')
+        results = {item: future.result() for item, future in imap_unordered(executor, square, range(10), 3)}
+        assert results == {i: i * i for i in range(10)}
+
+    def test_imap_unordered_completion_order(self):
+        """Test a slow task does not block faster ones"""
+        executor = get_pool('test', 2, kind='thread')
+        order = [item for item, _ in imap_unordered(executor, slow_first, range(4), 2)]
+        assert order[-1] == 0
+
+    def test_process_pool(self):
+        """Test process pool executes picklable functions"""
+        executor = get_pool('test-process', 2)
+        results = sorted(future.result() for _, future in imap_unordered(executor, square, [1, 2, 3]))
+        assert results == [1, 4, 9]
+
+    def test_bounded_in_flight(self):
+        """Test no more than max_in_flight tasks are submitted at once"""
+        submitted = []
+
+        class RecordingExecutor:
+            def __init__(self):
+                self.inner = get_pool('test', 4, kind='thread')
+
+            def submit(self, fn, item):
+                submitted.append(item)
+                return self.inner.submit(fn, item)
+
+        gen = imap_unordered(RecordingExecutor(), slow_first, range(10), 2)
+        next(gen)
+        assert len(submitted) <= 3
+        gen.close()
@@ -1,18 +1,35 @@
 import os
+import json
+import math
 import subprocess
 import logging
-from pathlib import Path
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from typing import List, Set
+from typing import Callable, List, Optional, Set
 import time
 from config import Config
 from db import Database
 from utils import get_video_metadata_cached as get_video_metadata
-try:
-    import psutil
-    HAS_PSUTIL = True
-except ImportError:
-    HAS_PSUTIL = False
+from playlist_items import playlist_files
+from services.thumbnail_store import ThumbnailStore
+from worker_pool import get_pool, imap_unordered
+from load_controller import get_controller, low_priority_kwargs
+from media_commands import thumbnail_command, parse_width
+
+PROGRESS_INTERVAL = 5  # Segundos máximos entre chamadas de on_progress
+
+def sprite_vtt(index: dict, sprite_url: str) -> str:
+    """WebVTT thumbnail track for a sprite index (one cue per tile, #xywh media fragments)."""
+    lines = ['WEBVTT', '']
+    for cue in index['cues']:
+        lines.append(f"{_vtt_time(cue['start'])} --> {_vtt_time(cue['end'])}")
+        lines.append(f"{sprite_url}#xywh={cue['x']},{cue['y']},{index['tile_width']},{index['tile_height']}")
+        lines.append('')
+    return '\n'.join(lines)
+
+def _vtt_time(seconds: float) -> str:
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    return f"{hours:02d}:{minutes:02d}:{millis // 1000:02d}.{millis % 1000:03d}"
 
 class ThumbnailProcessor:
     def __init__(self):
@@ -24,40 +41,41 @@ class ThumbnailProcessor:
         self.thumb_quality = self.config.THUMB_QUALITY
         self.extraction_point = self.config.THUMB_EXTRACTION_POINT
         self.max_workers = self.config.THUMB_WORKERS
+        self.min_workers = self.config.THUMB_WORKERS_MIN
         self.ffmpeg_timeout = self.config.FFMPEG_TIMEOUT
         self.batch_size = self.config.THUMB_BATCH_SIZE
+        self.sprite_frames = self.config.SPRITE_FRAMES
+        self.store = ThumbnailStore(self.db, self.config.THUMB_STORE_DIR)
 
     @staticmethod
-    def generate_thumbnail(video_path: str, output_path: str, ffmpeg_path: str, thumb_size: int, thumb_quality: int, extraction_point: float, ffmpeg_timeout: int) -> bool:
-        """Generate a thumbnail for a single video file."""
+    def generate_thumbnail(video_path: str, output_path: str, ffmpeg_path: str, thumb_size: int, thumb_quality: int, extraction_point: float, ffmpeg_timeout: int,
+                           media: Optional[dict] = None, fast_seek: bool = False) -> bool:
+        """Generate a thumbnail for a single video file.
+
+        `media` holds the duration_seconds/video_codec/resolution already stored
+        for the file; with it no probe is needed."""
         try:
             # Get video duration
-            metadata = get_video_metadata(video_path)
-            duration = metadata.get('duration_seconds', 0)
+            if not media or not media.get('duration_seconds'):
+                media = get_video_metadata(video_path)
+            duration = media.get('duration_seconds') or 0
             if duration <= 0:
                 logging.warning(f"Could not get duration for {video_path}")
                 return False
 
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
             # Calculate timestamp for extraction (10% into video)
             timestamp = duration * extraction_point
 
             # FFmpeg command to extract frame, scale, and save as WebP
-            cmd = [
-                ffmpeg_path,
-                '-ss', str(timestamp),  # Seek to timestamp
-                '-i', video_path,       # Input file
-                '-vframes', '1',        # Extract one frame
-                '-vf', f'scale={thumb_size}:{thumb_size}:force_original_aspect_ratio=decrease,pad={thumb_size}:{thumb_size}:(ow-iw)/2:(oh-ih)/2',  # Scale and pad to square
-                '-pix_fmt', 'yuv420p',  # Pixel format
-                '-c:v', 'libwebp',      # Use libwebp encoder
-                '-q:v', str(thumb_quality),  # Quality for WebP
-                '-f', 'webp',           # Output format
-                '-y',                   # Overwrite output
-                output_path
-            ]
+            cmd = thumbnail_command(
+                ffmpeg_path, video_path, output_path, timestamp, thumb_size, thumb_quality,
+                fast_seek=fast_seek, codec=media.get('video_codec'), width=parse_width(media.get('resolution'))
+            )
 
             logging.debug(f"Running FFmpeg command: {' '.join(cmd)}")
-            result = subprocess.run(cmd, capture_output=True, text=False, timeout=ffmpeg_timeout)
+            result = subprocess.run(cmd, capture_output=True, text=False, timeout=ffmpeg_timeout, **low_priority_kwargs())
             if result.returncode == 0:
                 logging.info(f"Thumbnail generated for {video_path}")
                 return True
@@ -72,120 +90,187 @@ class ThumbnailProcessor:
             logging.error(f"Error generating thumbnail for {video_path}: {e}")
             return False
 
-    def sanitize_thumbs(self, thumbs_folder: Path, video_files: List[str]) -> List[str]:
-        """Sanitize thumbnails: delete orphaned ones, return videos needing thumbs."""
-        if not thumbs_folder.exists():
-            return video_files  # All need thumbs
+    @staticmethod
+    def generate_sprite(video_path: str, sprite_path: str, index_path: str, ffmpeg_path: str, frames: int, columns: int,
+                        tile_width: int, quality: int, ffmpeg_timeout: int, keyframes_only: bool, media: Optional[dict] = None) -> bool:
+        """Generate a scrub-preview sprite sheet and its JSON index for a single video.
 
-        # Get existing thumbs
-        existing_thumbs = set()
-        for file in thumbs_folder.iterdir():
-            if file.is_file() and file.suffix.lower() == f'.{self.thumb_format}':
-                existing_thumbs.add(file.stem)  # filename without extension
+        All frames come from one decode pass: the fps filter keeps one frame
+        per interval and tile packs them into a single image, instead of one
+        seek (and one ffmpeg) per frame.
+        """
+        tmp_path = f"{sprite_path}.tmp"
+        try:
+            duration = (media or {}).get('duration_seconds') or get_video_metadata(video_path).get('duration_seconds') or 0
+            if duration <= 0:
+                logging.warning(f"Could not get duration for {video_path}")
+                return False
 
-        # Video filenames without extension
-        video_names = {Path(v).stem for v in video_files}
+            os.makedirs(os.path.dirname(sprite_path), exist_ok=True)
+            interval = duration / frames
+            rows = math.ceil(frames / columns)
+            tile_height = (tile_width * 9 // 16) // 2 * 2
+            cmd = [ffmpeg_path]
+            if keyframes_only:
+                cmd += ['-skip_frame', 'nokey']  # Decodifica só keyframes
+            cmd += [
+                '-ss', f"{interval / 2:.3f}",  # Cada quadro representa o meio do seu intervalo
+                '-i', video_path,
+                '-an', '-sn', '-dn',
+                '-vf', (f'fps={frames}/{duration:.3f},'
+                        f'scale={tile_width}:{tile_height}:force_original_aspect_ratio=decrease,'
+                        f'pad={tile_width}:{tile_height}:(ow-iw)/2:(oh-ih)/2,'
+                        f'tile={columns}x{rows}'),
+                '-frames:v', '1',
+                '-c:v', 'libwebp',
+                '-q:v', str(quality),
+                '-f', 'webp',
+                '-y',
+                tmp_path
+            ]
 
-        # Orphaned thumbs: exist but no video
-        orphaned = existing_thumbs - video_names
-        for orphan in orphaned:
-            thumb_path = thumbs_folder / f"{orphan}.{self.thumb_format}"
-            try:
-                thumb_path.unlink()
-                logging.info(f"Deleted orphaned thumbnail: {thumb_path}")
-            except Exception as e:
-                logging.error(f"Error deleting orphaned thumbnail {thumb_path}: {e}")
+            logging.debug(f"Running FFmpeg command: {' '.join(cmd)}")
+            result = subprocess.run(cmd, capture_output=True, text=False, timeout=ffmpeg_timeout, **low_priority_kwargs())
+            if result.returncode != 0:
+                stderr_text = result.stderr.decode('utf-8', errors='replace') if result.stderr else 'No stderr'
+                logging.error(f"FFmpeg sprite failed for {video_path} (exit code {result.returncode}): {stderr_text}")
+                return False
+
+            index = {
+                'duration': duration,
+                'interval': interval,
+                'columns': columns,
+                'rows': rows,
+                'tile_width': tile_width,
+                'tile_height': tile_height,
+                'cues': [
+                    {'start': round(i * interval, 3), 'end': round(min((i + 1) * interval, duration), 3),
+                     'x': (i % columns) * tile_width, 'y': (i // columns) * tile_height}
+                    for i in range(frames)
+                ]
+            }
+            # Sprite primeiro, índice por último: um índice em disco sempre aponta para um sprite completo
+            os.replace(tmp_path, sprite_path)
+            with open(f"{index_path}.tmp", 'w') as f:
+                json.dump(index, f)
+            os.replace(f"{index_path}.tmp", index_path)
+            logging.info(f"Sprite generated for {video_path}")
+            return True
+        except subprocess.TimeoutExpired:
+            logging.error(f"Timeout generating sprite for {video_path}")
+            return False
+        except Exception as e:
+            logging.error(f"Error generating sprite for {video_path}: {e}")
+            return False
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
 
-        # Videos needing thumbs: have video but no thumb
-        needing_thumbs = [v for v in video_files if Path(v).stem not in existing_thumbs]
+    @staticmethod
+    def _thumbnail_task(args: tuple) -> tuple:
+        """Picklable entry point for the worker pool: (video_path, thumbnail args or None, sprite args or None).
 
-        return needing_thumbs
+        Returns (thumbnail ok, sprite ok), None for a preview not requested."""
+        video_path, thumb_args, sprite_args = args
+        thumb_ok = ThumbnailProcessor.generate_thumbnail(video_path, *thumb_args) if thumb_args else None
+        sprite_ok = ThumbnailProcessor.generate_sprite(video_path, *sprite_args) if sprite_args else None
+        return thumb_ok, sprite_ok
 
-    def process_playlist_thumbnails(self, playlist_name: str) -> dict:
-        """Process thumbnails for a playlist."""
-        try:
-            # Resource monitoring
-            if HAS_PSUTIL:
-                cpu = psutil.cpu_percent(interval=1)
-                memory = psutil.virtual_memory().percent
-                logging.info(f"Resource usage before processing: CPU {cpu}%, Memory {memory}%")
-                if cpu > 80 or memory > 80:
-                    logging.warning("High resource usage detected, reducing workers")
-                    self.max_workers = max(1, self.max_workers // 2)
-            else:
-                logging.info("psutil not available, skipping resource monitoring")
+    def _task(self, hash_id: str, video_path: str, kinds: List[str], media: Optional[dict] = None) -> tuple:
+        thumb_args = None
+        if 'thumb' in kinds:
+            thumb_args = (str(self.store.path(hash_id, 'thumb')), self.ffmpeg_path, self.thumb_size,
+                          self.thumb_quality, self.extraction_point, self.ffmpeg_timeout, media, self.config.THUMB_FAST_SEEK)
+        sprite_args = None
+        if 'sprite' in kinds:
+            sprite_path, index_path = self.store.sprite_paths(hash_id)
+            sprite_args = (str(sprite_path), str(index_path), self.ffmpeg_path, self.sprite_frames, self.config.SPRITE_COLUMNS,
+                           self.config.SPRITE_TILE_WIDTH, self.config.SPRITE_QUALITY, self.config.SPRITE_TIMEOUT,
+                           self.config.SPRITE_KEYFRAMES_ONLY, media)
+        return video_path, thumb_args, sprite_args
+
+    def process_playlist_thumbnails(self, playlist_name: str,
+                                    on_start: Optional[Callable[[int], None]] = None,
+                                    on_progress: Optional[Callable[[int, int], bool]] = None) -> dict:
+        """Process thumbnails for a playlist.
 
+        on_start(remaining) is called with the number of distinct video contents
+        still missing a preview; on_progress(generated, failed) after each batch of results
+        (and at least once per PROGRESS_INTERVAL seconds), and stops the run,
+        with 'cancelled' in the result, when it returns False."""
+        try:
             with self.db.get_connection() as conn:
                 with conn.cursor() as cur:
                     # Get playlist source_folder and files
-                    cur.execute("SELECT source_folder, files FROM endoflix_playlist WHERE name = %s AND is_temp = FALSE", (playlist_name,))
+                    cur.execute("SELECT id, source_folder, files FROM endoflix_playlist WHERE name = %s AND is_temp = FALSE", (playlist_name,))
                     result = cur.fetchone()
                     if not result:
                         return {'success': False, 'error': 'Playlist not found'}
 
-                    source_folder, files = result
+                    playlist_id, source_folder, legacy_files = result
+                    # Playlists ainda não migradas mantêm os itens no array legado
+                    files = playlist_files(cur, playlist_id) + list(legacy_files or [])
                     if not files:
                         return {'success': True, 'message': 'No files in playlist'}
 
-            # Create .thumbs folder if not exists
-            thumbs_folder = Path(source_folder) / ".thumbs"
-            thumbs_folder.mkdir(exist_ok=True)
-
-            # Sanitize
-            needing_thumbs = self.sanitize_thumbs(thumbs_folder, files)
+            # Previews são endereçados pelo conteúdo: vídeos movidos ou duplicados já têm os seus
+            self.store.collect_garbage()
+            kinds = ['thumb', 'sprite'] if self.sprite_frames > 0 else ['thumb']
+            pending = self.store.missing(files, kinds)
 
-            if not needing_thumbs:
+            if on_start:
+                on_start(len(pending))
+            if not pending:
                 return {'success': True, 'message': 'All thumbnails up to date'}
 
-            # Generate thumbnails in batches
+            # Generate thumbnails on the shared pool, handling results as they complete
             generated = 0
             failed = 0
-            total = len(needing_thumbs)
-            num_batches = (total + self.batch_size - 1) // self.batch_size
+            cancelled = False
+            total = len(pending)
             start_time = time.time()
+            last_report = start_time
+            produced = []  # (hash_id, kind) gerados e ainda não indexados
+            hashes = {}
+            tasks = []
+            for hash_id, (video_path, missing_kinds, media) in pending.items():
+                hashes[video_path] = hash_id
+                tasks.append(self._task(hash_id, video_path, missing_kinds, media))
+            executor = get_pool('thumbnails', self.max_workers)
+            # Concorrência reavaliada a cada submissão conforme a carga do host (vídeos em reprodução têm prioridade)
+            controller = get_controller('thumbnails', self.min_workers, self.max_workers)
+            results = imap_unordered(executor, self._thumbnail_task, tasks, controller.limit)
+            try:
+                for task, future in results:
+                    video_path = task[0]
+                    try:
+                        outcome = dict(zip(('thumb', 'sprite'), future.result()))
+                    except Exception as e:
+                        logging.error(f"Exception processing {video_path}: {e}")
+                        outcome = {}
+                    produced.extend((hashes[video_path], kind) for kind, ok in outcome.items() if ok)
+                    if outcome and all(ok for ok in outcome.values() if ok is not None):
+                        generated += 1
+                    else:
+                        failed += 1
 
-            for batch_idx in range(num_batches):
-                if time.time() - start_time > 600:
-                    logging.warning(f"Thumbnail processing timeout exceeded (600s) for playlist {playlist_name}. Returning partial results.")
-                    break
-                start = batch_idx * self.batch_size
-                end = min(start + self.batch_size, total)
-                batch = needing_thumbs[start:end]
-                logging.info(f"Processing batch {batch_idx + 1}/{num_batches}: {len(batch)} videos")
-                batch_start = time.time()
-
-                with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
-                    futures = {}
-                    for video_path in batch:
-                        output_path = thumbs_folder / f"{Path(video_path).stem}.{self.thumb_format}"
-                        future = executor.submit(
-                            self.generate_thumbnail,
-                            video_path,
-                            str(output_path),
-                            self.ffmpeg_path,
-                            self.thumb_size,
-                            self.thumb_quality,
-                            self.extraction_point,
-                            self.ffmpeg_timeout
-                        )
-                        futures[future] = video_path
-
-                    for future in as_completed(futures):
-                        video_path = futures[future]
-                        try:
-                            if future.result():
-                                generated += 1
-                            else:
-                                failed += 1
-                        except Exception as e:
-                            logging.error(f"Exception processing {video_path}: {e}")
-                            failed += 1
-
-                batch_time = time.time() - batch_start
-                logging.info(f"Batch {batch_idx + 1} completed in {batch_time:.2f}s: {generated} generated, {failed} failed so far")
+                    done = generated + failed
+                    if done % self.batch_size == 0 or done == total:
+                        logging.info(f"Thumbnails: {done}/{total} processed in {time.time() - start_time:.2f}s: {generated} generated, {failed} failed")
+                    if on_progress and (done % self.batch_size == 0 or done == total or time.time() - last_report >= PROGRESS_INTERVAL):
+                        last_report = time.time()
+                        self.store.add(produced)
+                        produced = []
+                        if not on_progress(generated, failed):
+                            logging.info(f"Thumbnail generation for playlist {playlist_name} cancelled after {done}/{total}")
+                            cancelled = True
+                            break
+            finally:
+                results.close()
+                self.store.add(produced)
 
             message = f"Generated {generated} thumbnails, {failed} failed"
-            return {'success': True, 'message': message, 'generated': generated, 'failed': failed}
+            return {'success': True, 'message': message, 'generated': generated, 'failed': failed, 'cancelled': cancelled}
 
         except Exception as e:
             logging.error(f"Error processing thumbnails for playlist {playlist_name}: {e}")
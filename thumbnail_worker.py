@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Thumbnail job worker: claims jobs from endoflix_thumbnail_job and runs them.
+
+Run one or more next to the web app (python thumbnail_worker.py). Jobs are
+queued by POST /generate_thumbnails/<playlist>. SIGTERM/SIGINT hand the
+current job back to the queue so another worker resumes it; a worker that
+dies without doing so is detected by its missing heartbeat, which a
+separate thread sends every THUMB_JOB_HEARTBEAT_TIMEOUT/3 seconds while the
+job runs (long steps such as fingerprinting or a sprite don't report progress).
+"""
+import os
+import sys
+import signal
+import socket
+import logging
+import threading
+from prometheus_client import start_http_server
+from config import Config
+from db import Database
+from services.thumbnail_jobs import ThumbnailJobQueue
+from thumbnail_processor import ThumbnailProcessor
+from worker_pool import shutdown_pools
+
+def heartbeat_loop(queue: ThumbnailJobQueue, job_id: int, worker: str, done: threading.Event, lost: threading.Event):
+    while not done.wait(Config.THUMB_JOB_HEARTBEAT_TIMEOUT / 3):
+        try:
+            if not queue.heartbeat(job_id, worker):
+                logging.warning(f"Job de thumbnails {job_id} foi assumido por outro worker")
+                lost.set()
+                return
+        except Exception as e:
+            logging.error(f"Erro no heartbeat do job de thumbnails {job_id}: {e}")
+
+def run_job(queue: ThumbnailJobQueue, job: dict, stop: threading.Event, worker: str):
+    job_id = job['id']
+    if job['cancel_requested']:
+        queue.finish(job_id, worker, 'cancelled')
+        return
+    # Retomada: thumbnails já gerados estão em disco e não voltam para a lista
+    previous = job['generated'] if job['attempts'] > 1 else 0
+    logging.info(f"Job de thumbnails {job_id} ({job['playlist_name']}), tentativa {job['attempts']}")
+
+    done, lost = threading.Event(), threading.Event()
+
+    def on_start(remaining: int):
+        if not queue.start(job_id, worker, previous + remaining, previous):
+            lost.set()
+
+    def on_progress(generated: int, failed: int) -> bool:
+        if stop.is_set() or lost.is_set():
+            return False
+        return queue.progress(job_id, worker, previous + generated, failed)
+
+    heartbeat = threading.Thread(target=heartbeat_loop, args=(queue, job_id, worker, done, lost), name=f'heartbeat-{job_id}', daemon=True)
+    heartbeat.start()
+    try:
+        result = ThumbnailProcessor().process_playlist_thumbnails(job['playlist_name'], on_start, on_progress)
+    except Exception as e:
+        logging.error(f"Job de thumbnails {job_id} falhou: {e}")
+        queue.finish(job_id, worker, 'failed', str(e))
+        return
+    finally:
+        done.set()
+        heartbeat.join()
+
+    if lost.is_set():
+        # Outro worker retomou o job; o resultado desta tentativa é descartado
+        return
+    if stop.is_set() and result.get('cancelled'):
+        queue.release(job_id, worker)
+    elif not result.get('success'):
+        queue.finish(job_id, worker, 'failed', result.get('error'))
+    elif result.get('cancelled'):
+        queue.finish(job_id, worker, 'cancelled', result.get('message'))
+    else:
+        if 'generated' in result:
+            queue.progress(job_id, worker, previous + result['generated'], result['failed'])
+        queue.finish(job_id, worker, 'done', result.get('message'))
+
+def run(stop: threading.Event):
+    queue = ThumbnailJobQueue(Database())
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    logging.info(f"Worker de thumbnails {worker} iniciado")
+    while not stop.is_set():
+        try:
+            job = queue.claim(worker)
+        except Exception as e:
+            logging.error(f"Erro ao buscar job de thumbnails: {e}")
+            job = None
+        if job is None:
+            stop.wait(Config.THUMB_JOB_POLL_INTERVAL)
+            continue
+        run_job(queue, job, stop, worker)
+
+def main():
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'), format='%(asctime)s %(levelname)s %(message)s')
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+    if Config.THUMB_WORKER_METRICS_PORT:
+        # Métricas do worker (ex.: media_job_concurrency) fora do app Flask
+        start_http_server(Config.THUMB_WORKER_METRICS_PORT)
+    try:
+        run(stop)
+    finally:
+        shutdown_pools()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,125 +1,48 @@
 import os
-import hashlib
-import subprocess
 import json
 import logging
 from pathlib import Path
 from datetime import datetime
-from concurrent.futures import ProcessPoolExecutor
-from functools import lru_cache
+from concurrent.futures import wait, FIRST_COMPLETED
+from psycopg2.extras import execute_values
 from db import Database
 from config import Config
 from cache import RedisCache
+from fingerprint import fingerprint_file
+from services.metadata_service import MetadataService
+from ingest import BatchIngestor, upsert_files
+from worker_pool import get_pool
 
 DB_POOL = Database()  # Create database instance
 REDIS_CLIENT = RedisCache()  # Create cache instance
-FFPROBE_PATH = Config.FFPROBE_PATH
-
-def calculate_hash(file_path, max_bytes=2*1024*1024):  # 2MB início + 2MB meio
-    sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        # Primeiros 2MB
-        bytes_read = 0
-        while bytes_read < max_bytes:
-            byte_block = f.read(4096)
-            if not byte_block:
-                break
-            sha256_hash.update(byte_block)
-            bytes_read += len(byte_block)
-        # Pular para o meio do arquivo
-        file_size = os.stat(file_path).st_size
-        if file_size > max_bytes * 2:
-            f.seek(file_size // 2)
-            bytes_read = 0
-            while bytes_read < max_bytes:
-                byte_block = f.read(4096)
-                if not byte_block:
-                    break
-                sha256_hash.update(byte_block)
-                bytes_read += len(byte_block)
-    return sha256_hash.hexdigest()
-
-@lru_cache(maxsize=10000)
-def get_video_metadata_cached(file_path, file_size, mtime):
-    file_path_str = str(file_path)
-    # Try cache first
-    cached = REDIS_CLIENT.get(f"metadata:{file_path_str}")
-    if cached:
-        return json.loads(cached)
-
-    # Query database
-    with DB_POOL.get_connection() as conn:
-        with conn.cursor() as cur:
-            try:
-                cur.execute("SELECT video_codec, resolution, orientation, duration_seconds FROM endoflix_files WHERE file_path = %s", (file_path_str,))
-                result = cur.fetchone()
-                if result:
-                    video_codec, resolution, orientation, duration_seconds = result
-                    metadata = {
-                        "video_codec": video_codec,
-                        "resolution": resolution,
-                        "orientation": orientation,
-                        "duration_seconds": duration_seconds
-                    }
-                    # Cache the result
-                    REDIS_CLIENT.set(f"metadata:{file_path_str}", json.dumps(metadata), ttl=86400)
-                    return metadata
-            except Exception as e:
-                logging.error(f"Erro ao consultar metadados no banco para {file_path_str}: {e}")
+METADATA_SERVICE = MetadataService(DB_POOL, REDIS_CLIENT)
 
-    cmd = [FFPROBE_PATH, "-v", "error", "-show_entries", "stream=codec_type,codec_name,width,height,duration", "-of", "json", file_path_str]
-    result = subprocess.run(cmd, capture_output=True, text=False)
-    if result.returncode == 0:
-        stdout_text = result.stdout.decode('utf-8', errors='replace')
-        try:
-            metadata = json.loads(stdout_text)
-            streams = metadata.get("streams", [])
-            video_stream = next((s for s in streams if s.get("codec_type") == "video"), {})
-
-            duration = float(video_stream.get("duration", 0))
-            width = video_stream.get("width", 0)
-            height = video_stream.get("height", 0)
-            resolution = f"{width}x{height}" if width and height else "unknown"
-            orientation = "portrait" if width < height else "landscape" if width > height else "square"
-            video_codec = video_stream.get("codec_name", "unknown")
-
-            result = {
-                "duration_seconds": duration,
-                "resolution": resolution,
-                "orientation": orientation,
-                "video_codec": video_codec
-            }
-            # Cache the result
-            REDIS_CLIENT.set(f"metadata:{file_path_str}", json.dumps(result), ttl=86400)
-            return result
-        except (json.JSONDecodeError, KeyError) as e:
-            logging.error(f"Failed to parse ffprobe output for {file_path_str}: {e}")
-            return {
-                "duration_seconds": 0,
-                "resolution": "unknown",
-                "orientation": "unknown",
-                "video_codec": "unknown"
-            }
-    else:
-        stderr_text = result.stderr.decode('utf-8', errors='replace') if result.stderr else 'Unknown error'
-        logging.error(f"ffprobe failed for {file_path_str}: {stderr_text}")
-        return {
-            "duration_seconds": 0,
-            "resolution": "unknown",
-            "orientation": "unknown",
-            "video_codec": "unknown"
-        }
-
-def process_file(file):
+def calculate_hash(file_path, algorithm=None):
+    """Content fingerprint of file_path (sampled regions, see fingerprint.py)."""
+    return fingerprint_file(file_path, algorithm or Config.HASH_ALGORITHM)
+
+def get_video_metadata_cached(file_path, file_size=None, mtime=None):
+    """Metadata of file_path, probed at most once per (path, size, mtime) (see MetadataService)."""
+    if file_size is None or mtime is None:
+        stats = os.stat(file_path)
+        file_size, mtime = stats.st_size, stats.st_mtime
+    return METADATA_SERVICE.get(str(file_path), file_size, mtime)
+
+def process_file(file, hash_id=None, metadata=None):
     file_path_str = str(file)
     stats = os.stat(file)
-    hash_id = calculate_hash(file)
-    metadata = get_video_metadata_cached(file_path_str, stats.st_size, stats.st_mtime)
+    # O pipeline de varredura já calculou o hash; evita reler o arquivo
+    if hash_id is None:
+        hash_id = calculate_hash(file)
+    if metadata is None:
+        metadata = get_video_metadata_cached(file_path_str, stats.st_size, stats.st_mtime)
     return {
         "hash_id": hash_id,
+        "hash_algo": Config.HASH_ALGORITHM,
         "file_path": file_path_str,
         "size_bytes": stats.st_size,
-        "created_at": datetime.fromtimestamp(stats.st_birthtime),
+        # st_birthtime não existe no Linux
+        "created_at": datetime.fromtimestamp(getattr(stats, 'st_birthtime', stats.st_ctime)),
         "modified_at": datetime.fromtimestamp(stats.st_mtime),
         "duration_seconds": metadata["duration_seconds"],
         "resolution": metadata["resolution"],
@@ -133,23 +56,7 @@ def process_file(file):
 def index_file(conn, file_data):
     cur = conn.cursor()
     try:
-        cur.execute("""
-            INSERT INTO endoflix_files (id, hash_id, file_path, size_bytes, created_at, modified_at, video_codec, resolution, orientation, duration_seconds, view_count, last_viewed_at, is_favorite)
-            VALUES (DEFAULT, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            file_data["hash_id"],
-            file_data["file_path"],
-            file_data["size_bytes"],
-            file_data["created_at"],
-            file_data["modified_at"],
-            file_data["video_codec"],
-            file_data["resolution"],
-            file_data["orientation"],
-            file_data["duration_seconds"],
-            file_data["view_count"],
-            file_data["last_viewed_at"],
-            file_data["is_favorite"]
-        ))
+        upsert_files(cur, [file_data])
         conn.commit()
     except Exception as e:
         conn.rollback()
@@ -157,48 +64,328 @@ def index_file(conn, file_data):
     finally:
         cur.close()
 
-def process_files_batch(new_files, conn, temp_playlist_name, total_files):
-    for chunk in [new_files[i:i+100] for i in range(0, len(new_files), 100)]:
-        with ProcessPoolExecutor(max_workers=8) as executor:
-            futures = {executor.submit(process_file, file): (i, file) for i, file in chunk}
-            for future in futures:
-                i, file = futures[future]
-                file_data = future.result()
-                media_item = {"path": file_data["file_path"], "duration": file_data["duration_seconds"], "size": file_data["size_bytes"], "modified": file_data["modified_at"].isoformat() if file_data["modified_at"] else None, "extension": Path(file_data["file_path"]).suffix.lower()[1:]}
-                index_file(conn, file_data)
-                yield f"data: {json.dumps({'status': 'update', 'file': media_item, 'progress': i, 'total': total_files})}\n\n"
-                # Add to playlist
-                with conn.cursor() as cur:
-                    cur.execute(
-                        "UPDATE endoflix_playlist SET files = array_append(files, %s) WHERE name = %s",
-                        (str(file), temp_playlist_name)
+def probe_file(task):
+    """Probe stage entry point (process pool): (file, hash_id) -> file_data.
+
+    Only files without a stored probe record reach this stage, so ffprobe is
+    run directly instead of consulting the caches again.
+    """
+    file, hash_id = task
+    stats = os.stat(file)
+    metadata = METADATA_SERVICE.probe(str(file), stats.st_size, stats.st_mtime)
+    return process_file(file, hash_id, metadata)
+
+FILE_DATA_COLUMNS = "file_path, duration_seconds, size_bytes, created_at, modified_at, video_codec, resolution, orientation, view_count, last_viewed_at, is_favorite"
+
+def _file_data_from_row(row, hash_id):
+    return {
+        "hash_id": hash_id,
+        "hash_algo": Config.HASH_ALGORITHM,
+        "file_path": row[0],
+        "duration_seconds": row[1],
+        "size_bytes": row[2],
+        "created_at": row[3],
+        "modified_at": row[4],
+        "video_codec": row[5],
+        "resolution": row[6],
+        "orientation": row[7],
+        "view_count": row[8],
+        "last_viewed_at": row[9],
+        "is_favorite": row[10]
+    }
+
+def _media_item(file_data):
+    return {"path": file_data["file_path"], "duration": file_data["duration_seconds"], "size": file_data["size_bytes"], "modified": file_data["modified_at"].isoformat() if file_data["modified_at"] else None, "extension": Path(file_data["file_path"]).suffix.lower()[1:]}
+
+def resolve_hashed_files(conn, hashed, file_stats):
+    """Match a batch of (i, file, hash_id) against the index with two bulk queries.
+
+    Returns (indexed, moved, new): files already indexed at the same path and
+    size, files relocated from another path (updated in place) and new files.
+    """
+    paths = [str(file) for _, file, _ in hashed]
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT {FILE_DATA_COLUMNS}, hash_id, hash_algo FROM endoflix_files WHERE file_path = ANY(%s)", (paths,))
+        by_path = {row[0]: row for row in cur.fetchall()}
+        # Fingerprints só são comparáveis dentro do mesmo algoritmo/versão
+        cur.execute("SELECT hash_id, file_path FROM endoflix_files WHERE hash_id = ANY(%s) AND hash_algo = %s", ([h for _, _, h in hashed], Config.HASH_ALGORITHM))
+        by_hash = {}
+        for hash_id, path in cur.fetchall():
+            by_hash.setdefault(hash_id, path)
+
+    indexed, moves, new, refingerprint = [], [], [], []
+    for i, file, hash_id in hashed:
+        stats, _ = file_stats[str(file)]
+        row = by_path.get(str(file))
+        if row and row[2] == stats.st_size:
+            indexed.append((i, file, _file_data_from_row(row, hash_id)))
+            if (row[11], row[12]) != (hash_id, Config.HASH_ALGORITHM):
+                refingerprint.append((str(file), hash_id, Config.HASH_ALGORITHM))
+        elif row is None and hash_id in by_hash and not os.path.exists(by_hash[hash_id]):
+            # Mesmo conteúdo e o caminho antigo não existe mais: arquivo movido
+            moves.append((i, file, hash_id, by_hash[hash_id]))
+        else:
+            new.append((i, file, hash_id))
+
+    legacy_moves = match_legacy_moves(conn, [(i, file, h) for i, file, h in new if str(file) not in by_path], file_stats)
+    if legacy_moves:
+        matched = {i for i, _, _, _ in legacy_moves}
+        new = [entry for entry in new if entry[0] not in matched]
+        moves.extend(legacy_moves)
+
+    if refingerprint:
+        # Atualiza fingerprints antigos (outro algoritmo) de arquivos já lidos nesta varredura
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                UPDATE endoflix_files AS f SET hash_id = v.hash_id, hash_algo = v.hash_algo
+                FROM (VALUES %s) AS v(file_path, hash_id, hash_algo)
+                WHERE f.file_path = v.file_path
+            """, refingerprint)
+        conn.commit()
+
+    moved = []
+    if moves:
+        # Verificar arquivos movidos (mesmo hash, outro caminho) e atualizar em uma única instrução
+        with conn.cursor() as cur:
+            rows = execute_values(cur, f"""
+                UPDATE endoflix_files AS f SET file_path = v.file_path, modified_at = v.modified_at,
+                    hash_id = v.hash_id, hash_algo = v.hash_algo
+                FROM (VALUES %s) AS v(old_path, file_path, modified_at, hash_id, hash_algo)
+                WHERE f.file_path = v.old_path
+                RETURNING {', '.join('f.' + c.strip() for c in FILE_DATA_COLUMNS.split(','))}
+            """, [(old_path, str(file), datetime.fromtimestamp(file_stats[str(file)][0].st_mtime), hash_id, Config.HASH_ALGORITHM)
+                  for _, file, hash_id, old_path in moves],
+                template="(%s, %s, %s::timestamp, %s, %s)", fetch=True)
+        conn.commit()
+        updated = {row[0]: row for row in rows}
+        for i, file, hash_id, _ in moves:
+            if str(file) in updated:
+                moved.append((i, file, _file_data_from_row(updated[str(file)], hash_id)))
+            else:
+                new.append((i, file, hash_id))
+    return indexed, moved, new
+
+def match_legacy_moves(conn, candidates, file_stats):
+    """Moves of files whose row still has a fingerprint from an older HASH_ALGORITHM.
+
+    The current fingerprint can't match those rows, so for each candidate with
+    the same size as a legacy row whose path no longer exists, the file is
+    fingerprinted again with that row's algorithm. Returns (i, file, hash_id, old_path).
+    """
+    if not candidates:
+        return []
+    sizes = list({file_stats[str(file)][0].st_size for _, file, _ in candidates})
+    with conn.cursor() as cur:
+        cur.execute("SELECT hash_id, hash_algo, file_path, size_bytes FROM endoflix_files WHERE hash_algo <> %s AND size_bytes = ANY(%s)",
+                    (Config.HASH_ALGORITHM, sizes))
+        rows = cur.fetchall()
+    legacy = {}
+    for old_hash, algo, path, size in rows:
+        if not os.path.exists(path):
+            legacy.setdefault(size, []).append((old_hash, algo, path))
+
+    moves, claimed = [], set()
+    for i, file, hash_id in candidates:
+        fingerprints = {}
+        for old_hash, algo, path in legacy.get(file_stats[str(file)][0].st_size, ()):
+            if path in claimed:
+                continue
+            try:
+                if algo not in fingerprints:
+                    fingerprints[algo] = fingerprint_file(file, algo)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Fingerprint {algo} de {file} indisponível: {e}")
+                fingerprints[algo] = None
+            if fingerprints[algo] == old_hash:
+                claimed.add(path)
+                moves.append((i, file, hash_id, path))
+                break
+    return moves
+
+def _ingest_error_events(ingestor):
+    """SSE error events for the rows the ingestor could not write."""
+    for path, message in ingestor.pop_errors():
+        yield f"data: {json.dumps({'status': 'error', 'file': path, 'message': message})}\n\n"
+
+def run_scan_pipeline(conn, pending, ingestor, file_stats, total_files):
+    """Hash (thread pool) -> resolve (bulk queries) -> probe (process pool) -> persist (ingestor).
+
+    Every new or changed file is read once by the hash stage and probed once
+    by the probe stage. Stages overlap; SCAN_QUEUE_DEPTH bounds the work in
+    flight so a large folder does not queue everything at once.
+    """
+    hash_pool = get_pool('hash', Config.SCAN_HASH_WORKERS, kind='thread')
+    probe_pool = get_pool('probe', Config.SCAN_PROBE_WORKERS)
+    depth = Config.SCAN_QUEUE_DEPTH
+    pending = iter(pending)
+    exhausted = False
+    hash_futures, probe_futures, hashed = {}, {}, []
+    try:
+        while True:
+            # Linhas rejeitadas pelo banco nos lotes já gravados
+            for event in _ingest_error_events(ingestor):
+                yield event
+            # Backpressure: não calcula mais hashes enquanto o estágio de probe estiver cheio
+            while not exhausted and len(hash_futures) < depth and len(probe_futures) < depth:
+                try:
+                    i, file = next(pending)
+                except StopIteration:
+                    exhausted = True
+                    break
+                hash_futures[hash_pool.submit(calculate_hash, file)] = (i, file)
+
+            if hashed and (len(hashed) >= depth or not hash_futures):
+                try:
+                    indexed, moved, new = resolve_hashed_files(conn, hashed, file_stats)
+                except Exception as e:
+                    conn.rollback()
+                    logging.error(f"Erro ao resolver lote de {len(hashed)} arquivos: {e}")
+                    indexed, moved, new = [], [], hashed
+                hashed = []
+                for entries, message in ((indexed, 'Arquivo já indexado'), (moved, 'Arquivo movido e atualizado')):
+                    for i, file, file_data in entries:
+                        stats, inode = file_stats[str(file)]
+                        ingestor.add_existing(str(file), manifest_row(file, stats, inode, file_data["hash_id"]), order=i)
+                        yield f"data: {json.dumps({'status': 'skipped', 'file': _media_item(file_data), 'progress': i, 'total': total_files, 'message': message})}\n\n"
+                # Metadados já extraídos (mesmo path/size/mtime) dispensam o ffprobe
+                try:
+                    probed = METADATA_SERVICE.lookup_many(
+                        (str(file), file_stats[str(file)][0].st_size, file_stats[str(file)][0].st_mtime) for _, file, _ in new
                     )
-                    conn.commit()
+                except Exception as e:
+                    logging.error(f"Erro ao consultar metadados em lote: {e}")
+                    probed = {}
+                for i, file, hash_id in new:
+                    if str(file) not in probed:
+                        probe_futures[probe_pool.submit(probe_file, (file, hash_id))] = (i, file)
+                        continue
+                    try:
+                        file_data = process_file(file, hash_id, probed[str(file)])
+                    except OSError as e:
+                        logging.error(f"Erro ao processar {file}: {e}")
+                        yield f"data: {json.dumps({'status': 'error', 'file': str(file), 'message': str(e)})}\n\n"
+                        continue
+                    stats, inode = file_stats[str(file)]
+                    ingestor.add_file(file_data, manifest_row(file, stats, inode, hash_id), order=i)
+                    yield f"data: {json.dumps({'status': 'update', 'file': _media_item(file_data), 'progress': i, 'total': total_files})}\n\n"
+
+            if not hash_futures and not probe_futures:
+                if exhausted and not hashed:
+                    break
+                continue
 
-def get_media_files(folder):
+            done, _ = wait(list(hash_futures) + list(probe_futures), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in hash_futures:
+                    i, file = hash_futures.pop(future)
+                    try:
+                        hashed.append((i, file, future.result()))
+                    except Exception as e:
+                        logging.error(f"Erro ao processar {file}: {e}")
+                        yield f"data: {json.dumps({'status': 'error', 'file': str(file), 'message': str(e)})}\n\n"
+                    continue
+                i, file = probe_futures.pop(future)
+                try:
+                    file_data = future.result()
+                except Exception as e:
+                    logging.error(f"Erro ao processar {file}: {e}")
+                    yield f"data: {json.dumps({'status': 'error', 'file': str(file), 'message': str(e)})}\n\n"
+                    continue
+                stats, inode = file_stats[str(file)]
+                # Grava em lote junto com a entrada na playlist temporária, na posição da ordem da pasta
+                ingestor.add_file(file_data, manifest_row(file, stats, inode, file_data["hash_id"]), order=i)
+                yield f"data: {json.dumps({'status': 'update', 'file': _media_item(file_data), 'progress': i, 'total': total_files})}\n\n"
+    finally:
+        for future in list(hash_futures) + list(probe_futures):
+            future.cancel()
+    ingestor.flush()
+    for event in _ingest_error_events(ingestor):
+        yield event
+
+MEDIA_EXTENSIONS = {'.mp4', '.mkv', '.mov', '.divx', '.webm', '.mpg', '.avi'}
+
+def iter_media_entries(folder_path):
+    """Walk folder_path with os.scandir yielding (path, stat_result, inode) for media files."""
+    stack = [str(folder_path)]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            logging.error(f"Erro ao listar {current}: {e}")
+            continue
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in MEDIA_EXTENSIONS:
+                    # No Windows o DirEntry.stat() não traz st_ino; inode() consulta quando necessário
+                    yield entry.path, entry.stat(), entry.inode()
+            except OSError as e:
+                logging.error(f"Erro ao ler {entry.path}: {e}")
+        stack.extend(reversed(subdirs))
+
+def folder_like_pattern(folder_path) -> str:
+    """LIKE pattern (ESCAPE '\\') for paths inside folder_path only, not sibling folders sharing its prefix."""
+    prefix = str(folder_path).rstrip('/\\') + os.sep
+    return prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def load_scan_manifest(conn, folder_path):
+    """Bulk-load the manifest of a folder joined with the indexed file data."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT m.file_path, m.size_bytes, m.mtime_ns, m.inode, f.hash_id, f.duration_seconds, f.size_bytes, f.modified_at
+            FROM endoflix_scan_manifest m
+            JOIN endoflix_files f ON f.file_path = m.file_path
+            WHERE m.file_path LIKE %s ESCAPE '\\'
+        """, (folder_like_pattern(folder_path),))
+        return {row[0]: row for row in cur.fetchall()}
+
+def manifest_row(file_path, stats, inode, hash_id):
+    return (str(file_path), stats.st_size, stats.st_mtime_ns, inode, hash_id)
+
+def get_media_files(folder, incremental=None):
     folder_path = Path(folder)
     if not folder_path.exists() or not folder_path.is_dir():
         yield f"data: {json.dumps({'status': 'error', 'message': 'Pasta inválida ou não encontrada'})}\n\n"
         return
+    if incremental is None:
+        incremental = Config.SCAN_INCREMENTAL
 
-    files_to_process = [file for file in folder_path.rglob('*') if file.is_file() and file.suffix.lower() in ['.mp4', '.mkv', '.mov', '.divx', '.webm', '.mpg', '.avi']]
+    entries = list(iter_media_entries(folder_path))
+    files_to_process = [Path(path) for path, _, _ in entries]
     if not files_to_process:
         yield f"data: {json.dumps({'status': 'end', 'total': 0, 'message': 'Nenhum arquivo de mídia encontrado'})}\n\n"
         return
+    file_stats = {path: (stats, inode) for path, stats, inode in entries}
 
     with DB_POOL.get_connection() as conn:
         with conn.cursor() as cur:
             # Obter arquivos atualmente indexados para a pasta
-            cur.execute("SELECT file_path FROM endoflix_files WHERE file_path LIKE %s", (f"{str(folder_path)}%",))
+            cur.execute("SELECT file_path FROM endoflix_files WHERE file_path LIKE %s ESCAPE '\\'", (folder_like_pattern(folder_path),))
             db_files = {row[0] for row in cur.fetchall()}
 
         current_files = {str(file) for file in files_to_process}
-        # Arquivos para remover do DB (não estão mais na pasta)
+        # Arquivos para remover do DB (não estão mais na pasta). A remoção acontece
+        # depois do pipeline para que arquivos movidos sejam reconhecidos pelo hash.
         files_to_remove = db_files - current_files
-        if files_to_remove:
-            with conn.cursor() as cur:
-                cur.execute("DELETE FROM endoflix_files WHERE file_path IN %s", (tuple(files_to_remove),))
-                conn.commit()
+
+        manifest = {}
+        if incremental:
+            try:
+                manifest = load_scan_manifest(conn, folder_path)
+                stale = [path for path in manifest if path not in current_files]
+                if stale:
+                    with conn.cursor() as cur:
+                        cur.execute("DELETE FROM endoflix_scan_manifest WHERE file_path = ANY(%s)", (stale,))
+                    conn.commit()
+            except Exception as e:
+                conn.rollback()
+                manifest = {}
+                logging.warning(f"Manifesto de varredura indisponível, usando varredura completa: {e}")
+                incremental = False
 
         # Criar playlist temporária
         temp_playlist_name = f"temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
@@ -210,85 +397,32 @@ def get_media_files(folder):
             conn.commit()
 
         yield f"data: {json.dumps({'status': 'start', 'total': len(files_to_process), 'temp_playlist': temp_playlist_name})}\n\n"
-        new_files = []
+
+        ingestor = BatchIngestor(conn, temp_playlist_name)
+
+        # Arquivos inalterados desde a última varredura: sem leitura nem hash
+        pending = []
         for i, file in enumerate(files_to_process, 1):
-            try:
-                hash_id = calculate_hash(file)
-                stats = os.stat(file)
-                media_item = None
-                with conn.cursor() as cur:
-                    cur.execute(
-                        "SELECT file_path, duration_seconds, size_bytes, created_at, modified_at, video_codec, resolution, orientation, view_count, last_viewed_at, is_favorite FROM endoflix_files WHERE file_path = %s AND size_bytes = %s",
-                        (str(file), stats.st_size)
-                    )
-                    result = cur.fetchone()
-                if result:
-                    # Arquivo já indexado, usar dados do DB
-                    file_data = {
-                        "hash_id": hash_id,
-                        "file_path": result[0],
-                        "duration_seconds": result[1],
-                        "size_bytes": result[2],
-                        "created_at": result[3],
-                        "modified_at": result[4],
-                        "video_codec": result[5],
-                        "resolution": result[6],
-                        "orientation": result[7],
-                        "view_count": result[8],
-                        "last_viewed_at": result[9],
-                        "is_favorite": result[10]
-                    }
-                    media_item = {"path": file_data["file_path"], "duration": file_data["duration_seconds"], "size": file_data["size_bytes"], "modified": file_data["modified_at"].isoformat() if file_data["modified_at"] else None, "extension": Path(file_data["file_path"]).suffix.lower()[1:]}
-                    yield f"data: {json.dumps({'status': 'skipped', 'file': media_item, 'progress': i, 'total': len(files_to_process), 'message': 'Arquivo já indexado'})}\n\n"
-                else:
-                    # Verificar se é um arquivo movido (mesmo hash, outro caminho)
-                    with conn.cursor() as cur:
-                        cur.execute("SELECT file_path FROM endoflix_files WHERE hash_id = %s", (hash_id,))
-                        existing = cur.fetchone()
-                    if existing and existing[0] != str(file):
-                        with conn.cursor() as cur:
-                            cur.execute(
-                                "UPDATE endoflix_files SET file_path = %s, modified_at = %s WHERE hash_id = %s",
-                                (str(file), datetime.fromtimestamp(stats.st_mtime), hash_id)
-                            )
-                            conn.commit()
-                            cur.execute(
-                                "SELECT file_path, duration_seconds, size_bytes, created_at, modified_at, video_codec, resolution, orientation, view_count, last_viewed_at, is_favorite FROM endoflix_files WHERE file_path = %s",
-                                (str(file),)
-                            )
-                            result = cur.fetchone()
-                        if result:
-                            file_data = {
-                                "hash_id": hash_id,
-                                "file_path": result[0],
-                                "duration_seconds": result[1],
-                                "size_bytes": result[2],
-                                "created_at": result[3],
-                                "modified_at": result[4],
-                                "video_codec": result[5],
-                                "resolution": result[6],
-                                "orientation": result[7],
-                                "view_count": result[8],
-                                "last_viewed_at": result[9],
-                                "is_favorite": result[10]
-                            }
-                            media_item = {"path": file_data["file_path"], "duration": file_data["duration_seconds"]}
-                            yield f"data: {json.dumps({'status': 'skipped', 'file': media_item, 'progress': i, 'total': len(files_to_process), 'message': 'Arquivo movido e atualizado'})}\n\n"
-                    if not media_item:
-                        # Arquivo novo, processar
-                        new_files.append((i, file))
-                # Adicionar arquivo à playlist temporária
-                with conn.cursor() as cur:
-                    cur.execute(
-                        "UPDATE endoflix_playlist SET files = array_append(files, %s) WHERE name = %s",
-                        (str(file), temp_playlist_name)
-                    )
-                    conn.commit()
-            except Exception as e:
-                logging.error(f"Erro ao processar {file}: {e}")
-                yield f"data: {json.dumps({'status': 'error', 'file': str(file), 'message': str(e)})}\n\n"
-        # Now process new files in batches
-        if new_files:
-            for result in process_files_batch(new_files, conn, temp_playlist_name, len(files_to_process)):
-                yield result
+            stats, inode = file_stats[str(file)]
+            row = manifest.get(str(file))
+            if row and row[1] == stats.st_size and row[2] == stats.st_mtime_ns and row[3] == inode:
+                ingestor.add_existing(str(file), order=i)
+                media_item = {"path": row[0], "duration": row[5], "size": row[6], "modified": row[7].isoformat() if row[7] else None, "extension": file.suffix.lower()[1:]}
+                yield f"data: {json.dumps({'status': 'skipped', 'file': media_item, 'progress': i, 'total': len(files_to_process), 'message': 'Arquivo inalterado'})}\n\n"
+            else:
+                pending.append((i, file))
+
+        ingestor.flush()
+        for event in _ingest_error_events(ingestor):
+            yield event
+        # Arquivos novos ou alterados: cada um é lido (hash) e analisado (ffprobe) uma única vez
+        for event in run_scan_pipeline(conn, pending, ingestor, file_stats, len(files_to_process)):
+            yield event
+        if files_to_remove:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM endoflix_files WHERE file_path IN %s", (tuple(files_to_remove),))
+                conn.commit()
+            METADATA_SERVICE.forget(files_to_remove)
+        if ingestor.total_rows:
+            logging.info(f"Ingestão: {ingestor.total_rows} arquivos gravados ({ingestor.rows_per_second:.0f} linhas/s)")
         yield f"data: {json.dumps({'status': 'end', 'total': len(files_to_process), 'temp_playlist': temp_playlist_name})}\n\n"
\ No newline at end of file
@@ -0,0 +1,257 @@
+import os
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import redis
+from cachetools import TTLCache
+from psycopg2.extras import execute_values
+from config import Config
+from db import Database
+from cache import RedisCache
+from utils import process_file, index_file
+
+# pg_advisory lock key: only one process maintains the view-event partitions at a time
+VIEW_MAINTENANCE_LOCK = 0x76696577  # 'view'
+
+# Appends the buffered events and folds them into the hourly and daily rollups.
+# Events of files that are not indexed are dropped by the join.
+INSERT_EVENTS_SQL = """
+    WITH v AS (
+        SELECT * FROM unnest(%s::text[], %s::text[], %s::smallint[], %s::timestamp[], %s::smallint[], %s::real[])
+            AS v(file_path, session_id, player_slot, started_at, views, watched_seconds)
+    ), ev AS (
+        INSERT INTO endoflix_view_events (file_id, session_id, player_slot, started_at, views, watched_seconds)
+        SELECT f.id, v.session_id, v.player_slot, v.started_at, v.views, v.watched_seconds
+        FROM v JOIN endoflix_files f ON f.file_path = v.file_path
+        RETURNING file_id, player_slot, started_at, views, watched_seconds
+    ), hourly AS (
+        INSERT INTO endoflix_view_hourly (bucket, file_id, views, watched_seconds)
+        SELECT date_trunc('hour', started_at), file_id, SUM(views), SUM(watched_seconds)
+        FROM ev GROUP BY 1, 2 ORDER BY 1, 2
+        ON CONFLICT (bucket, file_id) DO UPDATE SET
+            views = endoflix_view_hourly.views + EXCLUDED.views,
+            watched_seconds = endoflix_view_hourly.watched_seconds + EXCLUDED.watched_seconds
+    )
+    INSERT INTO endoflix_view_daily (day, file_id, player_slot, views, watched_seconds)
+    SELECT started_at::date, file_id, COALESCE(player_slot, 0), SUM(views), SUM(watched_seconds)
+    FROM ev GROUP BY 1, 2, 3 ORDER BY 1, 2, 3
+    ON CONFLICT (day, file_id, player_slot) DO UPDATE SET
+        views = endoflix_view_daily.views + EXCLUDED.views,
+        watched_seconds = endoflix_view_daily.watched_seconds + EXCLUDED.watched_seconds
+"""
+
+class ViewRecorder:
+    """Counts one view per playback and writes view counts to Postgres in batches.
+
+    A browser issues dozens of range requests per playback; only the first
+    request of a (playback, file) pair inside VIEW_DEDUP_WINDOW is counted.
+    Increments are buffered in memory and flushed by a background thread with
+    a single UPDATE ... FROM (VALUES ...) per interval.
+
+    Each counted view and each progress report from the player is also kept
+    as a playback event and appended to the partitioned endoflix_view_events
+    table, together with its hourly/daily rollups, in one statement per flush.
+    The flusher thread also creates the coming days' partitions (first flush,
+    then every VIEW_PARTITION_MAINTENANCE_INTERVAL seconds), so inserts never
+    depend on anyone opening the analytics pages.
+    """
+
+    def __init__(self, db: Database, cache: RedisCache):
+        self.db = db
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._pending: Dict[str, List] = {}  # file_path -> [delta, last_viewed_at]
+        self._events: List[Tuple] = []  # (file_path, session_id, player_slot, started_at, views, watched_seconds)
+        self._seen = TTLCache(maxsize=Config.VIEW_DEDUP_MAX_SIZE, ttl=Config.VIEW_DEDUP_WINDOW)
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._next_maintenance = 0.0
+        atexit.register(self.shutdown)
+
+    def record(self, file_path: str, playback_id: str) -> bool:
+        """Register a request for file_path. Returns True if it counted as a new view."""
+        key = f"view:seen:{playback_id}:{file_path}"
+        if key in self._seen:
+            return False
+        self._seen[key] = True
+        try:
+            # Deduplicação entre workers do gunicorn
+            if not self.cache.add(key, '1', ttl=Config.VIEW_DEDUP_WINDOW):
+                return False
+        except redis.RedisError:
+            pass  # Sem Redis, a deduplicação fica restrita a este processo
+
+        self._count(file_path, playback_id)
+        return True
+
+    async def record_async(self, file_path: str, playback_id: str, client) -> bool:
+        """record() for asyncio servers: the cross-worker check uses `client`, a redis.asyncio.Redis."""
+        key = f"view:seen:{playback_id}:{file_path}"
+        if key in self._seen:
+            return False
+        self._seen[key] = True
+        try:
+            if not await client.set(key, '1', nx=True, ex=Config.VIEW_DEDUP_WINDOW):
+                return False
+        except redis.RedisError:
+            pass
+        self._count(file_path, playback_id)
+        return True
+
+    def _count(self, file_path: str, playback_id: str):
+        now = datetime.now()
+        with self._lock:
+            entry = self._pending.setdefault(file_path, [0, None])
+            entry[0] += 1
+            entry[1] = now
+            self._add_events([(file_path, playback_id, None, now, 1, 0.0)])
+        self._ensure_flusher()
+
+    def progress(self, file_path: str, session_id: str, player_slot: Optional[int], watched_seconds: float):
+        """Register seconds watched since the player's previous report."""
+        with self._lock:
+            self._add_events([(file_path, session_id, player_slot, datetime.now(), 0, float(watched_seconds))])
+        self._ensure_flusher()
+
+    def _add_events(self, events: List[Tuple], front: bool = False):
+        # Chamado com self._lock. Se o banco ficar fora por muito tempo, descarta os eventos mais antigos
+        self._events = events + self._events if front else self._events + events
+        overflow = len(self._events) - Config.VIEW_EVENT_BUFFER_MAX
+        if overflow > 0:
+            logging.warning(f"Buffer de eventos de reprodução cheio; {overflow} eventos descartados")
+            del self._events[:overflow]
+
+    def pending_events(self) -> List[Tuple]:
+        with self._lock:
+            return list(self._events)
+
+    def pending(self) -> Dict[str, Tuple[int, datetime]]:
+        with self._lock:
+            return {path: (delta, ts) for path, (delta, ts) in self._pending.items()}
+
+    def flush(self) -> int:
+        """Write buffered increments, then buffered events. Returns the number of files updated."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        updated = self._flush_counts(batch) if batch else 0
+        self._flush_events()
+        return updated
+
+    def maintain_partitions(self) -> bool:
+        """Create the coming days' endoflix_view_events partitions and apply the retention periods.
+
+        Returns False when another process holds the maintenance lock or it failed."""
+        with self.db.get_connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (VIEW_MAINTENANCE_LOCK,))
+                    if not cur.fetchone()[0]:
+                        conn.rollback()
+                        return False
+                    cur.execute("SELECT maintain_view_events(%s, %s, %s, %s)", (
+                        Config.VIEW_EVENT_RETENTION_DAYS, Config.VIEW_HOURLY_RETENTION_DAYS,
+                        Config.VIEW_DAILY_RETENTION_DAYS, Config.VIEW_PARTITIONS_AHEAD_DAYS
+                    ))
+                conn.commit()
+                return True
+            except Exception as e:
+                conn.rollback()
+                logging.error(f"Erro na manutenção das partições de eventos de reprodução: {e}")
+                return False
+
+    def _maybe_maintain(self):
+        if time.monotonic() < self._next_maintenance:
+            return
+        self._next_maintenance = time.monotonic() + Config.VIEW_PARTITION_MAINTENANCE_INTERVAL
+        try:
+            self.maintain_partitions()
+        except Exception as e:
+            logging.error(f"Erro na manutenção das partições de eventos de reprodução: {e}")
+
+    def _flush_events(self):
+        with self._lock:
+            events, self._events = self._events, []
+        if not events:
+            return
+        try:
+            with self.db.get_connection() as conn:
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute(INSERT_EVENTS_SQL, [list(column) for column in zip(*events)])
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+        except Exception as e:
+            logging.error(f"Erro ao gravar eventos de reprodução: {e}")
+            with self._lock:
+                self._add_events(events, front=True)
+
+    def _flush_counts(self, batch: Dict[str, List]) -> int:
+        rows = [(path, delta, ts) for path, (delta, ts) in batch.items()]
+        try:
+            with self.db.get_connection() as conn:
+                with conn.cursor() as cur:
+                    updated = execute_values(cur, """
+                        UPDATE endoflix_files AS f
+                        SET view_count = f.view_count + v.delta,
+                            last_viewed_at = GREATEST(f.last_viewed_at, v.last_viewed_at)
+                        FROM (VALUES %s) AS v(file_path, delta, last_viewed_at)
+                        WHERE f.file_path = v.file_path
+                        RETURNING f.file_path
+                    """, rows, template="(%s, %s::integer, %s::timestamp)", fetch=True)
+                    conn.commit()
+                    found = {row[0] for row in updated}
+                # Arquivos reproduzidos antes de serem indexados
+                for path, delta, ts in rows:
+                    if path not in found:
+                        self._index_with_views(conn, path, delta, ts)
+            return len(rows)
+        except Exception as e:
+            logging.error(f"Erro ao gravar visualizações em lote: {e}")
+            self._requeue(batch)
+            return 0
+
+    def _index_with_views(self, conn, path: str, delta: int, ts: datetime):
+        if not os.path.exists(path):
+            return
+        try:
+            file_data = process_file(path)
+            file_data["view_count"] = delta
+            file_data["last_viewed_at"] = ts
+            index_file(conn, file_data)
+        except Exception as e:
+            logging.error(f"Erro ao indexar {path} durante gravação de visualizações: {e}")
+
+    def _requeue(self, batch: Dict[str, List]):
+        with self._lock:
+            for path, (delta, ts) in batch.items():
+                entry = self._pending.setdefault(path, [0, ts])
+                entry[0] += delta
+                entry[1] = max(entry[1] or ts, ts)
+
+    def _ensure_flusher(self):
+        # Inicia a thread sob demanda e após fork (workers do gunicorn)
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._flush_loop, name='view-recorder', daemon=True)
+            self._thread.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(Config.VIEW_FLUSH_INTERVAL):
+            # Antes dos eventos: as partições dos próximos dias precisam existir
+            self._maybe_maintain()
+            self.flush()
+
+    def shutdown(self):
+        self._stop.set()
+        self.flush()
@@ -0,0 +1,77 @@
+import os
+import atexit
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, Iterator, Tuple, Any, Union
+from config import Config
+
+_pools: Dict[str, Tuple[Any, int]] = {}  # name -> (executor, pid)
+_lock = threading.Lock()
+
+def get_pool(name: str = 'media', max_workers: int = None, kind: str = 'process'):
+    """Return the long-lived executor `name`, creating it on first use.
+
+    Pools survive across scan batches and requests so worker processes (and
+    their db/redis/config imports) are paid for once. A pool inherited from a
+    parent process through fork, or one broken by a crashed worker, is
+    replaced transparently.
+    """
+    with _lock:
+        entry = _pools.get(name)
+        if entry:
+            executor, pid = entry
+            broken = getattr(executor, '_broken', False)
+            if pid == os.getpid() and not broken:
+                return executor
+            if pid == os.getpid():
+                executor.shutdown(wait=False, cancel_futures=True)
+        workers = max_workers or Config.MAX_WORKERS
+        if kind == 'process':
+            executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'{name}-worker')
+        _pools[name] = (executor, os.getpid())
+        logging.info(f"Pool de workers '{name}' criado ({kind}, {workers} workers)")
+        return executor
+
+def imap_unordered(executor, fn: Callable, items: Iterable, max_in_flight: Union[int, Callable[[], int]] = None) -> Iterator[Tuple[Any, Future]]:
+    """Submit fn(item) keeping at most max_in_flight tasks queued, yielding (item, future) as each completes.
+
+    Results arrive in completion order, so one slow task does not hold back
+    the others. Closing the generator early cancels tasks not yet started.
+    """
+    items = iter(items)
+    limit = max_in_flight if callable(max_in_flight) else (lambda: max_in_flight or Config.MAX_WORKERS * 2)
+    in_flight: Dict[Future, Any] = {}
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(in_flight) < max(1, limit()):
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                in_flight[executor.submit(fn, item)] = item
+            if not in_flight:
+                return
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield in_flight.pop(future), future
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+def shutdown_pools(wait: bool = True):
+    with _lock:
+        for name, (executor, pid) in list(_pools.items()):
+            if pid != os.getpid():
+                continue
+            try:
+                executor.shutdown(wait=wait, cancel_futures=True)
+            except Exception as e:
+                logging.error(f"Erro ao encerrar pool '{name}': {e}")
+        _pools.clear()
+
+atexit.register(shutdown_pools)